@@ -0,0 +1,312 @@
+"""
+Conversation Checkpoints for the LangGraph Agents
+
+/api/agent/chat used to rebuild an authenticated conversation's context on
+every turn: SELECT the last messages, hydrate ORM rows, convert them to
+LangChain messages. The checkpointer keeps that per-conversation message
+state locally instead, keyed by conversation_key():
+- hot tier: per-worker LRU of recent conversations (already LangChain objects)
+- SQLite tier: one row per message, shared by every gunicorn worker on the
+  host; each turn appends only its delta (the new user/assistant pair)
+
+A conversation another worker has advanced is caught up by reading just the
+rows past the last sequence number this worker has seen. Conversations with
+no checkpoint yet (older ones, or after the file is removed) are seeded once
+from the SQL history.
+
+SQL stays the source of truth. Each checkpoint records the conversation's
+updated_at it is in sync with (its version); when the row has changed since
+(messages added through the chat API, edits), load() reports a miss and the
+caller reseeds, which replaces the checkpoint. A turn is only appended to a
+checkpoint still at the version the caller loaded. Deleted conversations are
+dropped with forget().
+
+The key combines the conversation's id with its owner and creation time in
+the application database. Ids restart when that database is recreated or
+restored; the new row then gets a different key and never picks up an old
+conversation's checkpoint.
+
+Environment Variables:
+- AGENT_CHECKPOINTS_ENABLED: Set to false to read history from SQL every turn (default: true)
+- AGENT_CHECKPOINT_PATH: SQLite file (default: codecalm-agent-checkpoints.sqlite3 in the temp dir)
+- AGENT_CHECKPOINT_HOT_CONVERSATIONS: Conversations kept in memory per worker (default: 256)
+- AGENT_CHECKPOINT_MAX_MESSAGES: Messages kept per conversation (default: 40)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict, messages_from_dict
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_key(conversation):
+    """Checkpoint key for a Conversation row: id, owner and creation time"""
+    created = conversation.created_at.isoformat() if conversation.created_at else ''
+    return f"{conversation.user_id}:{conversation.id}:{created}"
+
+
+def conversation_version(conversation):
+    """Version a checkpoint must match: the row's last update in SQL"""
+    return conversation.updated_at.isoformat() if conversation.updated_at else ''
+
+
+class ConversationCheckpointer:
+    """Two-tier (memory LRU + SQLite) store of agent message state per conversation"""
+
+    def __init__(self, path, hot_conversations=256, max_messages=40, enabled=True):
+        self.path = path
+        self.hot_conversations = hot_conversations
+        self.max_messages = max_messages
+        self.enabled = enabled
+
+        # conversation_key() -> (generation, last_seq, [messages]); the generation
+        # changes whenever a checkpoint is replaced, so stale copies are never extended
+        self._hot = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {'hot_hits': 0, 'caught_up': 0, 'disk_loads': 0, 'misses': 0,
+                          'stale': 0, 'seeded': 0, 'appended_messages': 0, 'forgotten': 0}
+
+        if self.enabled:
+            self._init_sqlite()
+
+    def load(self, key, version, limit=10):
+        """
+        The conversation's most recent messages
+
+        Args:
+            key: conversation_key()
+            version: conversation_version() of the row as just read from SQL
+
+        Returns:
+            list of LangChain messages, or None when there is no checkpoint at
+            this version (the caller seeds one from SQL)
+        """
+        if not self.enabled:
+            return None
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT generation, version FROM conversation_checkpoints WHERE conversation_key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] != version:
+                self._count('misses' if row is None else 'stale')
+                return None
+            generation = row[0]
+            (last_seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM conversation_messages WHERE conversation_key = ?", (key,)
+            ).fetchone()
+            with self._lock:
+                entry = self._hot.get(key)
+            if entry is not None and entry[0] != generation:
+                entry = None
+            if entry is not None and entry[1] == last_seq:
+                self._count('hot_hits')
+                messages = entry[2]
+            elif entry is not None and entry[1] < last_seq:
+                # Another worker appended turns: fetch only those
+                rows = conn.execute(
+                    "SELECT message FROM conversation_messages WHERE conversation_key = ? AND seq > ? ORDER BY seq",
+                    (key, entry[1])
+                ).fetchall()
+                self._count('caught_up')
+                messages = self._remember(key, generation, last_seq, entry[2] + self._decode(rows))
+            else:
+                rows = conn.execute(
+                    "SELECT message FROM conversation_messages WHERE conversation_key = ? ORDER BY seq DESC LIMIT ?",
+                    (key, self.max_messages)
+                ).fetchall()
+                self._count('disk_loads')
+                messages = self._remember(key, generation, last_seq, self._decode(reversed(rows)))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Agent checkpoint read failed: {e}")
+            return None
+        return list(messages[-limit:]) if limit else list(messages)
+
+    def seed(self, key, messages, version):
+        """Replace a conversation's checkpoint with history loaded from SQL at version"""
+        if self.enabled:
+            self._write(key, list(messages), version, replace=True)
+            self._count('seeded')
+
+    def append_turn(self, key, user_message, assistant_message, version, previous_version=None):
+        """
+        Record one finished exchange (the only thing written per turn)
+
+        Args:
+            version: conversation_version() after the turn was saved to SQL
+            previous_version: Version the turn's context was loaded at (None for a
+                conversation created by this turn). If the checkpoint has moved
+                on since, it is dropped and the next load reseeds from SQL.
+        """
+        if self.enabled:
+            self._write(key, [
+                HumanMessage(content=user_message),
+                AIMessage(content=assistant_message)
+            ], version, expected_version=previous_version)
+
+    def forget(self, key):
+        """Drop a conversation's checkpoint (e.g. after it is deleted)"""
+        if not self.enabled:
+            return
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._delete(conn, key)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Agent checkpoint delete failed: {e}")
+        with self._lock:
+            self._hot.pop(key, None)
+        self._count('forgotten')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hot_conversations': len(self._hot),
+                **self._counters
+            }
+
+    # -------------------------------------------------------------------------
+    # Storage
+    # -------------------------------------------------------------------------
+
+    def _write(self, key, messages, version, replace=False, expected_version=None):
+        """
+        Append messages to a checkpoint (or replace it) and stamp it with version
+
+        Appends only extend a checkpoint at expected_version; one created by
+        this call needs expected_version None and no checkpoint on disk.
+        """
+        try:
+            conn = self._connection()
+            # Take the write lock before reading the checkpoint: concurrent writes
+            # from other workers wait (busy timeout) instead of colliding on seq
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT generation, version FROM conversation_checkpoints WHERE conversation_key = ?", (key,)
+                ).fetchone()
+                if not replace and (row[1] if row else None) != expected_version:
+                    # SQL moved on without this checkpoint: let the next load reseed
+                    self._delete(conn, key)
+                    conn.execute("COMMIT")
+                    with self._lock:
+                        self._hot.pop(key, None)
+                    return
+                if replace:
+                    generation = (row[0] if row else 0) + 1
+                    self._delete(conn, key)
+                    last_seq = 0
+                else:
+                    generation = row[0] if row else 1
+                    (last_seq,) = conn.execute(
+                        "SELECT COALESCE(MAX(seq), 0) FROM conversation_messages WHERE conversation_key = ?", (key,)
+                    ).fetchone()
+                now = time.time()
+                conn.executemany(
+                    "INSERT INTO conversation_messages (conversation_key, seq, message, created_at) VALUES (?, ?, ?, ?)",
+                    [(key, last_seq + i + 1, json.dumps(message_to_dict(m)), now) for i, m in enumerate(messages)]
+                )
+                new_seq = last_seq + len(messages)
+                conn.execute(
+                    "DELETE FROM conversation_messages WHERE conversation_key = ? AND seq <= ?",
+                    (key, new_seq - self.max_messages)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversation_checkpoints (conversation_key, generation, version) VALUES (?, ?, ?)",
+                    (key, generation, version)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Agent checkpoint write failed: {e}")
+            with self._lock:
+                self._hot.pop(key, None)
+            return
+        with self._lock:
+            entry = self._hot.get(key)
+        # Extend the hot copy only if it was current; otherwise the next load catches up
+        if entry is not None and entry[0] == generation and entry[1] == last_seq:
+            self._remember(key, generation, new_seq, entry[2] + messages)
+        elif last_seq == 0:
+            self._remember(key, generation, new_seq, messages)
+        self._count('appended_messages', len(messages))
+
+    @staticmethod
+    def _delete(conn, key):
+        conn.execute("DELETE FROM conversation_messages WHERE conversation_key = ?", (key,))
+        conn.execute("DELETE FROM conversation_checkpoints WHERE conversation_key = ?", (key,))
+
+    def _remember(self, key, generation, seq, messages):
+        messages = messages[-self.max_messages:]
+        with self._lock:
+            self._hot[key] = (generation, seq, messages)
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_conversations:
+                self._hot.popitem(last=False)
+        return messages
+
+    @staticmethod
+    def _decode(rows):
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def _connection(self):
+        """One autocommit SQLite connection per thread (and per process after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_sqlite(self):
+        try:
+            conn = self._connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_messages ("
+                " conversation_key TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " message TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (conversation_key, seq))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_checkpoints ("
+                " conversation_key TEXT PRIMARY KEY,"
+                " generation INTEGER NOT NULL,"
+                " version TEXT NOT NULL)"
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Agent checkpoints disabled: {e}")
+            self.enabled = False
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+
+def checkpointer_from_env():
+    """Build the checkpointer from AGENT_CHECKPOINT* environment variables"""
+    return ConversationCheckpointer(
+        path=os.getenv('AGENT_CHECKPOINT_PATH') or os.path.join(tempfile.gettempdir(), 'codecalm-agent-checkpoints.sqlite3'),
+        hot_conversations=int(os.getenv('AGENT_CHECKPOINT_HOT_CONVERSATIONS', '256')),
+        max_messages=int(os.getenv('AGENT_CHECKPOINT_MAX_MESSAGES', '40')),
+        enabled=os.getenv('AGENT_CHECKPOINTS_ENABLED', 'true').lower() != 'false'
+    )
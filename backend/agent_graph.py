@@ -5,14 +5,26 @@ Implements multi-agent workflow with specialized agents for different user types
 
 from langgraph.graph import StateGraph, END
 from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from typing import TypedDict, Annotated, Literal
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, SystemMessage
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from typing import TypedDict, Annotated, Literal, Optional
+from functools import partial
 import operator
 import os
+import time
+import threading
 import logging
 
+import httpx
+
+import llm_providers
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = "llama-3.3-70b-versatile"
+AGENT_TYPES = ("student", "parent", "professional", "fitness", "weather_food", "zen")
+
 # =============================================================================
 # STATE DEFINITION
 # =============================================================================
@@ -87,17 +99,201 @@ Keep responses calm, gentle, and concise (2-3 sentences)."""
 # AGENT NODES
 # =============================================================================
 
-def create_llm(temperature=0.7):
-    """Create ChatGroq instance"""
-    groq_api_key = os.getenv('GROQ_API_KEY')
-    if not groq_api_key:
-        raise ValueError("GROQ_API_KEY not found in environment")
-    
-    return ChatGroq(
-        api_key=groq_api_key,
-        model="llama-3.3-70b-versatile",
-        temperature=temperature
-    )
+_ROLE_BY_MESSAGE_TYPE = {'human': 'user', 'ai': 'assistant', 'system': 'system'}
+
+
+class ProviderChatModel(BaseChatModel):
+    """Chat model backed by llm_providers so graph nodes follow LLM_PROVIDER=stub|ollama"""
+
+    temperature: float = 0.7
+    max_tokens: int = 500
+
+    @property
+    def _llm_type(self) -> str:
+        return f"codecalm-{llm_providers.get_provider().name}"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        completion = llm_providers.get_provider().complete(
+            _provider_messages(messages),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        if not completion.ok:
+            raise RuntimeError(f"{llm_providers.get_provider().name} LLM error: {completion.status_code}")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=completion.text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        """Token stream, used when the graph runs with stream_mode "messages"."""
+        completion = llm_providers.get_provider().stream(
+            _provider_messages(messages),
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        if not completion.ok:
+            raise RuntimeError(f"{llm_providers.get_provider().name} LLM error: {completion.status_code}")
+        for token in completion.tokens:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class GuardedChatModel(BaseChatModel):
+    """
+    Chat model backed by the app's guarded LLM calls (see use_llm_calls)
+
+    Each call goes through the same circuit breaker, rate limiter, request
+    deadline and token accounting as the rest of the app. A call the guard
+    refuses or that fails comes back empty and is raised, so the node serves
+    its fallback reply.
+    """
+
+    temperature: float = 0.7
+    max_tokens: int = 500
+    model: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "codecalm-guarded"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        complete, _ = _llm_calls
+        text = complete(_provider_messages(messages), temperature=self.temperature,
+                        max_tokens=self.max_tokens, model=self.model)
+        if text is None:
+            raise RuntimeError("LLM call unavailable (breaker open, rate limited, out of time or upstream error)")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        """Token stream, used when the graph runs with stream_mode "messages"."""
+        _, stream = _llm_calls
+        streamed = False
+        for token in stream(_provider_messages(messages), temperature=self.temperature,
+                            max_tokens=self.max_tokens, model=self.model):
+            streamed = True
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        if not streamed:
+            raise RuntimeError("LLM stream unavailable (breaker open, rate limited, out of time or upstream error)")
+
+
+def _provider_messages(messages):
+    return [{"role": _ROLE_BY_MESSAGE_TYPE.get(m.type, 'user'), "content": m.content} for m in messages]
+
+
+# (complete, stream) installed by the app through use_llm_calls(); None means
+# nodes call ChatGroq / the provider directly (agent_graph used on its own)
+_llm_calls = None
+
+
+def use_llm_calls(complete, stream):
+    """
+    Route every agent LLM call through the app's guarded calls
+
+    Args:
+        complete: complete(messages, temperature=, max_tokens=, model=) -> text or None
+        stream: stream(messages, temperature=, max_tokens=, model=) -> iterator of tokens
+    """
+    global _llm_calls
+    _llm_calls = (complete, stream)
+    chat_models.reset()
+
+
+class ChatModelRegistry:
+    """
+    Long-lived chat models keyed by (model, temperature, max_tokens)
+
+    Building a ChatGroq per node execution meant a new Groq SDK client, and
+    a new connection pool with a fresh TLS handshake, on every agent turn.
+    The registry hands out one model per configuration, and every ChatGroq
+    shares one keep-alive httpx.Client. Both are thread-safe. Forked workers
+    drop the parent's models and sockets and build their own.
+
+    Once the app has installed its guarded calls (use_llm_calls), the
+    registry hands out GuardedChatModels instead, whatever the provider.
+    """
+
+    def __init__(self, pool_maxsize=int(os.getenv('HTTP_POOL_MAXSIZE', '8'))):
+        self.pool_maxsize = pool_maxsize
+        self._models = {}
+        self._http_client = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats = {'created': 0, 'reused': 0}
+
+    def get(self, model=None, temperature=0.7, max_tokens=None):
+        if self._pid != os.getpid():
+            self.reset()
+        provider = llm_providers.get_provider().name
+        key = (provider, model or DEFAULT_MODEL, temperature, max_tokens)
+        llm = self._models.get(key)
+        if llm is not None:
+            self._stats['reused'] += 1
+            return llm
+        with self._lock:
+            llm = self._models.get(key)
+            if llm is None:
+                llm = self._build(provider, *key[1:])
+                self._models[key] = llm
+                self._stats['created'] += 1
+                logger.info(f"🔌 Chat model ready: {provider} {key[1]} (temperature {temperature})")
+            else:
+                self._stats['reused'] += 1
+        return llm
+
+    def reset(self):
+        """Forget every model and the shared pool (sockets are abandoned, not closed)"""
+        self._lock = threading.Lock()
+        self._models = {}
+        self._http_client = None
+        self._pid = os.getpid()
+
+    def stats(self):
+        return {'models': len(self._models), **self._stats}
+
+    def _build(self, provider, model, temperature, max_tokens):
+        if _llm_calls is not None:
+            # Only Groq serves the named models; other providers use their own
+            return GuardedChatModel(temperature=temperature, max_tokens=max_tokens or 500,
+                                    model=model if provider == 'groq' else None)
+
+        if provider != 'groq':
+            if max_tokens is None:
+                return ProviderChatModel(temperature=temperature)
+            return ProviderChatModel(temperature=temperature, max_tokens=max_tokens)
+
+        groq_api_key = os.getenv('GROQ_API_KEY')
+        if not groq_api_key:
+            raise ValueError("GROQ_API_KEY not found in environment")
+
+        if self._http_client is None:
+            self._http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.pool_maxsize * 4,
+                    max_keepalive_connections=self.pool_maxsize
+                ),
+                timeout=httpx.Timeout(60.0, connect=5.0)
+            )
+        return ChatGroq(
+            api_key=groq_api_key,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            http_client=self._http_client
+        )
+
+
+chat_models = ChatModelRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=chat_models.reset)
+
+
+def create_llm(temperature=0.7, model=None, max_tokens=None):
+    """Shared ChatGroq instance (or a provider-backed model when LLM_PROVIDER isn't groq)"""
+    return chat_models.get(model=model, temperature=temperature, max_tokens=max_tokens)
 
 
 def router_node(state: AgentState) -> AgentState:
@@ -106,10 +302,8 @@ def router_node(state: AgentState) -> AgentState:
     
     logger.info(f"🔀 Routing to {user_type} agent")
     
-    # Set next action to the appropriate agent
-    state["next_action"] = user_type
-    
-    return state
+    # Return only the update: the messages reducer would re-append a full state's history
+    return {"next_action": user_type}
 
 
 def student_agent_node(state: AgentState) -> AgentState:
@@ -142,13 +336,13 @@ def zen_agent_node(state: AgentState) -> AgentState:
     return _process_with_agent(state, "zen")
 
 
-def _process_with_agent(state: AgentState, agent_type: str) -> AgentState:
+def _process_with_agent(state: AgentState, agent_type: str, model: str = None) -> AgentState:
     """
     Core processing logic for specialized agents
     Uses LangChain's ChatGroq with agent-specific system prompts
     """
     try:
-        llm = create_llm()
+        llm = create_llm(model=model)
         
         # Get agent-specific system prompt
         system_prompt = AGENT_PROMPTS.get(agent_type, AGENT_PROMPTS["student"])
@@ -174,35 +368,52 @@ def _process_with_agent(state: AgentState, agent_type: str) -> AgentState:
         # Extract response content
         agent_response = response.content.strip()
         
-        # Update state
-        state["agent_response"] = agent_response
-        state["messages"] = [
-            HumanMessage(content=user_input),
-            AIMessage(content=agent_response)
-        ]
-        state["next_action"] = "end"
-        
         logger.info(f"✅ {agent_type.upper()} agent response generated")
         
-        return state
+        # State update: only this turn's delta is appended to messages
+        return {
+            "agent_response": agent_response,
+            "messages": [
+                HumanMessage(content=user_input),
+                AIMessage(content=agent_response)
+            ],
+            "next_action": "end"
+        }
         
     except Exception as e:
         logger.error(f"❌ Error in {agent_type} agent: {e}")
         
         # Fallback response
-        state["agent_response"] = "I'm here for you! Could you tell me more about what's on your mind? 💙"
-        state["next_action"] = "end"
-        
-        return state
+        return {
+            "agent_response": "I'm here for you! Could you tell me more about what's on your mind? 💙",
+            "next_action": "end"
+        }
 
 
 # =============================================================================
 # GRAPH CONSTRUCTION
 # =============================================================================
 
-def create_agent_graph() -> StateGraph:
+_AGENT_NODES = {
+    "student": student_agent_node,
+    "parent": parent_agent_node,
+    "professional": professional_agent_node,
+    "fitness": fitness_agent_node,
+    "weather_food": weather_food_agent_node,
+    "zen": zen_agent_node,
+}
+
+
+def create_agent_graph(model: str = None, agents: tuple = AGENT_TYPES) -> StateGraph:
     """
     Create and compile the LangGraph workflow for deep agents
+
+    Compiling is the expensive part; run_agent() goes through graph_cache
+    so each configuration is compiled once per process.
+
+    Args:
+        model: Groq model the agent nodes use (default: DEFAULT_MODEL)
+        agents: Agent types to include as nodes
     
     Returns:
         Compiled StateGraph ready for execution
@@ -213,12 +424,9 @@ def create_agent_graph() -> StateGraph:
     
     # Add nodes
     workflow.add_node("router", router_node)
-    workflow.add_node("student", student_agent_node)
-    workflow.add_node("parent", parent_agent_node)
-    workflow.add_node("professional", professional_agent_node)
-    workflow.add_node("fitness", fitness_agent_node)
-    workflow.add_node("weather_food", weather_food_agent_node)
-    workflow.add_node("zen", zen_agent_node)
+    for agent in agents:
+        node = _AGENT_NODES[agent]
+        workflow.add_node(agent, partial(_process_with_agent, agent_type=agent, model=model) if model else node)
     
     # Set entry point
     workflow.set_entry_point("router")
@@ -227,18 +435,11 @@ def create_agent_graph() -> StateGraph:
     workflow.add_conditional_edges(
         "router",
         lambda state: state["next_action"],
-        {
-            "student": "student",
-            "parent": "parent",
-            "professional": "professional",
-            "fitness": "fitness",
-            "weather_food": "weather_food",
-            "zen": "zen",
-        }
+        {agent: agent for agent in agents}
     )
     
     # All specialized agents end the workflow
-    for agent in ["student", "parent", "professional", "fitness", "weather_food", "zen"]:
+    for agent in agents:
         workflow.add_edge(agent, END)
     
     # Compile the graph
@@ -247,6 +448,65 @@ def create_agent_graph() -> StateGraph:
     return workflow.compile()
 
 
+class CompiledGraphCache:
+    """
+    Process-wide compiled graphs, one per configuration
+
+    A compiled graph holds no per-run state (there is no checkpointer), so
+    one instance is safely shared by every request and thread. builder is
+    called with the configuration as keyword arguments, which makes the
+    cache reusable for other graph factories (per model, per tool set...).
+    """
+
+    def __init__(self, builder=create_agent_graph, max_graphs=8):
+        self.builder = builder
+        self.max_graphs = max_graphs
+        self._graphs = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'compiles': 0, 'compile_ms': 0.0}
+
+    def get(self, **config):
+        """Compiled graph for config, compiling it on first use"""
+        key = tuple(sorted(config.items()))
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self._stats['hits'] += 1
+            return graph
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                started = time.monotonic()
+                graph = self.builder(**config)
+                if len(self._graphs) >= self.max_graphs:
+                    self._graphs.pop(next(iter(self._graphs)))
+                self._graphs[key] = graph
+                self._stats['compiles'] += 1
+                self._stats['compile_ms'] += (time.monotonic() - started) * 1000
+            else:
+                self._stats['hits'] += 1
+        return graph
+
+    def clear(self):
+        with self._lock:
+            self._graphs.clear()
+
+    def stats(self):
+        return {
+            'graphs': len(self._graphs),
+            'hits': self._stats['hits'],
+            'compiles': self._stats['compiles'],
+            'compile_ms': round(self._stats['compile_ms'], 1)
+        }
+
+
+graph_cache = CompiledGraphCache()
+
+
+def get_agent_graph(model: str = None):
+    """The shared compiled graph for model (default: DEFAULT_MODEL)"""
+    return graph_cache.get(model=model or DEFAULT_MODEL)
+
+
 # =============================================================================
 # AGENT EXECUTION
 # =============================================================================
@@ -255,7 +515,8 @@ def run_agent(
     user_input: str,
     user_type: str,
     conversation_history: list = None,
-    context: dict = None
+    context: dict = None,
+    model: str = None
 ) -> dict:
     """
     Execute the agent graph with user input
@@ -265,14 +526,15 @@ def run_agent(
         user_type: Type of agent (student, parent, professional, etc.)
         conversation_history: Previous messages in conversation
         context: Additional context (mood, preferences, etc.)
+        model: Groq model for the agent (default: DEFAULT_MODEL)
     
     Returns:
         dict with 'response' and 'metadata'
     """
     
     try:
-        # Create graph
-        graph = create_agent_graph()
+        # Compiled once per process and model, then reused
+        graph = get_agent_graph(model)
         
         # Prepare initial state
         initial_state = {
@@ -297,7 +559,7 @@ def run_agent(
             "response": response,
             "metadata": {
                 "agent_type": user_type,
-                "model": "llama-3.3-70b-versatile",
+                "model": model or DEFAULT_MODEL,
                 "framework": "langgraph"
             }
         }
@@ -312,6 +574,72 @@ def run_agent(
         }
 
 
+def stream_agent(
+    user_input: str,
+    user_type: str,
+    conversation_history: list = None,
+    context: dict = None,
+    model: str = None
+):
+    """
+    Execute the agent graph, yielding progress as it happens
+
+    Yields (event, payload) pairs:
+        ('node', {'node', 'status', ...}): a graph node finished (the router
+            reports which agent it picked)
+        ('token', {'token'}): a chunk of the agent's reply as the LLM generates it
+        ('result', dict): last item, shaped like run_agent()'s return value
+    """
+    try:
+        graph = get_agent_graph(model)
+        initial_state = {
+            "messages": conversation_history or [],
+            "user_type": user_type,
+            "user_input": user_input,
+            "agent_response": "",
+            "context": context or {},
+            "next_action": "",
+            "conversation_id": ""
+        }
+
+        logger.info(f"🚀 Streaming agent for user_type: {user_type}")
+        response = None
+        streamed = []
+        for mode, chunk in graph.stream(initial_state, stream_mode=["updates", "messages"]):
+            if mode == "messages":
+                message, metadata = chunk
+                # Node outputs are echoed as whole messages too; only live chunks are tokens
+                if isinstance(message, AIMessageChunk) and message.content:
+                    streamed.append(message.content)
+                    yield 'token', {'token': message.content, 'node': metadata.get('langgraph_node')}
+                continue
+            for node, update in chunk.items():
+                if node == "router":
+                    yield 'node', {'node': node, 'status': 'done', 'agent': (update or {}).get('next_action')}
+                else:
+                    response = (update or {}).get('agent_response', response)
+                    yield 'node', {'node': node, 'status': 'done'}
+
+        yield 'result', {
+            "success": True,
+            "response": response or ''.join(streamed).strip() or "I'm here to help! Tell me more.",
+            "metadata": {
+                "agent_type": user_type,
+                "model": model or DEFAULT_MODEL,
+                "framework": "langgraph",
+                "streamed": bool(streamed)
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"❌ Agent streaming failed: {e}")
+        yield 'result', {
+            "success": False,
+            "response": "I'm here for you! Could you tell me more? 💙",
+            "error": str(e)
+        }
+
+
 # =============================================================================
 # CONVENIENCE FUNCTIONS
 # =============================================================================
@@ -0,0 +1,167 @@
+"""
+Lazy Loader for the LangGraph Agent Stack
+
+agent_graph/agent_tools pull in langgraph, langchain_groq and langchain_core
+(plus pydantic models and the Groq SDK). That is a large share of a worker's
+boot time and resident memory, yet only /api/agent/chat uses them. The loader
+defers the imports and the graph compilation until the first agent request,
+or runs them in an optional warm-up, and records what the load cost:
+
+    agents = loader.load()       # None if the stack is unavailable
+    agents.graph_module.run_agent(...)
+    agents.tools.detect_mood_from_text(...)
+    agents.checkpoints.load(agents.checkpoint_key(conversation), agents.checkpoint_version(conversation))
+
+The app hands its guarded LLM calls to the loader (use_llm_calls), which
+installs them in agent_graph once the stack is loaded, so agent turns share
+the breaker, rate limiter, request deadline and token accounting.
+
+Warm-up modes (AGENT_WARMUP):
+- lazy: load on the first /api/agent/chat request (default)
+- background: load on a thread in each worker once it serves its first request
+- eager: load while main.py is imported (shared copy-on-write under
+  gunicorn --preload)
+
+Environment Variables:
+- AGENT_WARMUP: lazy | background | eager (default: lazy)
+"""
+
+import os
+import sys
+import time
+import importlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_LAZY = 'lazy'
+WARMUP_BACKGROUND = 'background'
+WARMUP_EAGER = 'eager'
+
+# Heavy third-party packages, timed separately in the import report
+STACK_MODULES = ('langchain_core.messages', 'langchain_groq', 'langgraph.graph')
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux; None elsewhere)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class AgentStack:
+    """The loaded agent modules, the graph compiled at load time and the conversation checkpointer"""
+
+    def __init__(self, graph_module, tools, graph, checkpoints, checkpoint_key, checkpoint_version):
+        self.graph_module = graph_module
+        self.tools = tools
+        self.graph = graph
+        self.checkpoints = checkpoints
+        self.checkpoint_key = checkpoint_key
+        self.checkpoint_version = checkpoint_version
+
+
+class AgentLoader:
+    """Import and compile the agent stack once per process, on demand"""
+
+    def __init__(self, warmup=WARMUP_LAZY):
+        self.warmup = warmup if warmup in (WARMUP_LAZY, WARMUP_BACKGROUND, WARMUP_EAGER) else WARMUP_LAZY
+        self._stack = None
+        self._error = None
+        self._report = None
+        self._lock = threading.Lock()
+        self._warm_pid = None
+        self._llm_calls = None
+
+    @property
+    def loaded(self):
+        return self._stack is not None
+
+    def load(self):
+        """The agent stack, importing it on first use; None if it failed to load"""
+        if self._stack is not None or self._error is not None:
+            return self._stack
+        with self._lock:
+            if self._stack is None and self._error is None:
+                self._load()
+        return self._stack
+
+    def use_llm_calls(self, complete, stream):
+        """Calls agent_graph's chat models go through (applied now if already loaded)"""
+        self._llm_calls = (complete, stream)
+        if self._stack is not None:
+            self._stack.graph_module.use_llm_calls(complete, stream)
+
+    def ensure_warm(self):
+        """Start this worker's background warm-up (AGENT_WARMUP=background); never blocks"""
+        if self.warmup != WARMUP_BACKGROUND or self._stack is not None or self._error is not None:
+            return
+        pid = os.getpid()
+        if self._warm_pid == pid:
+            return
+        self._warm_pid = pid
+        threading.Thread(target=self.load, name='agent-warmup', daemon=True).start()
+
+    def stats(self):
+        return {
+            'warmup': self.warmup,
+            'loaded': self.loaded,
+            'error': self._error,
+            'report': self._report,
+            'graph_cache': self._stack.graph_module.graph_cache.stats() if self._stack else None,
+            'chat_models': self._stack.graph_module.chat_models.stats() if self._stack else None,
+            'checkpoints': self._stack.checkpoints.stats() if self._stack else None
+        }
+
+    def _load(self):
+        trigger = 'first request' if self.warmup == WARMUP_LAZY else f'{self.warmup} warm-up'
+        started = time.monotonic()
+        rss_before = rss_mb()
+        imports = {}
+        try:
+            for name in STACK_MODULES + ('agent_tools', 'agent_graph', 'agent_checkpoints'):
+                already = name in sys.modules
+                t = time.monotonic()
+                importlib.import_module(name)
+                imports[name] = 0.0 if already else round((time.monotonic() - t) * 1000, 1)
+            graph_module = sys.modules['agent_graph']
+            tools = sys.modules['agent_tools']
+            checkpoint_module = sys.modules['agent_checkpoints']
+            checkpoints = checkpoint_module.checkpointer_from_env()
+            if self._llm_calls is not None:
+                graph_module.use_llm_calls(*self._llm_calls)
+
+            t = time.monotonic()
+            # Compiles the default graph into agent_graph.graph_cache, which run_agent reuses
+            graph = graph_module.get_agent_graph()
+            compile_ms = round((time.monotonic() - t) * 1000, 1)
+        except Exception as e:
+            self._error = str(e)
+            logger.warning(f"⚠️  LangGraph initialization failed: {e}")
+            return
+
+        rss_after = rss_mb()
+        self._report = {
+            'trigger': trigger,
+            'total_ms': round((time.monotonic() - started) * 1000, 1),
+            'import_ms': imports,
+            'compile_ms': compile_ms,
+            'rss_delta_mb': round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None
+        }
+        self._stack = AgentStack(graph_module, tools, graph, checkpoints,
+                                 checkpoint_module.conversation_key, checkpoint_module.conversation_version)
+        logger.info(
+            f"✅ LangGraph Deep Agents loaded on {trigger} in {self._report['total_ms']:.0f}ms "
+            f"(compile {compile_ms:.0f}ms, +{self._report['rss_delta_mb']}MB RSS)"
+        )
+
+
+def loader_from_env():
+    """Build the loader from AGENT_WARMUP, loading right away in eager mode"""
+    loader = AgentLoader(warmup=os.getenv('AGENT_WARMUP', WARMUP_LAZY).strip().lower())
+    if loader.warmup == WARMUP_EAGER:
+        loader.load()
+    return loader
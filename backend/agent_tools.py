@@ -27,17 +27,18 @@ def get_conversation_history(conversation_id: str, limit: int = 10) -> list:
     """
     try:
         messages = Message.query.filter_by(
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            deleted_at=None
         ).order_by(
-            Message.timestamp.desc()
+            Message.created_at.desc()
         ).limit(limit).all()
         
         # Convert to LangChain messages (reverse to chronological order)
         langchain_messages = []
         for msg in reversed(messages):
-            if msg.role == 'user':
+            if msg.sender == 'user':
                 langchain_messages.append(HumanMessage(content=msg.content))
-            elif msg.role == 'assistant':
+            elif msg.sender == 'assistant':
                 langchain_messages.append(AIMessage(content=msg.content))
         
         logger.info(f"📚 Retrieved {len(langchain_messages)} messages from conversation {conversation_id}")
@@ -65,10 +66,10 @@ def build_context_from_conversation(conversation_id: str) -> dict:
             return {}
         
         context = {
-            "agent_type": conversation.agent_type,
-            "started_at": conversation.started_at.isoformat() if conversation.started_at else None,
+            "agent_type": conversation.assistant_type,
+            "started_at": conversation.created_at.isoformat() if conversation.created_at else None,
             "message_count": len(conversation.messages),
-            "last_activity": conversation.last_activity.isoformat() if conversation.last_activity else None
+            "last_activity": conversation.updated_at.isoformat() if conversation.updated_at else None
         }
         
         return context
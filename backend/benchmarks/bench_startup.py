@@ -0,0 +1,164 @@
+"""
+Startup benchmark: how long main.py takes to become ready to serve
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--json results.json]
+                                       [--env AGENT_WARMUP=eager ...]
+
+Every run imports main.py in a fresh interpreter against the stub provider
+(LLM_PROVIDER=stub, no network) and a fresh SQLite database, then serves
+one /api/health request. Reported per run:
+- interpreter: python start-up before main.py is imported
+- boot phases from main.IMPORT_REPORT (dotenv, database, LangGraph,
+  providers, routes...)
+- first_request: the first /api/health round-trip (per-worker lazy work)
+- peak RSS of the process
+One extra run under `python -X importtime` lists main.py's slowest direct
+imports. --json writes all of it (plus medians) so CI can diff runs.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Everything external is stubbed or disabled so only local boot work is timed
+STUB_ENV = {
+    'LLM_PROVIDER': 'stub',
+    'CODETEST_AUTOSTART': 'false',
+    'OLLAMA_PRELOAD': 'false',
+    'HEALTH_PROBE_ENABLED': 'false',
+    'WORKOUT_CACHE_ENABLED': 'false',
+}
+
+CHILD = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.app.test_client().get('/api/health')
+t2 = time.perf_counter()
+print('BENCH_STARTUP ' + json.dumps({
+    'import_ms': round((t1 - t0) * 1000, 1),
+    'first_request_ms': round((t2 - t1) * 1000, 1),
+    'phases_ms': main.IMPORT_REPORT['phases_ms'],
+    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'langgraph_loaded': main.agent_runtime.loaded,
+}))
+"""
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+
+def child_env(workdir, overrides):
+    env = dict(os.environ)
+    env.update(STUB_ENV)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'codecalm.db')}",
+        'JOB_QUEUE_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'AGENT_CHECKPOINT_PATH': os.path.join(workdir, 'agent-checkpoints.sqlite3'),
+        'LLM_SINGLE_FLIGHT_DIR': os.path.join(workdir, 'singleflight'),
+        'LLM_CACHE_SQLITE_PATH': '',
+    })
+    env.update(overrides)
+    return env
+
+
+def run_once(overrides, importtime=False):
+    with tempfile.TemporaryDirectory(prefix='codecalm-bench-') as workdir:
+        cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD]
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=BACKEND, env=child_env(workdir, overrides),
+                              capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - started) * 1000
+    line = next((l for l in proc.stdout.splitlines() if l.startswith('BENCH_STARTUP ')), None)
+    if proc.returncode != 0 or line is None:
+        sys.exit(f"startup run failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    result = json.loads(line[len('BENCH_STARTUP '):])
+    result['wall_ms'] = round(wall_ms, 1)
+    result['interpreter_ms'] = round(wall_ms - result['import_ms'] - result['first_request_ms'], 1)
+    return result, proc.stderr
+
+
+def top_imports(stderr, limit):
+    """main.py's slowest direct imports from -X importtime output"""
+    top = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        # Nesting is two spaces per level; main itself is level 0 under -c
+        if match and len(match.group(3)) == 2:
+            top.append({'module': match.group(4), 'cumulative_ms': round(int(match.group(2)) / 1000, 1)})
+    top.sort(key=lambda item: item['cumulative_ms'], reverse=True)
+    return top[:limit]
+
+
+def median(runs, key):
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='imports listed from -X importtime')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the child (repeatable)')
+    parser.add_argument('--json', metavar='PATH', help="write results as JSON ('-' for stdout)")
+    args = parser.parse_args()
+
+    overrides = dict(item.split('=', 1) for item in args.env)
+    runs = [run_once(overrides)[0] for _ in range(args.runs)]
+    _, importtime_stderr = run_once(overrides, importtime=True)
+    imports = top_imports(importtime_stderr, args.top)
+
+    phases = {
+        name: round(statistics.median(run['phases_ms'].get(name, 0.0) for run in runs), 1)
+        for name in runs[0]['phases_ms']
+    }
+    summary = {
+        'wall_ms': median(runs, 'wall_ms'),
+        'interpreter_ms': median(runs, 'interpreter_ms'),
+        'import_ms': median(runs, 'import_ms'),
+        'first_request_ms': median(runs, 'first_request_ms'),
+        'peak_rss_mb': median(runs, 'peak_rss_mb'),
+        'phases_ms': phases,
+    }
+    report = {
+        'benchmark': 'startup',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'env': overrides,
+        'runs': runs,
+        'median': summary,
+        'top_imports': imports,
+    }
+
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.runs} cold starts (median), env {overrides or 'default'}")
+    print(f"  ready in        {summary['wall_ms']:8.1f} ms  (peak RSS {summary['peak_rss_mb']:.1f} MB)")
+    print(f"  interpreter     {summary['interpreter_ms']:8.1f} ms")
+    print(f"  import main     {summary['import_ms']:8.1f} ms")
+    for name, ms in phases.items():
+        print(f"    {name:<14}{ms:8.1f} ms")
+    print(f"  first request   {summary['first_request_ms']:8.1f} ms")
+    print("slowest imports (-X importtime, cumulative):")
+    for item in imports:
+        print(f"  {item['cumulative_ms']:8.1f} ms  {item['module']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: think_filter vs the old three-regex cleanup chain
+
+Usage (from backend/):
+    python benchmarks/bench_think_filter.py [--iterations 5000]
+
+Reports per-response cost for batch cleaning and per-token cost for the
+streaming filter, on DeepSeek-R1-shaped output (reasoning block, filler
+preamble, multi-paragraph answer).
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import think_filter  # noqa: E402
+
+
+def regex_chain(text):
+    """The cleanup generate_with_ollama used before think_filter"""
+    cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    cleaned = re.sub(r'<[^>]+>', '', cleaned, flags=re.DOTALL)
+    cleaned = re.sub(r'^(Okay|Alright|So|Hmm|Let me think).*?[.!?]\s*', '', cleaned, flags=re.MULTILINE | re.IGNORECASE)
+    return cleaned.strip()
+
+
+def sample_response(paragraphs=6):
+    reasoning = (
+        "Okay, the user says they feel overwhelmed before exams. I should "
+        "acknowledge the feeling first, then offer one or two concrete steps. "
+        "Keep it warm and short, avoid lecturing.\n"
+    ) * 4
+    answer = "\n\n".join(
+        f"Step {i + 1}: take a slow breath, write down the next small task, and give it "
+        f"twenty focused minutes before a short break. You're doing better than you think. 💙"
+        for i in range(paragraphs)
+    )
+    return f"<think>\n{reasoning}</think>\n\nAlright, let's make this lighter.\n{answer}\n"
+
+
+def tokenize(text, size=4):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def bench(fn, arg, iterations):
+    fn(arg)  # warm caches
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return (time.perf_counter() - started) / iterations
+
+
+def stream_all(tokens):
+    return ''.join(think_filter.filter_stream(tokens))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    text = sample_response()
+    tokens = tokenize(text)
+    assert think_filter.clean(text) == regex_chain(text) == stream_all(tokens)
+
+    regex_us = bench(regex_chain, text, args.iterations) * 1e6
+    batch_us = bench(think_filter.clean, text, args.iterations) * 1e6
+    stream_us = bench(stream_all, tokens, args.iterations) * 1e6
+
+    print(f"response: {len(text)} chars, {len(tokens)} stream tokens, {args.iterations} iterations")
+    print(f"  regex chain (batch):    {regex_us:8.1f} us/response")
+    print(f"  think_filter.clean:     {batch_us:8.1f} us/response  ({regex_us / batch_us:.2f}x)")
+    print(f"  think_filter streaming: {stream_us:8.1f} us/response  "
+          f"({stream_us / len(tokens):.2f} us/token)")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@ from functools import wraps
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
 
+# Called with each conversation after it is soft-deleted (main.py drops the
+# agent checkpoint kept for it outside SQL)
+conversation_deleted_hooks = []
+
 # =============================================================================
 # AUTHENTICATION DECORATOR
 # =============================================================================
@@ -340,6 +344,8 @@ def delete_conversation(user_id, conversation_id):
         
         # Soft delete
         conversation.soft_delete()
+        for hook in conversation_deleted_hooks:
+            hook(conversation)
         
         return jsonify({
             'success': True,
@@ -374,7 +380,11 @@ def log_routing(user_id):
         "selected_model": "groq-llama-70b",
         "query_type": "coding",
         "latency_ms": 234,
+        "prompt_tokens": 850,  // optional
+        "completion_tokens": 320,  // optional
         "cost_estimate": 0.0015,
+        "model_tier": "small",  // optional: cascade tier
+        "model_name": "llama-3.1-8b-instant",  // optional
         "reasoning": "Selected Groq for fast inference"
     }
     
@@ -415,7 +425,11 @@ def log_routing(user_id):
             selected_model=data['selected_model'],
             query_type=data.get('query_type'),
             latency_ms=data.get('latency_ms', 0),
+            prompt_tokens=data.get('prompt_tokens', 0),
+            completion_tokens=data.get('completion_tokens', 0),
             cost_estimate=data.get('cost_estimate', 0.0),
+            model_tier=data.get('model_tier'),
+            model_name=data.get('model_name'),
             reasoning=data.get('reasoning')
         )
         
@@ -460,7 +474,13 @@ def get_routing_analytics(user_id):
             "summary": {
                 "total_requests": 100,
                 "model_distribution": {...},
-                "avg_latency_ms": 245
+                "avg_latency_ms": 245,
+                "prompt_tokens": 42000,
+                "completion_tokens": 13000,
+                "total_tokens": 55000,
+                "total_cost_usd": 0.035,
+                "by_model": {"claude": {"requests": 10, "total_tokens": 5400, "cost_usd": 0.004}, ...},
+                "by_tier": {"small": {"requests": 80, "avg_latency_ms": 310, "cost_usd": 0.001}, ...}
             }
         }
     }
@@ -485,13 +505,40 @@ def get_routing_analytics(user_id):
         total = len(all_logs)
         
         model_distribution = {}
+        by_model = {}
+        by_tier = {}
         total_latency = 0
+        prompt_tokens = 0
+        completion_tokens = 0
+        total_cost = 0.0
         
         for log in all_logs:
             # Count model usage
             model = log.selected_model
             model_distribution[model] = model_distribution.get(model, 0) + 1
-            total_latency += log.latency_ms
+            total_latency += log.latency_ms or 0
+            
+            # Roll up tokens and cost
+            log_prompt = log.prompt_tokens or 0
+            log_completion = log.completion_tokens or 0
+            log_cost = log.cost_estimate or 0.0
+            prompt_tokens += log_prompt
+            completion_tokens += log_completion
+            total_cost += log_cost
+            
+            bucket = by_model.setdefault(model, {'requests': 0, 'total_tokens': 0, 'cost_usd': 0.0})
+            bucket['requests'] += 1
+            bucket['total_tokens'] += log_prompt + log_completion
+            bucket['cost_usd'] = round(bucket['cost_usd'] + log_cost, 6)
+            
+            if log.model_tier:
+                tier = by_tier.setdefault(log.model_tier, {'requests': 0, 'total_latency_ms': 0, 'cost_usd': 0.0})
+                tier['requests'] += 1
+                tier['total_latency_ms'] += log.latency_ms or 0
+                tier['cost_usd'] = round(tier['cost_usd'] + log_cost, 6)
+        
+        for tier in by_tier.values():
+            tier['avg_latency_ms'] = round(tier.pop('total_latency_ms') / tier['requests'], 2)
         
         avg_latency = total_latency / total if total > 0 else 0
         
@@ -502,7 +549,13 @@ def get_routing_analytics(user_id):
                 'summary': {
                     'total_requests': total,
                     'model_distribution': model_distribution,
-                    'avg_latency_ms': round(avg_latency, 2)
+                    'avg_latency_ms': round(avg_latency, 2),
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                    'total_cost_usd': round(total_cost, 6),
+                    'by_model': by_model,
+                    'by_tier': by_tier
                 }
             }
         }), 200
@@ -0,0 +1,218 @@
+"""
+Circuit Breaker and Adaptive Timeouts for CodeCalm LLM Providers
+
+States:
+- closed: calls flow normally; consecutive failures are counted
+- open: calls fail fast (callers use their canned fallback) until the
+  recovery window elapses
+- half_open: a limited number of trial calls probe whether the provider is back
+
+Timeouts follow observed latency: p99 of recent successful calls times a
+multiplier, clamped to [min_timeout, max_timeout]. Latencies are tracked in
+separate windows per model and call class:
+- class: short chat replies and long generations (meal plans, workouts),
+  picked by the call's max_tokens, so a stream of 300-token replies doesn't
+  shrink the timeout of a 1500-token call
+- model: the cascade's small model answers several times faster than the
+  large one, and its samples must not set the large model's timeout
+
+Environment Variables (read by breaker_from_env with a provider prefix, e.g. GROQ_):
+- <PREFIX>BREAKER_FAILURES: Consecutive failures that open the circuit (default: 5)
+- <PREFIX>BREAKER_RECOVERY_SECONDS: Open-state duration before a trial (default: 30)
+- <PREFIX>TIMEOUT_MIN / <PREFIX>TIMEOUT_MAX: Timeout clamp in seconds (default: 5 / 30)
+- <PREFIX>TIMEOUT_P99_MULTIPLIER: Headroom over observed p99 (default: 2.0)
+- <PREFIX>TIMEOUT_BATCH_TOKENS: max_tokens from which a call counts as batch (default: 800)
+"""
+
+import os
+import time
+import math
+import threading
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Fewer samples than this and the timeout stays at max_timeout
+MIN_LATENCY_SAMPLES = 20
+
+# Latency windows (call classes)
+CALL_CHAT = 'chat'
+CALL_BATCH = 'batch'
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies (seconds)"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, pct):
+        """Nearest-rank percentile of the window, or None when empty"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(math.ceil(pct / 100 * len(samples)) - 1, 0)
+        return samples[rank]
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker with latency-derived timeouts"""
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30,
+                 half_open_max_calls=1, min_timeout=5, max_timeout=30,
+                 timeout_multiplier=2.0, latency_window=200, batch_max_tokens=800):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.batch_max_tokens = batch_max_tokens
+        self.latency_window = latency_window
+        self.latency = {}  # (model, call class) -> LatencyTracker
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        self._counters = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """
+        Whether a call may go upstream right now
+
+        Returns False while open (and for excess half-open calls); the caller
+        should fall back immediately instead of waiting on a dead provider.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def release(self):
+        """Give back a half-open trial slot when the call never went upstream"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def call_class(self, max_tokens=None):
+        """Latency window for a call: batch for long generations, chat otherwise"""
+        if max_tokens is not None and max_tokens >= self.batch_max_tokens:
+            return CALL_BATCH
+        return CALL_CHAT
+
+    def latency_for(self, max_tokens=None, model=None):
+        """Latency window for a call to model (None: the provider's default model)"""
+        key = (model, self.call_class(max_tokens))
+        tracker = self.latency.get(key)
+        if tracker is None:
+            with self._lock:
+                tracker = self.latency.setdefault(key, LatencyTracker(self.latency_window))
+        return tracker
+
+    def record_success(self, latency=None, max_tokens=None, model=None):
+        """Upstream answered; latency (seconds) feeds the adaptive timeout of the call's model and class"""
+        if latency is not None:
+            self.latency_for(max_tokens, model).record(latency)
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"✅ {self.name} circuit closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+            self._counters['successes'] += 1
+
+    def record_failure(self):
+        """Upstream timed out, refused the connection or returned 5xx"""
+        with self._lock:
+            self._failures += 1
+            self._counters['failures'] += 1
+            state = self._current_state()
+            if state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if state != OPEN:
+                    logger.warning(f"⚡ {self.name} circuit opened after {self._failures} failure(s)")
+                    self._counters['opened'] += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def current_timeout(self, max_tokens=None, model=None):
+        """Timeout for the next call, derived from observed p99 latency of its model and class"""
+        latency = self.latency_for(max_tokens, model)
+        if latency.count() < MIN_LATENCY_SAMPLES:
+            return self.max_timeout
+        p99 = latency.percentile(99)
+        return round(min(max(p99 * self.timeout_multiplier, self.min_timeout), self.max_timeout), 2)
+
+    def snapshot(self):
+        """State and statistics for /api/health"""
+        latency = {}
+        for (model, call_class), tracker in list(self.latency.items()):
+            p50 = tracker.percentile(50)
+            p99 = tracker.percentile(99)
+            label = f"{model}/{call_class}" if model else call_class
+            latency[label] = {
+                'samples': tracker.count(),
+                'timeout_seconds': self.current_timeout(
+                    self.batch_max_tokens if call_class == CALL_BATCH else None, model
+                ),
+                'latency_p50_ms': round(p50 * 1000) if p50 is not None else None,
+                'latency_p99_ms': round(p99 * 1000) if p99 is not None else None
+            }
+        with self._lock:
+            state = self._current_state()
+            retry_in = max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0) if state == OPEN else 0
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': round(retry_in, 1),
+                'latency': latency,
+                **self._counters
+            }
+
+    def _current_state(self):
+        """Resolve open -> half_open once the recovery window elapses (lock held)"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+
+def breaker_from_env(name, prefix, max_timeout=30):
+    """Build a breaker for one provider from <prefix>* environment variables"""
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(os.getenv(f'{prefix}BREAKER_FAILURES', '5')),
+        recovery_timeout=float(os.getenv(f'{prefix}BREAKER_RECOVERY_SECONDS', '30')),
+        min_timeout=float(os.getenv(f'{prefix}TIMEOUT_MIN', '5')),
+        max_timeout=float(os.getenv(f'{prefix}TIMEOUT_MAX', str(max_timeout))),
+        timeout_multiplier=float(os.getenv(f'{prefix}TIMEOUT_P99_MULTIPLIER', '2.0')),
+        batch_max_tokens=int(os.getenv(f'{prefix}TIMEOUT_BATCH_TOKENS', '800'))
+    )
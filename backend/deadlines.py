@@ -0,0 +1,155 @@
+"""
+Per-Request Deadlines for CodeCalm
+
+A single request can chain several outbound calls (weather 10s, Tavily 10s,
+Groq up to 30s, a cascade escalation...), and their worst cases add up past
+gunicorn's worker timeout. Instead of letting the worker be killed, every
+request gets one time budget when it arrives, and each outbound call is given
+whatever is left of it as its timeout:
+
+    try:
+        timeout = deadlines.timeout(10, 'tavily')
+    except deadlines.DeadlineExceeded:
+        return []  # skip the step, serve the degraded answer
+
+The deadline lives in a ContextVar, so it follows the request into asyncio
+tasks (llm_gateway.gather) and hedging threads (which copy the context).
+Background work (job queue, cache warmers) has no request deadline unless it
+opens its own scope().
+
+Optional steps can pass reserve= so they never eat the time the LLM call
+after them needs.
+
+Environment Variables:
+- REQUEST_DEADLINE_ENABLED: Set to false to use each call's own timeout (default: true)
+- REQUEST_DEADLINE_SECONDS: Budget for interactive routes (default: 45)
+- REQUEST_DEADLINE_BATCH_SECONDS: Budget for batch routes such as meal plans
+  and workouts (default: 90). Keep both below gunicorn's --timeout.
+- JOB_DEADLINE_SECONDS: Budget for one background job (default: 180)
+- DEADLINE_MIN_CALL_SECONDS: A call is skipped when less than this is left
+  (default: 1)
+- DEADLINE_LLM_RESERVE_SECONDS: Budget optional steps leave for the LLM call
+  that follows them (default: 15)
+"""
+
+import os
+import time
+import threading
+import contextvars
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('REQUEST_DEADLINE_ENABLED', 'true').lower() != 'false'
+REQUEST_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '45'))
+BATCH_SECONDS = float(os.getenv('REQUEST_DEADLINE_BATCH_SECONDS', '90'))
+JOB_SECONDS = float(os.getenv('JOB_DEADLINE_SECONDS', '180'))
+MIN_CALL_SECONDS = float(os.getenv('DEADLINE_MIN_CALL_SECONDS', '1'))
+LLM_RESERVE_SECONDS = float(os.getenv('DEADLINE_LLM_RESERVE_SECONDS', '15'))
+
+# time.monotonic() value the current request must finish by (None: no deadline)
+_deadline = contextvars.ContextVar('codecalm_deadline', default=None)
+
+_lock = threading.Lock()
+_counters = {'started': 0, 'exhausted': 0}
+_skipped = {}
+
+
+class DeadlineExceeded(Exception):
+    """Not enough of the request's budget is left for this step"""
+
+    def __init__(self, step, remaining):
+        self.step = step
+        self.remaining = remaining
+        super().__init__(f"{step}: {max(remaining, 0):.1f}s of budget left")
+
+
+def start(seconds):
+    """Give the current context a fresh budget (called per request)"""
+    if not ENABLED:
+        return
+    _deadline.set(time.monotonic() + seconds)
+    with _lock:
+        _counters['started'] += 1
+
+
+def clear():
+    _deadline.set(None)
+
+
+@contextmanager
+def scope(seconds):
+    """Budget for a block of work, never extending an outer deadline"""
+    if not ENABLED:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(outer, at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None without a deadline"""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return at - time.monotonic()
+
+
+def expired(step=None):
+    """True once less than DEADLINE_MIN_CALL_SECONDS is left (counted as a skip of step)"""
+    left = remaining()
+    if left is None or left >= MIN_CALL_SECONDS:
+        return False
+    if step:
+        logger.warning(f"⏱️  Skipping {step}: request budget exhausted")
+        _count_skip(step, exhausted=True)
+    return True
+
+
+def timeout(default, step, reserve=0):
+    """
+    Timeout for an outbound call: default, capped at the remaining budget
+
+    Args:
+        default: The call's own timeout
+        step: Name for logs and stats ('groq', 'tavily', ...)
+        reserve: Seconds to leave for the steps after this one
+
+    Raises:
+        DeadlineExceeded: less than DEADLINE_MIN_CALL_SECONDS would be left
+    """
+    left = remaining()
+    if left is None:
+        return default
+    available = left - reserve
+    if available < MIN_CALL_SECONDS:
+        logger.warning(f"⏱️  Skipping {step}: {max(left, 0):.1f}s of request budget left")
+        _count_skip(step, exhausted=left < MIN_CALL_SECONDS)
+        raise DeadlineExceeded(step, available)
+    return round(min(default, available), 2)
+
+
+def _count_skip(step, exhausted):
+    with _lock:
+        _skipped[step] = _skipped.get(step, 0) + 1
+        if exhausted:
+            _counters['exhausted'] += 1
+
+
+def stats():
+    with _lock:
+        return {
+            'enabled': ENABLED,
+            'request_seconds': REQUEST_SECONDS,
+            'batch_seconds': BATCH_SECONDS,
+            'job_seconds': JOB_SECONDS,
+            'requests': _counters['started'],
+            'exhausted_calls': _counters['exhausted'],
+            'skipped_steps': dict(_skipped)
+        }
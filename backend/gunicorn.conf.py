@@ -0,0 +1,63 @@
+"""
+Gunicorn Configuration for CodeCalm
+
+    gunicorn -c backend/gunicorn.conf.py
+
+With preload (the default) main.py is imported once in the master and the
+workers are forked from it, so Flask, SQLAlchemy, the prompt tables and (with
+AGENT_WARMUP=eager, the preload default) the LangGraph stack and compiled
+graph are shared copy-on-write instead of rebuilt per worker:
+- the master imports with the cyclic GC disabled and freezes every object
+  right before forking, so collections in the workers never write to (and
+  un-share) the pages holding that state; once the app is loaded the master
+  re-enables its own GC (the frozen objects stay out of its collections)
+- each worker re-enables the GC and calls main.init_worker(), which drops the
+  master's DB pool and HTTP sessions and starts its background threads
+
+Environment Variables:
+- PORT: Port to bind (default: 5000)
+- WEB_CONCURRENCY: Worker processes (default: 2)
+- GUNICORN_TIMEOUT: Worker timeout in seconds (default: 120)
+- GUNICORN_PRELOAD: Set to false to import the app in every worker (default: true)
+"""
+
+import os
+import gc
+import sys
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'main:app'
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+if preload_app:
+    # Read by main.py at import: threads are started per worker, not in the master
+    os.environ['CODECALM_PRELOAD'] = 'true'
+    os.environ.setdefault('AGENT_WARMUP', 'eager')
+    # Garbage from the import would leave freed holes in pages the workers share
+    gc.disable()
+
+
+def when_ready(server):
+    if preload_app:
+        # The app is imported: freeze it, then let the long-lived arbiter collect again
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    gc.enable()
+    app_module = sys.modules.get('main')
+    if app_module is not None:
+        app_module.init_worker()
+    server.log.info(f"🍴 Worker {worker.pid} forked from preloaded app "
+                    f"({gc.get_freeze_count()} objects frozen)")
@@ -0,0 +1,169 @@
+"""
+Background Provider Health Prober for CodeCalm
+
+Provider reachability used to be probed while main.py was imported: a Groq
+test completion (10s timeout, real tokens) and an Ollama /api/tags call,
+paid again by every gunicorn worker at boot. The prober runs those checks on
+a background thread instead and caches the result, so worker start-up never
+waits on the network and /api/health and the routing logic just read a
+dict.
+
+Each provider reports one of:
+- up: probe succeeded
+- degraded: reachable but erroring or timing out (calls are still attempted;
+  the circuit breaker handles the rest)
+- down: unusable (bad API key, server not running)
+- unknown: not probed yet; available() falls back to the registered default
+
+Live traffic also reports outcomes (report()), so a revoked key is noticed
+on the next call rather than the next probe.
+
+Environment Variables:
+- HEALTH_PROBE_INTERVAL: Seconds between probes (default: 60)
+- HEALTH_PROBE_ENABLED: Set to false to skip active probing (default: true)
+"""
+
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_UP = 'up'
+STATE_DEGRADED = 'degraded'
+STATE_DOWN = 'down'
+STATE_UNKNOWN = 'unknown'
+
+
+class _Target:
+    def __init__(self, probe, default, on_change):
+        self.probe = probe
+        self.default = default
+        self.on_change = on_change
+        self.state = STATE_UNKNOWN
+        self.checked_at = None
+        self.latency_ms = None
+        self.source = None
+        self.failures = 0
+
+
+class HealthProber:
+    """Periodically probe registered providers and cache their state"""
+
+    def __init__(self, interval=60, enabled=True):
+        self.interval = interval
+        self.enabled = enabled
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+
+    def register(self, name, probe, default=True, on_change=None):
+        """
+        Args:
+            probe: Callable returning 'up', 'degraded' or 'down'
+            default: available() answer until the first probe completes
+            on_change: Called as on_change(name, old_state, new_state)
+        """
+        self._targets[name] = _Target(probe, default, on_change)
+
+    def ensure_started(self):
+        """Start this process's probe thread (again after fork); never blocks"""
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread_pid == pid and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name='health-prober', daemon=True)
+            self._thread_pid = pid
+            self._thread.start()
+
+    # -------------------------------------------------------------------------
+    # Reads (cheap, lock-free enough for request paths)
+    # -------------------------------------------------------------------------
+
+    def state(self, name):
+        target = self._targets.get(name)
+        return target.state if target else STATE_UNKNOWN
+
+    def available(self, name):
+        """True unless the provider is known to be down"""
+        target = self._targets.get(name)
+        if target is None:
+            return False
+        if target.state == STATE_UNKNOWN:
+            return target.default
+        return target.state != STATE_DOWN
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    'state': t.state,
+                    'checked_at': t.checked_at,
+                    'latency_ms': t.latency_ms,
+                    'source': t.source,
+                    'consecutive_failures': t.failures
+                }
+                for name, t in self._targets.items()
+            }
+
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+
+    def report(self, name, state):
+        """Passive update from a live call's outcome"""
+        if name in self._targets:
+            self._set(name, state, source='traffic')
+
+    def probe_now(self, name=None):
+        """Run probes synchronously (all of them, or one)"""
+        for target_name in ([name] if name else list(self._targets)):
+            target = self._targets[target_name]
+            started = time.monotonic()
+            try:
+                state = target.probe()
+            except Exception as e:
+                logger.warning(f"⚠️  {target_name} health probe raised: {e}")
+                state = STATE_DEGRADED
+            self._set(target_name, state, source='probe',
+                      latency_ms=round((time.monotonic() - started) * 1000))
+
+    def _set(self, name, state, source, latency_ms=None):
+        target = self._targets[name]
+        with self._lock:
+            old = target.state
+            target.state = state
+            target.checked_at = time.time()
+            target.source = source
+            if latency_ms is not None:
+                target.latency_ms = latency_ms
+            target.failures = 0 if state == STATE_UP else target.failures + 1
+        if old != state:
+            icon = '✅' if state == STATE_UP else '⚠️ '
+            logger.info(f"{icon} {name} is {state} (was {old}, via {source})")
+            if target.on_change:
+                try:
+                    target.on_change(name, old, state)
+                except Exception as e:
+                    logger.error(f"{name} health callback failed: {e}")
+
+    def _loop(self):
+        while True:
+            self.probe_now()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def prober_from_env():
+    """Build the prober from HEALTH_PROBE_* environment variables"""
+    return HealthProber(
+        interval=float(os.getenv('HEALTH_PROBE_INTERVAL', '60')),
+        enabled=os.getenv('HEALTH_PROBE_ENABLED', 'true').lower() != 'false'
+    )
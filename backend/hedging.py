@@ -0,0 +1,184 @@
+"""
+Hedged Requests for CodeCalm LLM Calls
+
+Sends the prompt to the primary provider (Groq) and, only if it hasn't
+answered by a latency-percentile deadline, fires the same prompt at the hedge
+provider (local Ollama). The first successful answer wins; the loser is told
+to stop through its cancel event and its result is discarded.
+
+Environment Variables:
+- LLM_HEDGING: Set to true to enable hedging when Ollama is reachable (default: false)
+- HEDGE_PERCENTILE: Primary latency percentile used as the hedge deadline (default: 95)
+- HEDGE_DELAY_MS: Fixed hedge deadline, overriding the percentile
+- HEDGE_MIN_DELAY_MS / HEDGE_MAX_DELAY_MS: Clamp for the deadline (default: 500 / 8000)
+- HEDGE_MAX_WORKERS: Threads available for racing calls (default: 8)
+"""
+
+import os
+import time
+import threading
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from circuit_breaker import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Deadline used until the primary has enough latency samples
+MIN_SAMPLES_FOR_PERCENTILE = 20
+
+
+class _ProviderStats:
+    def __init__(self):
+        self.latency = LatencyTracker()
+        self.launched = 0
+        self.wins = 0
+        self.failures = 0
+
+    def snapshot(self):
+        p50 = self.latency.percentile(50)
+        p99 = self.latency.percentile(99)
+        return {
+            'launched': self.launched,
+            'wins': self.wins,
+            'failures': self.failures,
+            'latency_p50_ms': round(p50 * 1000) if p50 is not None else None,
+            'latency_p99_ms': round(p99 * 1000) if p99 is not None else None
+        }
+
+
+class HedgedRacer:
+    """Race a primary provider against a delayed hedge provider"""
+
+    def __init__(self, primary='groq', hedge='ollama', percentile=95,
+                 fixed_delay=None, min_delay=0.5, max_delay=8.0,
+                 max_workers=8, enabled=False):
+        self.primary = primary
+        self.hedge = hedge
+        self.percentile = percentile
+        self.fixed_delay = fixed_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.enabled = enabled
+        self._max_workers = max_workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._stats = {primary: _ProviderStats(), hedge: _ProviderStats()}
+        self._hedges_fired = 0
+        self._races = 0
+
+    def hedge_delay(self):
+        """Seconds to wait on the primary before firing the hedge"""
+        if self.fixed_delay is not None:
+            return self.fixed_delay
+        tracker = self._stats[self.primary].latency
+        if tracker.count() < MIN_SAMPLES_FOR_PERCENTILE:
+            return self.max_delay
+        return min(max(tracker.percentile(self.percentile), self.min_delay), self.max_delay)
+
+    def race(self, primary_fn, hedge_fn):
+        """
+        Run primary_fn, hedging with hedge_fn after hedge_delay()
+
+        Both callables take one argument, a threading.Event set when their
+        result is no longer wanted, and return a response string or None.
+
+        Returns:
+            tuple (response, provider_name); response is None if both failed
+        """
+        executor = self._get_executor()
+        with self._lock:
+            self._races += 1
+
+        cancels = {self.primary: threading.Event(), self.hedge: threading.Event()}
+        futures = {self._launch(executor, self.primary, primary_fn, cancels[self.primary]): self.primary}
+
+        done, _ = wait(futures, timeout=self.hedge_delay())
+        primary_future = next(iter(futures))
+        if not done or primary_future.result()[0] is None:
+            with self._lock:
+                self._hedges_fired += 1
+            logger.info(f"🏁 Hedging {self.primary} with {self.hedge}")
+            futures[self._launch(executor, self.hedge, hedge_fn, cancels[self.hedge])] = self.hedge
+
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response, _ = future.result()
+                if response is not None:
+                    winner = futures[future]
+                    for name, event in cancels.items():
+                        if name != winner:
+                            event.set()
+                    for loser in pending:
+                        loser.cancel()
+                    with self._lock:
+                        self._stats[winner].wins += 1
+                    return response, winner
+
+        return None, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hedge_delay_ms': round(self.hedge_delay() * 1000),
+                'races': self._races,
+                'hedges_fired': self._hedges_fired,
+                'providers': {name: s.snapshot() for name, s in self._stats.items()}
+            }
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._max_workers, thread_name_prefix='hedge'
+                    )
+                    self._executor_pid = pid
+        return self._executor
+
+    def _launch(self, executor, name, fn, cancel):
+        stats = self._stats[name]
+        with self._lock:
+            stats.launched += 1
+        # Copy the context so the call still sees the Flask request (priority, g)
+        ctx = contextvars.copy_context()
+
+        def timed():
+            started = time.monotonic()
+            try:
+                response = ctx.run(fn, cancel)
+            except Exception as e:
+                logger.error(f"{name} hedged call failed: {e}")
+                response = None
+            elapsed = time.monotonic() - started
+            if response is None:
+                with self._lock:
+                    stats.failures += 1
+            else:
+                stats.latency.record(elapsed)
+            return response, elapsed
+
+        return executor.submit(timed)
+
+
+def racer_from_env():
+    """Build the Groq/Ollama racer from LLM_HEDGING / HEDGE_* variables"""
+    fixed = os.getenv('HEDGE_DELAY_MS')
+    return HedgedRacer(
+        percentile=float(os.getenv('HEDGE_PERCENTILE', '95')),
+        fixed_delay=float(fixed) / 1000 if fixed else None,
+        min_delay=float(os.getenv('HEDGE_MIN_DELAY_MS', '500')) / 1000,
+        max_delay=float(os.getenv('HEDGE_MAX_DELAY_MS', '8000')) / 1000,
+        max_workers=int(os.getenv('HEDGE_MAX_WORKERS', '8')),
+        enabled=os.getenv('LLM_HEDGING', 'false').lower() == 'true'
+    )
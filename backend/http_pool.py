@@ -0,0 +1,164 @@
+"""
+Outbound HTTP Client Pool for CodeCalm
+
+Keeps one keep-alive requests.Session per upstream host so repeated calls to
+Groq, Tavily, OpenWeather and Ollama reuse their TCP/TLS connections instead
+of paying a fresh handshake on every chat turn.
+
+Environment Variables:
+- HTTP_POOL_CONNECTIONS: Host pools cached per session (default: 4)
+- HTTP_POOL_MAXSIZE: Keep-alive connections per host, per worker (default: 8)
+- HTTP_POOL_RETRIES: Retries for failed connection attempts (default: 1)
+
+Usage:
+    import http_pool
+    response = http_pool.post(GROQ_API_URL, json=payload, timeout=30)
+"""
+
+import os
+import threading
+import logging
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '8'))
+POOL_RETRIES = int(os.getenv('HTTP_POOL_RETRIES', '1'))
+
+# =============================================================================
+# SESSION REGISTRY
+# =============================================================================
+
+_sessions = {}
+_request_counts = {}
+_lock = threading.Lock()
+_owner_pid = os.getpid()
+
+
+def _host_key(url: str) -> str:
+    """Reduce a URL to the scheme://host:port it connects to"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _build_session() -> requests.Session:
+    """Create a session whose adapter keeps connections alive between calls"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=POOL_RETRIES
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Get the pooled session for the host of ``url``
+
+    Args:
+        url: Any URL on the target host
+
+    Returns:
+        Long-lived requests.Session shared by every caller in this process
+    """
+    if os.getpid() != _owner_pid:
+        # Forked without the at-fork hook (e.g. a custom launcher)
+        reset_sessions()
+
+    key = _host_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session()
+                _sessions[key] = session
+                _request_counts.setdefault(key, 0)
+                logger.info(f"🔌 Opened keep-alive pool for {key}")
+    return session
+
+
+def reset_sessions():
+    """
+    Drop every pooled session so the current process opens its own sockets
+
+    Called automatically in forked children; sockets inherited from the
+    parent are abandoned rather than closed so the parent's TLS streams stay
+    intact.
+    """
+    global _owner_pid, _lock
+    _lock = threading.Lock()
+    _sessions.clear()
+    _request_counts.clear()
+    _owner_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_sessions)
+
+
+# =============================================================================
+# REQUEST HELPERS
+# =============================================================================
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """Send a request through the pooled session for the target host"""
+    session = get_session(url)
+    key = _host_key(url)
+    _request_counts[key] = _request_counts.get(key, 0) + 1
+    return session.request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """Pooled equivalent of requests.get"""
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """Pooled equivalent of requests.post"""
+    return request('POST', url, **kwargs)
+
+
+# =============================================================================
+# STATISTICS
+# =============================================================================
+
+def pool_stats() -> dict:
+    """
+    Report connection reuse per upstream host
+
+    Returns:
+        Dictionary keyed by host with request count, connections opened and
+        how many requests were served on an already-open connection
+    """
+    stats = {}
+    for key, session in list(_sessions.items()):
+        connections = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    connections += getattr(pool, 'num_connections', 0)
+
+        requests_sent = _request_counts.get(key, 0)
+        reused = max(requests_sent - connections, 0)
+        stats[key] = {
+            'requests': requests_sent,
+            'connections_opened': connections,
+            'connections_reused': reused,
+            'reuse_ratio': round(reused / requests_sent, 3) if requests_sent else 0.0
+        }
+
+    return {
+        'pid': _owner_pid,
+        'pool_maxsize': POOL_MAXSIZE,
+        'hosts': stats
+    }
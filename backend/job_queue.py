@@ -0,0 +1,429 @@
+"""
+Background Job Queue for CodeCalm's Long Generations
+
+Meal plans, workout plans and food recommendations need a 1200-1500 token
+completion plus weather/research lookups. Run inline, each one pins a sync
+gunicorn worker for the whole call and starves the chat routes. Submitted as
+jobs they return immediately and are worked off by a small thread pool:
+
+    POST /api/jobs                {"kind": "meal_plan", "payload": {...}}  -> 202 + job id
+    GET  /api/jobs/<id>           poll status / result
+    GET  /api/jobs/<id>/events    Server-Sent Events until the job finishes
+    GET  /api/jobs                queue statistics
+
+The queue lives in one SQLite file, so every gunicorn worker on the host
+shares it: any worker's threads may pick up a job and any worker can answer
+the poll. Jobs claimed by a worker that died are requeued after
+JOB_STALE_SECONDS. Workers start lazily in each process (and again after
+fork), so a --preload master never owns the threads.
+
+Environment Variables:
+- JOB_QUEUE_PATH: SQLite file (default: <tmp>/codecalm-jobs.sqlite3)
+- JOB_QUEUE_WORKERS: Worker threads per process (default: 2)
+- JOB_POLL_INTERVAL: Seconds an idle worker waits before checking for jobs
+  submitted by other processes (default: 1)
+- JOB_RESULT_TTL_SECONDS: How long finished jobs are kept (default: 3600)
+- JOB_STALE_SECONDS: Running jobs older than this are requeued (default: 600)
+- JOB_MAX_ATTEMPTS: Attempts before a repeatedly stale job fails (default: 2)
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+import logging
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+FINISHED = (STATUS_DONE, STATUS_FAILED)
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+class UnknownJobKind(ValueError):
+    """Raised when a job is submitted for a kind with no registered handler"""
+
+
+class JobQueue:
+    """Persistent (SQLite) job queue worked off by per-process threads"""
+
+    def __init__(self, path, workers=2, poll_interval=1.0, result_ttl=3600,
+                 stale_after=600, max_attempts=2):
+        self.path = path
+        self.workers = max(workers, 1)
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self.max_attempts = max(max_attempts, 1)
+        self.app = None
+
+        self._handlers = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self._threads_pid = None
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'requeued': 0}
+
+        self._init_db()
+
+    # -------------------------------------------------------------------------
+    # Registration
+    # -------------------------------------------------------------------------
+
+    def register(self, kind, handler):
+        """handler(payload) -> JSON-serialisable result; raising fails the job"""
+        self._handlers[kind] = handler
+
+    def kinds(self):
+        return sorted(self._handlers)
+
+    # -------------------------------------------------------------------------
+    # Submit / inspect
+    # -------------------------------------------------------------------------
+
+    def submit(self, kind, payload=None):
+        """Queue a job and return its id"""
+        if kind not in self._handlers:
+            raise UnknownJobKind(kind)
+        job_id = uuid.uuid4().hex
+        self._connection().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at, attempts)"
+            " VALUES (?, ?, ?, ?, ?, 0)",
+            (job_id, kind, json.dumps(payload or {}), STATUS_QUEUED, time.time())
+        )
+        with self._lock:
+            self._counters['submitted'] += 1
+        self.ensure_workers()
+        self._wake.set()
+        logger.info(f"📥 Job {job_id[:8]} queued ({kind})")
+        return job_id
+
+    def get(self, job_id):
+        """Job as a dict (with queue position while queued), or None"""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT id, kind, status, result, error, created_at, started_at,"
+            " finished_at, attempts FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'result': json.loads(row[3]) if row[3] else None,
+            'error': row[4],
+            'created_at': row[5],
+            'started_at': row[6],
+            'finished_at': row[7],
+            'attempts': row[8]
+        }
+        if job['status'] == STATUS_QUEUED:
+            job['position'] = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                (STATUS_QUEUED, job['created_at'])
+            ).fetchone()[0]
+        return job
+
+    def stats(self):
+        counts = dict(self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall())
+        with self._lock:
+            counters = dict(self._counters)
+            alive = sum(t.is_alive() for t in self._threads) if self._threads_pid == os.getpid() else 0
+        return {
+            'path': self.path,
+            'workers': alive,
+            'kinds': self.kinds(),
+            'jobs': {status: counts.get(status, 0)
+                     for status in (STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)},
+            **counters
+        }
+
+    # -------------------------------------------------------------------------
+    # Workers
+    # -------------------------------------------------------------------------
+
+    def ensure_workers(self):
+        """Start this process's worker threads if they aren't running"""
+        pid = os.getpid()
+        if self._threads_pid == pid and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._threads_pid != pid:
+                self._threads = []
+                self._threads_pid = pid
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️  Job queue claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self._run(*job)
+
+    def _run(self, job_id, kind, payload):
+        started = time.monotonic()
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    result = self._handlers[kind](payload)
+            else:
+                result = self._handlers[kind](payload)
+            self._finish(job_id, STATUS_DONE, result=result)
+            logger.info(f"✅ Job {job_id[:8]} ({kind}) done in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"❌ Job {job_id[:8]} ({kind}) failed: {e}")
+            self._finish(job_id, STATUS_FAILED, error=str(e))
+
+    def _claim(self):
+        """Atomically take the oldest queued job this process can handle"""
+        if not self._handlers:
+            return None
+        conn = self._connection()
+        now = time.time()
+        kinds = self.kinds()
+        marks = ','.join('?' * len(kinds))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._recover_stale(conn, now)
+            row = conn.execute(
+                f"SELECT id, kind, payload FROM jobs WHERE status = ? AND kind IN ({marks})"
+                " ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, *kinds)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1"
+                    " WHERE id = ?",
+                    (STATUS_RUNNING, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def _recover_stale(self, conn, now):
+        """Requeue (or fail) jobs whose worker vanished mid-run"""
+        cutoff = now - self.stale_after
+        failed = conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?"
+            " WHERE status = ? AND started_at < ? AND attempts >= ?",
+            (STATUS_FAILED, 'worker lost', now, STATUS_RUNNING, cutoff, self.max_attempts)
+        ).rowcount
+        requeued = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+            (STATUS_QUEUED, STATUS_RUNNING, cutoff)
+        ).rowcount
+        conn.execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (now - self.result_ttl,)
+        )
+        if failed or requeued:
+            with self._lock:
+                self._counters['requeued'] += requeued
+                self._counters['failed'] += failed
+            logger.warning(f"⚠️  Recovered stale jobs: {requeued} requeued, {failed} failed")
+
+    def _finish(self, job_id, status, result=None, error=None):
+        try:
+            self._connection().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 time.time(), job_id)
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"❌ Could not store job {job_id[:8]} result: {e}")
+            self._connection().execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (STATUS_FAILED, str(e), time.time(), job_id)
+            )
+            status = STATUS_FAILED
+        with self._lock:
+            self._counters['completed' if status == STATUS_DONE else 'failed'] += 1
+
+    # -------------------------------------------------------------------------
+    # SQLite
+    # -------------------------------------------------------------------------
+
+    def _connection(self):
+        """One autocommit SQLite connection per thread (and per process after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+
+# =============================================================================
+# PROCESS-WIDE QUEUE
+# =============================================================================
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def queue_from_env():
+    """Build the queue from JOB_* environment variables"""
+    return JobQueue(
+        path=os.getenv('JOB_QUEUE_PATH') or os.path.join(tempfile.gettempdir(), 'codecalm-jobs.sqlite3'),
+        workers=int(os.getenv('JOB_QUEUE_WORKERS', '2')),
+        poll_interval=float(os.getenv('JOB_POLL_INTERVAL', '1')),
+        result_ttl=int(os.getenv('JOB_RESULT_TTL_SECONDS', '3600')),
+        stale_after=int(os.getenv('JOB_STALE_SECONDS', '600')),
+        max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+    )
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = queue_from_env()
+    return _queue
+
+
+def init_app(app):
+    """Run jobs inside app's context and expose /api/jobs"""
+    get_queue().app = app
+    app.register_blueprint(jobs_bp)
+
+
+def submit_response(kind, payload):
+    """202 response for a freshly queued job (used by /api/jobs and async routes)"""
+    try:
+        job_id = get_queue().submit(kind, payload)
+    except UnknownJobKind:
+        return jsonify({'success': False, 'error': f'Unknown job kind: {kind}'}), 400
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': STATUS_QUEUED,
+        'status_url': f'{jobs_bp.url_prefix}/{job_id}',
+        'events_url': f'{jobs_bp.url_prefix}/{job_id}/events'
+    }), 202
+
+
+# =============================================================================
+# ROUTES
+# =============================================================================
+
+@jobs_bp.route('', methods=['POST'])
+def submit_job():
+    """
+    Queue a long-running generation
+
+    Request Body:
+    {
+        "kind": "meal_plan",  // meal_plan, workout, food_recommendations
+        "payload": {...}      // same body the synchronous endpoint takes
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    payload = data.get('payload', {})
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'payload must be an object'}), 400
+    return submit_response(data.get('kind'), payload)
+
+
+@jobs_bp.route('', methods=['GET'])
+def queue_stats():
+    return jsonify({'success': True, 'queue': get_queue().stats()})
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    queue = get_queue()
+    queue.ensure_workers()
+    job = queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
+@jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-Sent Events for one job: a `status` event on every change, then
+    `done` (or `failed`) carrying the full job
+
+    Each open stream holds a request thread; on sync gunicorn workers prefer
+    polling GET /api/jobs/<id>.
+    """
+    queue = get_queue()
+    queue.ensure_workers()
+    if queue.get(job_id) is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    def generate():
+        last_status = None
+        last_beat = time.monotonic()
+        while True:
+            job = queue.get(job_id)
+            if job is None:
+                yield f"event: failed\ndata: {json.dumps({'id': job_id, 'error': 'Job expired'})}\n\n"
+                return
+            if job['status'] != last_status:
+                last_status = job['status']
+                if last_status in FINISHED:
+                    event = 'done' if last_status == STATUS_DONE else 'failed'
+                    yield f"event: {event}\ndata: {json.dumps(job)}\n\n"
+                    return
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+            elif time.monotonic() - last_beat > 15:
+                yield ": keep-alive\n\n"
+                last_beat = time.monotonic()
+            time.sleep(0.5)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,215 @@
+"""
+LLM Completion Cache for CodeCalm
+
+Exact-match cache for Groq completions keyed by (model, prompt, temperature,
+max_tokens). Two tiers:
+- memory: per-worker LRU with TTL
+- sqlite: optional file shared by every gunicorn worker on the host
+
+Environment Variables:
+- LLM_CACHE_ENABLED: Set to false to disable caching entirely (default: true)
+- LLM_CACHE_MAX_ENTRIES: In-memory LRU capacity (default: 512)
+- LLM_CACHE_TTL_SECONDS: Entry lifetime in both tiers (default: 3600)
+- LLM_CACHE_SQLITE_PATH: Enables the shared on-disk tier when set
+- LLM_CACHE_MAX_TEMPERATURE: Calls sampled hotter than this bypass the cache
+  (default: 0.7)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionCache:
+    """Two-tier (memory LRU + optional SQLite) exact-match completion cache"""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600, sqlite_path=None,
+                 max_temperature=0.7, enabled=True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'stores': 0
+        }
+
+        if self.sqlite_path:
+            self._init_sqlite()
+
+    # -------------------------------------------------------------------------
+    # Keys and policy
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def make_key(model, prompt, temperature, max_tokens):
+        """Hash the full request identity into a fixed-size key"""
+        identity = json.dumps(
+            [model, prompt, round(float(temperature), 3), int(max_tokens)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def cacheable(self, temperature):
+        """Whether a call sampled at this temperature may be served from cache"""
+        if not self.enabled:
+            return False
+        if temperature > self.max_temperature:
+            self._count('bypassed')
+            return False
+        return True
+
+    # -------------------------------------------------------------------------
+    # Lookup / store
+    # -------------------------------------------------------------------------
+
+    def get(self, key):
+        """Return the cached completion for key, or None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.sqlite_path:
+            value = self._disk_get(key, now)
+            if value is not None:
+                self._memory_set(key, value, now)
+                self._count('disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        """Store a completion in every enabled tier"""
+        if not value:
+            return
+        now = time.time()
+        self._memory_set(key, value, now)
+        if self.sqlite_path:
+            self._disk_set(key, value, now)
+        self._count('stores')
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            try:
+                conn = self._connection()
+                conn.execute("DELETE FROM completions")
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️  LLM cache clear failed: {e}")
+
+    def stats(self):
+        """Hit/miss counters and tier sizes for health reporting"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return {
+            'enabled': self.enabled,
+            'memory_entries': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'disk_tier': bool(self.sqlite_path),
+            'hit_ratio': round(hits / lookups, 3) if lookups else 0.0,
+            **counters
+        }
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _memory_set(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _connection(self):
+        """One SQLite connection per thread (and per process after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.sqlite_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_sqlite(self):
+        try:
+            conn = self._connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+            logger.info(f"✅ LLM cache disk tier at {self.sqlite_path}")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  LLM cache disk tier disabled: {e}")
+            self.sqlite_path = None
+
+    def _disk_get(self, key, now):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM completions WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  LLM cache read failed: {e}")
+            return None
+
+    def _disk_set(self, key, value, now):
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + self.ttl_seconds)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  LLM cache write failed: {e}")
+
+
+def cache_from_env():
+    """Build the process-wide cache from LLM_CACHE_* environment variables"""
+    return CompletionCache(
+        max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '512')),
+        ttl_seconds=int(os.getenv('LLM_CACHE_TTL_SECONDS', '3600')),
+        sqlite_path=os.getenv('LLM_CACHE_SQLITE_PATH') or None,
+        max_temperature=float(os.getenv('LLM_CACHE_MAX_TEMPERATURE', '0.7')),
+        enabled=os.getenv('LLM_CACHE_ENABLED', 'true').lower() != 'false'
+    )
@@ -0,0 +1,140 @@
+"""
+Asyncio Gateway for CodeCalm's Outbound Providers
+
+Native async clients (httpx.AsyncClient) for Tavily and OpenWeather, plus
+helpers that let synchronous Flask routes run independent lookups
+concurrently:
+
+    weather, research = llm_gateway.gather(
+        llm_gateway.openweather_current(city, key),
+        llm_gateway.tavily_search(query, key),
+    )
+
+Each worker thread keeps one event loop and one AsyncClient, so connections
+stay alive across requests the same way http_pool's sessions do.
+
+LLM calls deliberately stay on the synchronous generate_with_groq() path in
+main.py, which applies the completion cache, circuit breaker, rate limiter,
+single-flight and token accounting; the gateway only fans out the plain HTTP
+lookups around them.
+
+Environment Variables:
+- HTTP_POOL_MAXSIZE: Keep-alive connections per host (shared with http_pool)
+"""
+
+import os
+import asyncio
+import threading
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+TAVILY_API_URL = "https://api.tavily.com/search"
+OPENWEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '8'))
+
+# =============================================================================
+# EVENT LOOP / CLIENT MANAGEMENT
+# =============================================================================
+
+_local = threading.local()
+
+
+def _thread_loop():
+    """This thread's persistent event loop (recreated after fork)"""
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.is_closed() or getattr(_local, 'pid', None) != os.getpid():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+        _local.pid = os.getpid()
+        _local.client = None
+    return loop
+
+
+def _client():
+    """AsyncClient bound to the running thread's loop"""
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=POOL_MAXSIZE * 4,
+                max_keepalive_connections=POOL_MAXSIZE
+            ),
+            timeout=httpx.Timeout(30.0)
+        )
+        _local.client = client
+    return client
+
+
+def run(coro):
+    """Run a coroutine to completion from synchronous code"""
+    return _thread_loop().run_until_complete(coro)
+
+
+def gather(*coros):
+    """
+    Run independent coroutines concurrently and return their results in order
+
+    A coroutine that raises yields None in its slot so one failed provider
+    never sinks the others.
+    """
+    async def _gather():
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        cleaned = []
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"Gateway call failed: {result}")
+                cleaned.append(None)
+            else:
+                cleaned.append(result)
+        return cleaned
+
+    return run(_gather())
+
+
+# =============================================================================
+# PROVIDER CLIENTS
+# =============================================================================
+
+async def tavily_search(query, api_key, include_domains=None, max_results=3,
+                        search_depth="advanced", timeout=10):
+    """
+    Tavily web search
+
+    Returns:
+        List of raw Tavily result dicts (empty on error)
+    """
+    response = await _client().post(
+        TAVILY_API_URL,
+        json={
+            "api_key": api_key,
+            "query": query,
+            "search_depth": search_depth,
+            "max_results": max_results,
+            "include_domains": include_domains or []
+        },
+        timeout=timeout
+    )
+    if response.status_code != 200:
+        return []
+    return response.json().get('results', [])
+
+
+async def openweather_current(city, api_key, timeout=10):
+    """
+    Current weather for a city from OpenWeatherMap (metric units)
+
+    Returns:
+        Raw OpenWeather JSON, or None on error
+    """
+    response = await _client().get(
+        OPENWEATHER_API_URL,
+        params={"q": city, "appid": api_key, "units": "metric"},
+        timeout=timeout
+    )
+    if response.status_code != 200:
+        return None
+    return response.json()
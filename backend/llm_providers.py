@@ -0,0 +1,578 @@
+"""
+Pluggable LLM Providers for CodeCalm
+
+Every completion in the app goes through one provider object chosen by
+LLM_PROVIDER:
+- groq: Groq's OpenAI-compatible chat API (default)
+- ollama: a local Ollama server, for deployments that must run fully local.
+  The model is preloaded at boot and pinned with keep_alive, responses are
+  consumed as a stream (so cancelled calls stop early), and concurrent calls
+  are capped at OLLAMA_NUM_PARALLEL to match the server's parallel slots.
+- stub: an offline, deterministic stand-in for load tests. Replies are derived
+  from the prompt hash, latency and token rate follow configurable
+  distributions, and failures (5xx, 429, timeouts) can be injected so the
+  breaker, rate limiter and fallbacks are exercised without burning quota.
+  Weather and research lookups are stubbed too so every route runs offline.
+
+Providers return a Completion (status code, headers, text or token stream) so
+callers keep their own retry, breaker and rate-limit handling regardless of
+the backend.
+
+Environment Variables:
+- LLM_PROVIDER: groq | ollama | stub (default: groq)
+- OLLAMA_BASE_URL: Ollama server (default: http://localhost:11434)
+- OLLAMA_MODEL: Local model (default: deepseek-r1:1.5b)
+- OLLAMA_KEEP_ALIVE: How long Ollama keeps the model loaded after a call (default: 30m)
+- OLLAMA_NUM_PARALLEL: Concurrent generations per worker; match the server's setting (default: 1)
+- OLLAMA_PRELOAD: Load the model into memory at boot (default: true)
+- OLLAMA_TIMEOUT: Seconds to wait for the next streamed chunk (default: 60)
+- OLLAMA_QUEUE_WAIT: Seconds a call waits for a free slot (default: 30)
+- STUB_LLM_LATENCY: fixed | uniform | lognormal (default: lognormal)
+- STUB_LLM_LATENCY_MS: Median time to first token in ms (default: 300)
+- STUB_LLM_LATENCY_SIGMA: Lognormal sigma, or +/- fraction for uniform (default: 0.5)
+- STUB_LLM_TOKENS_PER_SECOND: Generation speed; 0 disables the delay (default: 250)
+- STUB_LLM_REPLY_TOKENS: Words per reply before max_tokens clamps it (default: 120)
+- STUB_LLM_FAILURE_RATE: Fraction of calls that fail (default: 0)
+- STUB_LLM_FAILURE_MODE: 500 | 429 | timeout (default: 500)
+- STUB_LLM_SEED: Seed for the latency/failure random stream (default: 42)
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import logging
+
+import http_pool
+import think_filter
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+HEALTH_UP = 'up'
+HEALTH_DEGRADED = 'degraded'
+HEALTH_DOWN = 'down'
+
+OLLAMA_FALLBACK_STATUS = 429  # no free slot: same back-pressure path as a Groq 429
+OLLAMA_CANCELLED_STATUS = 499
+
+_STUB_VOCABULARY = (
+    "breathe", "focus", "steady", "progress", "balance", "gentle", "practice",
+    "rest", "energy", "calm", "learn", "growth", "small", "steps", "today",
+    "routine", "mindful", "support", "strength", "clarity", "patience", "habit",
+    "reflect", "notice", "plan", "try", "together", "moment", "kind", "pause"
+)
+
+
+class Completion:
+    """Provider-neutral result of one chat completion call"""
+
+    def __init__(self, status_code, text=None, headers=None, error=None, tokens=None, usage=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.error = error
+        self.tokens = tokens  # iterator of text chunks for streaming calls
+        # Provider-reported prompt_tokens/completion_tokens; for streams it is
+        # filled in once the token iterator is exhausted
+        self.usage = usage
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+
+class LLMProvider:
+    """Interface every provider implements"""
+
+    name = 'base'
+    model = None
+
+    @property
+    def available(self):
+        return True
+
+    def check(self):
+        """Active health probe: 'up', 'degraded' (reachable but failing) or 'down'"""
+        return HEALTH_UP
+
+    def complete(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        """
+        One chat completion; messages are OpenAI-style role/content dicts
+
+        model overrides the provider's default for this call (the cascade's
+        small tier); providers with a single model ignore it.
+        """
+        raise NotImplementedError
+
+    def stream(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        """Like complete(), but Completion.tokens yields text chunks as generated"""
+        raise NotImplementedError
+
+
+# =============================================================================
+# GROQ
+# =============================================================================
+
+class GroqProvider(LLMProvider):
+    """Groq's OpenAI-compatible chat completions API"""
+
+    name = 'groq'
+
+    def __init__(self, api_key, model, api_url=GROQ_API_URL):
+        self.api_key = api_key
+        self.model = model
+        self.api_url = api_url
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    def check(self, timeout=5):
+        """
+        List models instead of running a completion: validates the key and
+        reachability without spending tokens or rate-limit budget
+        """
+        if not self.api_key:
+            return HEALTH_DOWN
+        models_url = self.api_url.rsplit('/chat/completions', 1)[0] + '/models'
+        try:
+            response = http_pool.get(models_url, headers=self._headers(), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️  Groq probe failed: {e}")
+            return HEALTH_DEGRADED
+        if response.status_code == 200:
+            return HEALTH_UP
+        if response.status_code in (401, 403):
+            return HEALTH_DOWN
+        return HEALTH_DEGRADED
+
+    def complete(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        response = http_pool.post(
+            self.api_url,
+            headers=self._headers(),
+            json=self._payload(messages, temperature, max_tokens, model),
+            timeout=timeout
+        )
+        if response.status_code != 200:
+            return Completion(response.status_code, headers=response.headers, error=response.text)
+        result = response.json()
+        text = result['choices'][0]['message']['content'].strip()
+        return Completion(200, text=text, headers=response.headers, usage=result.get('usage'))
+
+    def stream(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        payload = self._payload(messages, temperature, max_tokens, model)
+        payload['stream'] = True
+        payload['stream_options'] = {'include_usage': True}
+        response = http_pool.post(
+            self.api_url,
+            headers=self._headers(),
+            json=payload,
+            timeout=timeout,
+            stream=True
+        )
+        if response.status_code != 200:
+            with response:
+                return Completion(response.status_code, headers=response.headers, error=response.text)
+        completion = Completion(200, headers=response.headers)
+        completion.tokens = self._iter_tokens(response, completion)
+        return completion
+
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _payload(self, messages, temperature, max_tokens, model=None):
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    @staticmethod
+    def _iter_tokens(response, completion):
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    break
+                chunk = json.loads(payload)
+                # Usage arrives on the last chunk (OpenAI style or under x_groq)
+                usage = chunk.get('usage') or (chunk.get('x_groq') or {}).get('usage')
+                if usage:
+                    completion.usage = usage
+                choices = chunk.get('choices') or [{}]
+                token = (choices[0].get('delta') or {}).get('content')
+                if token:
+                    yield token
+
+
+# =============================================================================
+# OLLAMA
+# =============================================================================
+
+class OllamaProvider(LLMProvider):
+    """Local Ollama server with a warm model and bounded concurrency"""
+
+    name = 'ollama'
+
+    def __init__(self, base_url="http://localhost:11434", model="deepseek-r1:1.5b",
+                 keep_alive='30m', num_parallel=1, timeout=60, queue_wait=30):
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.keep_alive = keep_alive
+        self.num_parallel = max(num_parallel, 1)
+        self.timeout = timeout
+        self.queue_wait = queue_wait
+        self._slots = threading.BoundedSemaphore(self.num_parallel)
+        self._lock = threading.Lock()
+        self._reachable = None
+        self._counters = {'calls': 0, 'cancelled': 0, 'busy': 0, 'in_use': 0, 'waiting': 0}
+        self._preload = {'state': 'not_started', 'seconds': None}
+
+    @property
+    def available(self):
+        # Optimistic until a probe says otherwise: never block on the network here
+        return self._reachable is not False
+
+    def check(self):
+        """Probe /api/tags; updates reachability"""
+        try:
+            response = http_pool.get(f"{self.base_url}/api/tags", timeout=2)
+            self._reachable = response.status_code == 200
+        except Exception:
+            self._reachable = False
+        return HEALTH_UP if self._reachable else HEALTH_DOWN
+
+    def preload(self):
+        """Load the model into memory now so the first user call isn't a cold start"""
+        self._preload['state'] = 'loading'
+        started = time.monotonic()
+        try:
+            # An empty message list makes Ollama load the model without generating
+            response = http_pool.post(
+                f"{self.base_url}/api/chat",
+                json={"model": self.model, "messages": [], "keep_alive": self.keep_alive},
+                timeout=max(self.timeout, 120)
+            )
+            ok = response.status_code == 200
+        except Exception as e:
+            logger.warning(f"⚠️  Ollama preload failed: {e}")
+            ok = False
+        self._preload = {
+            'state': 'loaded' if ok else 'failed',
+            'seconds': round(time.monotonic() - started, 2)
+        }
+        if ok:
+            logger.info(f"🔥 Ollama model {self.model} preloaded in {self._preload['seconds']}s "
+                        f"(keep_alive={self.keep_alive})")
+        return ok
+
+    def preload_in_background(self):
+        threading.Thread(target=self.preload, name='ollama-preload', daemon=True).start()
+
+    def complete(self, messages, temperature=0.7, max_tokens=500, timeout=None, model=None, cancel_event=None):
+        completion = self._stream_raw(messages, temperature, max_tokens, timeout, cancel_event)
+        if not completion.ok:
+            return completion
+        text = ''.join(completion.tokens)
+        if cancel_event is not None and cancel_event.is_set():
+            return Completion(OLLAMA_CANCELLED_STATUS, error='cancelled')
+        return Completion(200, text=think_filter.clean(text), usage=completion.usage)
+
+    def stream(self, messages, temperature=0.7, max_tokens=500, timeout=None, model=None, cancel_event=None):
+        """
+        Stream a chat completion with reasoning blocks filtered out as they arrive
+
+        The slot is held until the token iterator ends. Stops reading (and
+        closes the connection, which aborts generation in Ollama) as soon as
+        cancel_event is set.
+        """
+        completion = self._stream_raw(messages, temperature, max_tokens, timeout, cancel_event)
+        if completion.ok:
+            completion.tokens = think_filter.filter_stream(completion.tokens)
+        return completion
+
+    def _stream_raw(self, messages, temperature, max_tokens, timeout, cancel_event):
+        with self._lock:
+            self._counters['waiting'] += 1
+        acquired = self._slots.acquire(timeout=self.queue_wait)
+        with self._lock:
+            self._counters['waiting'] -= 1
+            if not acquired:
+                self._counters['busy'] += 1
+            else:
+                self._counters['calls'] += 1
+                self._counters['in_use'] += 1
+        if not acquired:
+            return Completion(OLLAMA_FALLBACK_STATUS, headers={'retry-after': '1'},
+                              error='All Ollama slots busy')
+
+        try:
+            response = http_pool.post(
+                f"{self.base_url}/api/chat",
+                json={
+                    "model": self.model,
+                    "messages": messages,
+                    "stream": True,
+                    "keep_alive": self.keep_alive,
+                    "options": {"temperature": temperature, "num_predict": max_tokens}
+                },
+                # Read timeout applies between chunks, not to the whole generation
+                timeout=(3, timeout or self.timeout),
+                stream=True
+            )
+        except Exception:
+            self._release()
+            raise
+
+        if response.status_code != 200:
+            with response:
+                error = response.text
+            self._release()
+            return Completion(response.status_code, error=error)
+        completion = Completion(200)
+        completion.tokens = self._iter_tokens(response, cancel_event, completion)
+        return completion
+
+    def stats(self):
+        with self._lock:
+            return {
+                'model': self.model,
+                'reachable': self._reachable,
+                'keep_alive': self.keep_alive,
+                'num_parallel': self.num_parallel,
+                'preload': dict(self._preload),
+                **self._counters
+            }
+
+    def _iter_tokens(self, response, cancel_event, completion):
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel_event is not None and cancel_event.is_set():
+                        with self._lock:
+                            self._counters['cancelled'] += 1
+                        return
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = (chunk.get('message') or {}).get('content')
+                    if token:
+                        yield token
+                    if chunk.get('done'):
+                        completion.usage = {
+                            'prompt_tokens': chunk.get('prompt_eval_count', 0),
+                            'completion_tokens': chunk.get('eval_count', 0)
+                        }
+                        return
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._lock:
+            self._counters['in_use'] -= 1
+        self._slots.release()
+
+
+# =============================================================================
+# STUB
+# =============================================================================
+
+class StubProvider(LLMProvider):
+    """Deterministic offline provider for load tests and benchmarks"""
+
+    name = 'stub'
+
+    def __init__(self, model='codecalm-stub', latency='lognormal', latency_ms=300,
+                 latency_sigma=0.5, tokens_per_second=250, reply_tokens=120,
+                 failure_rate=0.0, failure_mode='500', seed=42):
+        self.model = model
+        self.latency = latency
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'failures': 0}
+
+    def complete(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        first_token, failed = self._sample()
+        words = self._reply_words(messages, max_tokens)
+        duration = first_token + self._generation_time(len(words))
+        if failed or duration > timeout:
+            return self._fail(min(first_token, timeout), timeout, timed_out=not failed)
+        time.sleep(duration)
+        return Completion(200, text=' '.join(words))
+
+    def stream(self, messages, temperature=0.7, max_tokens=500, timeout=30, model=None):
+        first_token, failed = self._sample()
+        if failed or first_token > timeout:
+            return self._fail(min(first_token, timeout), timeout, timed_out=not failed)
+        time.sleep(first_token)
+        words = self._reply_words(messages, max_tokens)
+        per_token = self._generation_time(1)
+
+        def tokens():
+            for i, word in enumerate(words):
+                if per_token:
+                    time.sleep(per_token)
+                yield word if i == 0 else ' ' + word
+
+        return Completion(200, tokens=tokens())
+
+    def weather(self, city):
+        """Stand-in for OpenWeatherMap's current-weather payload"""
+        seed = self._hash(city.lower())
+        conditions = ("Clear", "Clouds", "Rain", "Haze")
+        temp = 12 + seed % 26
+        return {
+            "main": {"temp": temp, "feels_like": temp + 1.5, "humidity": 35 + seed % 55},
+            "weather": [{
+                "main": conditions[seed % len(conditions)],
+                "description": "stubbed conditions",
+                "icon": "01d"
+            }]
+        }
+
+    def research(self, query):
+        """Stand-in for Tavily search results"""
+        digest = f"{self._hash(query):08x}"
+        return [{
+            'title': f"Stub study {digest[:4]}-{i}",
+            'url': f"https://example.org/stub/{digest}/{i}",
+            'content': f"Deterministic research snippet {i} for load testing."
+        } for i in range(3)]
+
+    def stats(self):
+        with self._lock:
+            return {'provider': self.name, **self._counters}
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _sample(self):
+        """Draw (time to first token in seconds, injected failure?) from the seeded stream"""
+        median = self.latency_ms / 1000
+        with self._lock:
+            self._counters['calls'] += 1
+            if self.latency == 'fixed':
+                delay = median
+            elif self.latency == 'uniform':
+                delay = self._rng.uniform(median * (1 - self.latency_sigma), median * (1 + self.latency_sigma))
+            else:
+                delay = self._rng.lognormvariate(0, self.latency_sigma) * median
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self._counters['failures'] += 1
+        return max(delay, 0), failed
+
+    def _fail(self, delay, timeout, timed_out=False):
+        if timed_out or self.failure_mode == 'timeout':
+            time.sleep(timeout if timed_out else min(delay, timeout))
+            raise TimeoutError(f"Stub LLM timed out after {timeout}s")
+        time.sleep(delay)
+        if self.failure_mode == '429':
+            return Completion(429, headers={'retry-after': '1', 'x-ratelimit-remaining-requests': '0',
+                                            'x-ratelimit-reset-requests': '1s'},
+                              error='{"error": "stub rate limit"}')
+        return Completion(500, error='{"error": "stub failure"}')
+
+    def _generation_time(self, n_tokens):
+        if not self.tokens_per_second:
+            return 0
+        return n_tokens / self.tokens_per_second
+
+    def _reply_words(self, messages, max_tokens):
+        prompt = messages[-1]['content'] if messages else ''
+        seed = self._hash(prompt)
+        count = max(min(self.reply_tokens, max_tokens), 1)
+        words = [f"[stub:{seed:08x}]"]
+        for i in range(count - 1):
+            words.append(_STUB_VOCABULARY[(seed + i * 7919) % len(_STUB_VOCABULARY)])
+        return words
+
+    @staticmethod
+    def _hash(text):
+        return int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:8], 16)
+
+
+# =============================================================================
+# SELECTION
+# =============================================================================
+
+_provider = None
+_ollama = None
+_provider_lock = threading.Lock()
+# Separate lock: get_provider() builds the ollama provider while holding _provider_lock
+_ollama_lock = threading.Lock()
+
+
+def ollama_from_env():
+    """Build the Ollama client from OLLAMA_* variables"""
+    return OllamaProvider(
+        base_url=os.getenv('OLLAMA_BASE_URL', "http://localhost:11434"),
+        model=os.getenv('OLLAMA_MODEL', "deepseek-r1:1.5b"),
+        keep_alive=os.getenv('OLLAMA_KEEP_ALIVE', '30m'),
+        num_parallel=int(os.getenv('OLLAMA_NUM_PARALLEL', '1')),
+        timeout=float(os.getenv('OLLAMA_TIMEOUT', '60')),
+        queue_wait=float(os.getenv('OLLAMA_QUEUE_WAIT', '30'))
+    )
+
+
+def get_ollama():
+    """Process-wide Ollama client (shared by LLM_PROVIDER=ollama and hedging)"""
+    global _ollama
+    if _ollama is None:
+        with _ollama_lock:
+            if _ollama is None:
+                _ollama = ollama_from_env()
+    return _ollama
+
+
+def provider_from_env():
+    """Build the provider named by LLM_PROVIDER"""
+    name = os.getenv('LLM_PROVIDER', 'groq').lower()
+    if name == 'ollama':
+        logger.info("🏠 LLM_PROVIDER=ollama - all completions run on the local model")
+        return get_ollama()
+    if name == 'stub':
+        logger.info("🧪 LLM_PROVIDER=stub - all completions are simulated locally")
+        return StubProvider(
+            latency=os.getenv('STUB_LLM_LATENCY', 'lognormal').lower(),
+            latency_ms=float(os.getenv('STUB_LLM_LATENCY_MS', '300')),
+            latency_sigma=float(os.getenv('STUB_LLM_LATENCY_SIGMA', '0.5')),
+            tokens_per_second=float(os.getenv('STUB_LLM_TOKENS_PER_SECOND', '250')),
+            reply_tokens=int(os.getenv('STUB_LLM_REPLY_TOKENS', '120')),
+            failure_rate=float(os.getenv('STUB_LLM_FAILURE_RATE', '0')),
+            failure_mode=os.getenv('STUB_LLM_FAILURE_MODE', '500').lower(),
+            seed=int(os.getenv('STUB_LLM_SEED', '42'))
+        )
+    if name != 'groq':
+        logger.warning(f"⚠️  Unknown LLM_PROVIDER '{name}', using groq")
+    return GroqProvider(
+        api_key=os.getenv('GROQ_API_KEY') or os.getenv('GROQ_API'),
+        model=os.getenv('GROQ_MODEL', "llama-3.3-70b-versatile")
+    )
+
+
+def get_provider():
+    """Process-wide provider shared by main.py and the LangGraph nodes"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = provider_from_env()
+    return _provider
@@ -1,16 +1,23 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, Response, stream_with_context, g, has_request_context
 from flask_cors import CORS
 import os
 import threading
 import json
 import base64
-import re
 import shutil
 import socket
 import subprocess
 import sys
 import atexit
+import time
+import contextvars
 from datetime import datetime, timedelta
+_IMPORT_STARTED = time.monotonic()
+_boot_marks = []
+
+def _boot_phase(name):
+    """End a boot phase; durations are reported in IMPORT_REPORT['phases_ms']"""
+    _boot_marks.append((name, time.monotonic()))
 import logging
 import traceback
 
@@ -25,12 +32,17 @@ CORS(app, origins=["*"])
 # Load environment variables
 from dotenv import load_dotenv
 
+# gunicorn.conf.py sets this when the app is imported once in the master and
+# forked: background threads then start per worker in init_worker()
+PRELOADING = os.getenv('CODECALM_PRELOAD', 'false').lower() == 'true'
+
 # Load env from both project root and backend directory.
 # backend/.env intentionally overrides root .env when both exist.
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
 load_dotenv(os.path.join(PROJECT_ROOT, '.env'), override=False)
 load_dotenv(os.path.join(CURRENT_DIR, '.env'), override=True)
+_boot_phase('app_and_dotenv')
 
 # =================================================================================
 # DATABASE SETUP
@@ -39,43 +51,39 @@ load_dotenv(os.path.join(CURRENT_DIR, '.env'), override=True)
 from database_config import DatabaseConfig
 from models import db, init_db, User, Session, Conversation, Message, RoutingLog
 from auth import auth_bp
-from chat_utils import chat_bp
+from chat_utils import chat_bp, conversation_deleted_hooks
+import job_queue
+import workout_cache
+_boot_phase('app_modules')
 
 # =================================================================================
 # LANGGRAPH DEEP AGENTS
 # =================================================================================
 
-from agent_graph import run_agent, create_agent_graph
-from agent_tools import (
-    get_conversation_history,
-    detect_mood_from_text,
-    add_empathy_markers,
-    format_response_with_emoji
-)
+import agent_loader
 
-# Initialize agent graph globally
-try:
-    AGENT_GRAPH = create_agent_graph()
-    logger.info("✅ LangGraph Deep Agents initialized successfully")
-    USE_LANGGRAPH = True
-except Exception as e:
-    logger.warning(f"⚠️  LangGraph initialization failed: {e}")
-    AGENT_GRAPH = None
-    USE_LANGGRAPH = False
+# langgraph/langchain are only imported when /api/agent/chat first needs them
+# (or by the AGENT_WARMUP hook)
+agent_runtime = agent_loader.loader_from_env()
+_boot_phase('langgraph')
 
 # Configure database
 DatabaseConfig.init_app(app)
 
 # Initialize database with app
 init_db(app)
+_boot_phase('database')
 
 # Register blueprints for API routes
 app.register_blueprint(auth_bp)  # /api/auth/*
 app.register_blueprint(chat_bp)  # /api/chat/*
+job_queue.init_app(app)  # /api/jobs/*
+_boot_phase('blueprints')
 
 logger.info("✅ Database initialized with PostgreSQL")
 logger.info("✅ Authentication routes registered at /api/auth")
 logger.info("✅ Chat routes registered at /api/chat")
+logger.info("✅ Background job routes registered at /api/jobs")
 
 # =================================================================================
 # CODETEST DEV SERVICE ORCHESTRATION
@@ -185,160 +193,399 @@ atexit.register(stop_codetest_services)
 # DUAL AI SETUP: GROQ (CLOUD) + OLLAMA (LOCAL)
 # =================================================================================
 
-import requests
+import http_pool
+from llm_cache import cache_from_env
+from single_flight import single_flight_from_env
+from circuit_breaker import breaker_from_env
+from rate_limiter import scheduler_from_env, RateLimitExceeded, PRIORITY_INTERACTIVE, PRIORITY_BATCH, PRIORITY_JOB
+from hedging import racer_from_env
+import llm_gateway
+import llm_providers
+import token_accounting
+import prompt_messages
+import model_cascade
+import health_prober
+import deadlines
 
 # Groq API Setup
 GROQ_API_KEY = os.getenv('GROQ_API_KEY') or os.getenv('GROQ_API')
-groq_available = bool(GROQ_API_KEY)
 GROQ_MODEL = os.getenv('GROQ_MODEL', "llama-3.3-70b-versatile")
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
-if GROQ_API_KEY:
-    try:
-        # Test Groq API connection
-        test_response = requests.post(
-            GROQ_API_URL,
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": GROQ_MODEL,
-                "messages": [{"role": "user", "content": "test"}],
-                "max_tokens": 10
-            },
-            timeout=10
-        )
-        
-        if test_response.status_code == 200:
-            groq_available = True
-            logger.info(f"✅ Groq API configured with model: {GROQ_MODEL}")
-        else:
-            # Keep runtime attempts enabled even if startup probe fails once.
-            logger.warning(
-                f"⚠️  Groq startup probe failed ({test_response.status_code}); "
-                "will retry on live requests"
-            )
-            groq_available = bool(GROQ_API_KEY)
-            
-    except Exception as e:
-        logger.warning(f"⚠️  Groq startup probe failed: {e}; will retry on live requests")
-        groq_available = bool(GROQ_API_KEY)
-else:
+# Backend for every completion (LLM_PROVIDER=groq|ollama|stub)
+llm_provider = llm_providers.get_provider()
+
+if llm_provider.name == 'groq' and not GROQ_API_KEY:
     logger.warning("⚠️  GROQ_API_KEY (or GROQ_API) not found in .env file")
 
 # Ollama Setup (Local)
-OLLAMA_BASE_URL = "http://localhost:11434"
-OLLAMA_MODEL = "deepseek-r1:1.5b"  # Ultra-lightweight model (1.5B params, ~1.1GB RAM)
-ollama_available = False
+# Shared client: warm model, keep_alive, streamed reads, OLLAMA_NUM_PARALLEL slots
+ollama_client = llm_providers.get_ollama()
+OLLAMA_BASE_URL = ollama_client.base_url
+OLLAMA_MODEL = ollama_client.model  # Default deepseek-r1:1.5b: ultra-lightweight (1.5B params, ~1.1GB RAM)
+
+def _on_ollama_state(name, old, new):
+    # Warm the local model as soon as it is reachable so the first hedge /
+    # local call isn't a cold load
+    if new == health_prober.STATE_UP and os.getenv('OLLAMA_PRELOAD', 'true').lower() != 'false':
+        ollama_client.preload_in_background()
+
+# Provider reachability is probed off the request path; nothing here waits on the network
+provider_health = health_prober.prober_from_env()
+provider_health.register('llm', llm_provider.check, default=llm_provider.available)
+provider_health.register('ollama', ollama_client.check, default=False, on_change=_on_ollama_state)
+if not PRELOADING:
+    provider_health.ensure_started()
+_boot_phase('providers')
+
+@app.before_request
+def ensure_health_prober():
+    # Threads don't survive gunicorn's fork: restart the prober in each worker
+    provider_health.ensure_started()
+    agent_runtime.ensure_warm()
+
+@app.before_request
+def start_request_deadline():
+    # One budget per request; every outbound call gets what is left of it
+    deadlines.start(deadlines.BATCH_SECONDS if request.endpoint in BATCH_ENDPOINTS
+                    else deadlines.REQUEST_SECONDS)
+
+@app.teardown_request
+def clear_request_deadline(exc):
+    deadlines.clear()
+
+def groq_ready():
+    """The completion provider is configured and not known to be down"""
+    return llm_provider.available and provider_health.available('llm')
+
+def ollama_ready():
+    """Local Ollama answered its last probe"""
+    return provider_health.available('ollama')
 
 def check_ollama_connection():
-    """Check if Ollama is running locally"""
-    try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+    """Check if Ollama is running locally (synchronous probe)"""
+    provider_health.probe_now('ollama')
+    return ollama_ready()
+
+def generate_with_ollama(prompt, temperature=0.7, max_tokens=500, cancel_event=None):
+    """Generate response using local Ollama LLM
 
-def generate_with_ollama(prompt, temperature=0.7, max_tokens=500):
-    """Generate response using local Ollama LLM"""
+    prompt is a string or a message list. cancel_event is set by the hedged
+    racer when this answer lost the race; the stream is abandoned as soon as it is.
+    """
     try:
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": temperature,
-                    "num_predict": max_tokens
-                }
-            },
-            timeout=60  # Increased timeout for slower models like DeepSeek
+        messages = prompt_messages.as_messages(prompt)
+        completion = ollama_client.complete(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=deadlines.timeout(ollama_client.timeout, 'ollama'),
+            cancel_event=cancel_event
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            raw_response = result.get('response', '').strip()
-            
-            # Remove ALL thinking patterns from DeepSeek responses
-            # Remove <think>...</think> tags
-            cleaned_response = re.sub(r'<think>.*?</think>', '', raw_response, flags=re.DOTALL)
-            # Remove any remaining XML-like tags
-            cleaned_response = re.sub(r'<[^>]+>', '', cleaned_response, flags=re.DOTALL)
-            # Remove lines that start with thinking indicators
-            cleaned_response = re.sub(r'^(Okay|Alright|So|Hmm|Let me think).*?[.!?]\s*', '', cleaned_response, flags=re.MULTILINE | re.IGNORECASE)
-            cleaned_response = cleaned_response.strip()
-            
-            return cleaned_response if cleaned_response else "Hey there 💙 I'm here for you! Tell me what's on your mind?"
-        else:
+        if not completion.ok:
             return None
+        token_accounting.record(token_accounting.build_usage(
+            ollama_client.model, completion.usage, messages, completion.text
+        ))
+        
+        # Remove ALL thinking patterns from DeepSeek responses (done by the client)
+        return completion.text if completion.text else "Hey there 💙 I'm here for you! Tell me what's on your mind?"
             
+    except deadlines.DeadlineExceeded:
+        return None
     except Exception as e:
+        logger.error(f"Ollama generation error: {e}")
         return None
 
-def generate_with_groq(prompt, temperature=0.7, max_tokens=500):
-    """Generate response using Groq Llama 70b API"""
-    global groq_available
+# Exact-match completion cache (routes opt in with cache=True)
+completion_cache = cache_from_env()
+
+# Identical concurrent prompts share one upstream Groq call
+groq_single_flight = single_flight_from_env()
+
+# Fail fast while Groq is down; timeouts follow observed p99 latency
+groq_breaker = breaker_from_env('Groq', 'GROQ_', max_timeout=30)
+
+# Client-side scheduling against Groq's rate limits
+groq_scheduler = scheduler_from_env()
+
+# How often the static system prefix is resent (provider prefix-cache potential)
+prompt_prefixes = prompt_messages.tracker_from_env()
+
+# tiktoken may download its encoding on first use: do that now, not inside a request
+token_accounting.load_encoding()
+
+# Long, non-interactive generations yield to chat when the bucket runs dry
+BATCH_ENDPOINTS = {'generate_meal_plan', 'generate_workout', 'recommend_weather_foods'}
+
+# Set while a background job runs: nobody is waiting on it, so its calls queue longest
+_job_running = contextvars.ContextVar('codecalm_job_running', default=False)
+
+def _request_priority():
+    """Interactive chat routes outrank batch-like routes, which outrank jobs"""
+    if _job_running.get():
+        return PRIORITY_JOB
+    if not has_request_context() or request.endpoint in BATCH_ENDPOINTS:
+        return PRIORITY_BATCH
+    return PRIORITY_INTERACTIVE
+
+def _signal_backpressure(retry_after):
+    """Ask apply_groq_backpressure to answer 503 + Retry-After for this request"""
+    if has_request_context():
+        g.groq_retry_after = retry_after
+
+def _acquire_groq_slot(messages, max_tokens):
+    """Wait for a rate-limit slot; False (and a 503 signal) when shed"""
     try:
-        if not GROQ_API_KEY:
-            groq_available = False
+        token_cost = prompt_messages.char_count(messages) // 4 + max_tokens
+        groq_scheduler.acquire(_request_priority(), token_cost=token_cost,
+                               max_wait=deadlines.remaining())
+        return True
+    except RateLimitExceeded as e:
+        logger.warning(f"🚦 Groq call shed by rate limiter (retry after {e.retry_after}s)")
+        _signal_backpressure(e.retry_after)
+        return False
+
+def _call_groq(messages, temperature, max_tokens, model=None):
+    """Send one chat completion request to the LLM provider and return its text (or None)"""
+    try:
+        if not groq_ready() or deadlines.expired('groq'):
             return None
-            
-        response = requests.post(
-            GROQ_API_URL,
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": GROQ_MODEL,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            },
-            timeout=30
-        )
         
-        if response.status_code == 200:
-            result = response.json()
-            groq_available = True
-            return result['choices'][0]['message']['content'].strip()
+        if not groq_breaker.allow_request():
+            logger.warning("⚡ Groq circuit open - serving fallback response")
+            return None
+        
+        if not _acquire_groq_slot(messages, max_tokens):
+            groq_breaker.release()
+            return None
+        
+        try:
+            # The scheduler may have queued us: cap the call at what is left now
+            timeout = deadlines.timeout(groq_breaker.current_timeout(max_tokens, model or llm_provider.model), 'groq')
+        except deadlines.DeadlineExceeded:
+            groq_breaker.release()
+            return None
+        
+        prompt_prefixes.observe(messages)
+        started = time.monotonic()
+        completion = llm_provider.complete(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            model=model
+        )
+        groq_scheduler.update_from_headers(completion.headers, completion.status_code)
+        
+        if completion.ok:
+            groq_breaker.record_success(time.monotonic() - started, max_tokens, model or llm_provider.model)
+            provider_health.report('llm', health_prober.STATE_UP)
+            token_accounting.record(token_accounting.build_usage(
+                model or llm_provider.model, completion.usage, messages, completion.text
+            ))
+            return completion.text
         else:
-            logger.error(f"Groq API error: {response.status_code} - {response.text}")
-            if response.status_code in (401, 403):
-                groq_available = False
+            logger.error(f"Groq API error: {completion.status_code} - {completion.error}")
+            if completion.status_code >= 500:
+                groq_breaker.record_failure()
+            else:
+                groq_breaker.record_success()
+            if completion.status_code == 429:
+                _signal_backpressure(groq_scheduler.retry_after())
+            if completion.status_code in (401, 403):
+                provider_health.report('llm', health_prober.STATE_DOWN)
             return None
         
     except Exception as e:
         logger.error(f"Groq generation error: {e}")
+        groq_breaker.record_failure()
         return None
 
-def generate_ai_response(prompt, temperature=0.7, max_tokens=500):
+def generate_with_groq(prompt, temperature=0.7, max_tokens=500, cache=False, model=None):
+    """Generate response using Groq Llama 70b API
+
+    prompt is a string or a message list (system prefix first, then turns).
+    model overrides GROQ_MODEL for this call (the cascade's small tier).
+    cache=True lets byte-identical prompts be answered from completion_cache.
+    Concurrent identical calls are always coalesced into one upstream request;
+    only cache-eligible ones are coalesced across workers (through disk).
+    """
+    messages = prompt_messages.as_messages(prompt)
+    key = completion_cache.make_key(model or llm_provider.model, messages, temperature, max_tokens)
+    use_cache = cache and completion_cache.cacheable(temperature)
+    if use_cache:
+        cached = completion_cache.get(key)
+        if cached is not None:
+            return cached
+    
+    content = groq_single_flight.do(
+        key,
+        lambda: _call_groq(messages, temperature, max_tokens, model),
+        timeout=deadlines.remaining(),
+        across_workers=use_cache
+    )
+    if content and use_cache:
+        completion_cache.set(key, content)
+    return content
+
+def stream_with_groq(prompt, temperature=0.7, max_tokens=500, model=None):
+    """Yield response text from the LLM provider as it is generated (SSE `stream: true` mode)"""
+    messages = prompt_messages.as_messages(prompt)
+    if not groq_ready() or deadlines.expired('groq'):
+        return
+
+    if not groq_breaker.allow_request():
+        logger.warning("⚡ Groq circuit open - serving fallback response")
+        return
+
+    if not _acquire_groq_slot(messages, max_tokens):
+        groq_breaker.release()
+        return
+
+    try:
+        timeout = deadlines.timeout(groq_breaker.current_timeout(max_tokens, model or llm_provider.model), 'groq')
+    except deadlines.DeadlineExceeded:
+        groq_breaker.release()
+        return
+
+    try:
+        prompt_prefixes.observe(messages)
+        # Read timeout between chunks: a long stream may outlive the budget
+        completion = llm_provider.stream(
+            messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            model=model
+        )
+        groq_scheduler.update_from_headers(completion.headers, completion.status_code)
+
+        if not completion.ok:
+            logger.error(f"Groq API error: {completion.status_code} - {completion.error}")
+            if completion.status_code >= 500:
+                groq_breaker.record_failure()
+            else:
+                groq_breaker.record_success()
+            if completion.status_code in (401, 403):
+                provider_health.report('llm', health_prober.STATE_DOWN)
+            return
+
+        # Stream duration isn't comparable to a full completion, so no latency sample
+        groq_breaker.record_success()
+        provider_health.report('llm', health_prober.STATE_UP)
+        parts = []
+        for token in completion.tokens:
+            parts.append(token)
+            yield token
+        token_accounting.record(token_accounting.build_usage(
+            model or llm_provider.model, completion.usage, messages, ''.join(parts)
+        ))
+
+    except Exception as e:
+        logger.error(f"Groq streaming error: {e}")
+        groq_breaker.record_failure()
+
+# LangGraph agent turns take the same guarded path (breaker, rate limiter, deadline, usage)
+agent_runtime.use_llm_calls(generate_with_groq, stream_with_groq)
+
+# Hedged Groq -> Ollama racing for tail latency (LLM_HEDGING=true)
+llm_racer = racer_from_env()
+
+# Small model for simple turns, 70B for code/long context, escalation on weak answers
+llm_cascade = model_cascade.cascade_from_env(llm_provider)
+
+def generate_cascaded(prompt, temperature=0.7, max_tokens=500, cache=False, prefer=None):
+    """generate_with_groq on the tier the cascade picks for this prompt"""
+    messages = prompt_messages.as_messages(prompt)
+    return llm_cascade.complete(
+        messages,
+        lambda model: generate_with_groq(messages, temperature, max_tokens, cache=cache, model=model),
+        prefer=prefer
+    )
+
+def generate_ai_response(prompt, temperature=0.7, max_tokens=500, cache=False):
     """
     Generate AI response using Groq Llama 70b API for Student, Parent, and Professional bots
+
+    prompt is a string or a message list from prompt_messages.build_messages.
+    llm_cascade sends simple turns to the small Groq model. With LLM_HEDGING
+    enabled and Ollama reachable, a slow Groq call is hedged with the local
+    model and whichever answers first is used.
     """
-    # Use Groq API directly (no Ollama)
-    logger.info("☁️  Using Groq Llama 70b (Cloud API)")
-    response = generate_with_groq(prompt, temperature, max_tokens)
-    if response:
-        return response
+    if llm_racer.enabled and ollama_ready() and llm_provider.name == 'groq':
+        response, provider = llm_racer.race(
+            lambda cancel: generate_cascaded(prompt, temperature, max_tokens, cache=cache),
+            lambda cancel: generate_with_ollama(prompt, temperature, max_tokens, cancel_event=cancel)
+        )
+        if response:
+            logger.info(f"🏁 Hedged response served by {provider}")
+            return response
+    else:
+        # Use Groq API directly (no Ollama)
+        logger.info("☁️  Using Groq (Cloud API)")
+        response = generate_cascaded(prompt, temperature, max_tokens, cache=cache)
+        if response:
+            return response
     
     # No AI available
     logger.error("❌ Groq API not available - check GROQ_API_KEY in .env")
     return None
 
-# Check which AI services are available
-ollama_available = check_ollama_connection()
+def stream_ai_response(prompt, temperature=0.7, max_tokens=500):
+    """
+    Streaming variant of generate_ai_response: yields tokens as Groq produces them
+    """
+    logger.info("☁️  Streaming from Groq (Cloud API)")
+    model = llm_cascade.stream_model(prompt_messages.as_messages(prompt))
+    yield from stream_with_groq(prompt, temperature, max_tokens, model=model)
 
-# Student/Parent/Professional bots now use ONLY Groq API
-if groq_available:
-    logger.info("✅ Groq Llama 70b API configured for Student/Parent/Professional bots")
+def wants_job(data):
+    """True when the client asked for a long generation to run as a background job"""
+    flag = data.get('async', request.args.get('async', False))
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def wants_stream(data):
+    """True when the client opted into Server-Sent-Events streaming"""
+    flag = data.get('stream', request.args.get('stream', False))
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(tokens, build_final):
+    """
+    Forward a token iterator to the browser as Server-Sent Events
+
+    Emits one `token` event per chunk, then a `done` event whose payload is
+    build_final(full_text) - the same body the JSON variant of the route returns.
+    """
+    def generate():
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield _sse_event('token', {'token': token})
+        yield _sse_event('done', build_final(''.join(parts).strip()))
+
+    return sse_events_response(generate())
+
+def sse_events_response(events):
+    """Stream already-formatted SSE events (or an iterator of (event, payload) pairs)"""
+    formatted = (e if isinstance(e, str) else _sse_event(*e) for e in events)
+    return Response(
+        stream_with_context(formatted),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Student/Parent/Professional bots now use ONLY Groq API (reachability is reported by provider_health)
+if llm_provider.available:
+    logger.info(f"✅ {llm_provider.name} ({llm_provider.model}) configured for Student/Parent/Professional bots")
 else:
     logger.warning("⚠️  Groq API not available - check GROQ_API_KEY in .env")
 
 # Set model flag for health checks
-model = bool(GROQ_API_KEY)
+model = llm_provider.available
 
 if not model:
     logger.error("❌ GROQ API NOT AVAILABLE! Add GROQ_API_KEY to .env")
@@ -356,21 +603,9 @@ logger.info("ℹ️  Using browser-based speech recognition and TTS")
 # STUDENT ASSISTANT (MAYA) CLASS
 # =================================================================================
 
-class VoiceAssistant:
-    def __init__(self):
-        self.conversation_history = []
-        self.student_context = {
-            'mood': 'sad',
-            'problems': [],
-            'session_start': datetime.now().isoformat()
-        }
-        
-    def get_motivational_prompt(self, user_message, context):
-        """Generate a context-aware prompt for Maya"""
-        mood = context.get('mood', 'neutral')
-        problems = context.get('problems', [])
-        
-        base_prompt = f"""You are Maya 💙, an empathetic AI study companion for students who provides ACTIONABLE help.
+# Static instructions: sent as a byte-identical system message every turn so
+# the provider can reuse the cached prefix; per-turn context goes last
+MAYA_SYSTEM_PROMPT = """You are Maya 💙, an empathetic AI study companion for students who provides ACTIONABLE help.
 
 YOUR ROLE:
 - Help students with exam preparation, study plans, time management
@@ -386,15 +621,32 @@ CRITICAL RULES:
 3. For subject help: Break topics into chapters/concepts to focus on
 4. For stress: Provide breathing exercises, break schedules, etc.
 5. Be warm but PRACTICAL - always end with next steps
-6. NO thinking out loud ("Okay, so", "Let me think")
+6. NO thinking out loud ("Okay, so", "Let me think")"""
 
-Current student mood: {mood}
-Known issues: {', '.join(problems) if problems else 'None yet'}
-
-Student message: "{user_message}"
-
-Provide actionable help as Maya (2-3 sentences max, with specific steps):"""
-        return base_prompt
+class VoiceAssistant:
+    def __init__(self):
+        self.conversation_history = []
+        self.student_context = {
+            'mood': 'sad',
+            'problems': [],
+            'session_start': datetime.now().isoformat()
+        }
+        
+    def get_motivational_prompt(self, user_message, context):
+        """Generate context-aware chat messages for Maya"""
+        mood = context.get('mood', 'neutral')
+        problems = context.get('problems', [])
+        
+        return prompt_messages.build_messages(
+            MAYA_SYSTEM_PROMPT,
+            user_message,
+            # No history: this assistant is one global object shared by every
+            # user, so its conversation_history mixes different people's chats
+            context=f"""Current student mood: {mood}
+Known issues: {', '.join(problems) if problems else 'None yet'}""",
+            user_label='Student message',
+            closing="Provide actionable help as Maya (2-3 sentences max, with specific steps):"
+        )
     
     def get_conversation_summary(self):
         """Get a summary of recent conversation"""
@@ -414,8 +666,8 @@ Provide actionable help as Maya (2-3 sentences max, with specific steps):"""
         
         try:
             self.update_context(user_message)
-            prompt = self.get_motivational_prompt(user_message, self.student_context)
-            ai_message = generate_ai_response(prompt, temperature=0.8, max_tokens=300)
+            messages = self.get_motivational_prompt(user_message, self.student_context)
+            ai_message = generate_ai_response(messages, temperature=0.8, max_tokens=300)
             
             if not ai_message:
                 return "I hear you 💕 It sounds like you're going through something tough. I'm here to listen - want to tell me more about how you're feeling?"
@@ -433,6 +685,36 @@ Provide actionable help as Maya (2-3 sentences max, with specific steps):"""
             logger.error(f"AI generation error: {e}")
             return "Hey, I'm having a little technical hiccup, but I'm still here for you 💙 Whatever you're dealing with, you're not alone. Tell me what's going on?"
     
+    def stream_ai_response(self, user_message):
+        """Yield Maya's response token by token, recording it once complete"""
+        if not model:
+            yield "Hey there 💙 I'm Maya, and I'm here for you. Sometimes things feel overwhelming, but you're not alone in this. Want to share what's been on your mind?"
+            return
+        
+        parts = []
+        try:
+            self.update_context(user_message)
+            messages = self.get_motivational_prompt(user_message, self.student_context)
+            for token in stream_ai_response(messages, temperature=0.8, max_tokens=300):
+                parts.append(token)
+                yield token
+            
+            ai_message = ''.join(parts).strip()
+            if not ai_message:
+                yield "I hear you 💕 It sounds like you're going through something tough. I'm here to listen - want to tell me more about how you're feeling?"
+                return
+            
+            self.conversation_history.append({
+                'user': user_message,
+                'assistant': ai_message,
+                'timestamp': datetime.now().isoformat()
+            })
+            
+        except Exception as e:
+            logger.error(f"AI streaming error: {e}")
+            if not parts:
+                yield "Hey, I'm having a little technical hiccup, but I'm still here for you 💙 Whatever you're dealing with, you're not alone. Tell me what's going on?"
+    
     def update_context(self, user_message):
         """Update student context based on their message"""
         message_lower = user_message.lower()
@@ -464,36 +746,9 @@ Provide actionable help as Maya (2-3 sentences max, with specific steps):"""
 # PARENT ASSISTANT (PARENTBOT) CLASS  
 # =================================================================================
 
-class ParentAssistant:
-    def __init__(self):
-        self.conversation_history = []
-        self.parent_context = {
-            'current_task': None,
-            'todo_list': [],
-            'meal_preferences': [],
-            'kids_ages': [],
-            'session_start': datetime.now().isoformat()
-        }
-        self.task_categories = {
-            'meal_planner': 'meal planning and cooking assistance',
-            'todo_list': 'personalized todo list creation',
-            'parenting_tips': 'parenting guidance from expert books',
-            'bedtime_stories': 'creative bedtime stories for kids',
-            'money_management': 'financial planning and money psychology'
-        }
-    
-    def get_specialized_prompt(self, user_message, context):
-        """Generate specialized prompts based on task type"""
-        task_type = self.detect_task_type(user_message)
-        
-        base_info = f"""You are ParentBot, a helpful AI assistant specifically designed for busy parents in India. 
+PARENTBOT_SYSTEM_PROMPT = """You are ParentBot, a helpful AI assistant specifically designed for busy parents in India. 
 You have expertise in meal planning, parenting, child psychology, financial management, and family organization.
 
-Parent Context:
-- Current task focus: {context.get('current_task', 'general assistance')}
-- Todo items: {len(context.get('todo_list', []))} items
-- Session started: {context.get('session_start')}
-
 Guidelines:
 1. Be warm, supportive, and understanding of parenting challenges
 2. Provide practical, actionable advice suitable for Indian families
@@ -501,26 +756,18 @@ Guidelines:
 4. Consider Indian dietary preferences and available ingredients
 5. Be concise but comprehensive in your responses
 6. Ask follow-up questions when needed for better assistance"""
-        
-        if task_type == 'meal_planner':
-            return base_info + f"""
 
-MEAL PLANNING EXPERT MODE:
+# task type -> (mode instructions appended to the system prompt, message label, closing cue)
+PARENTBOT_MODES = {
+    'meal_planner': ("""MEAL PLANNING EXPERT MODE:
 - Provide detailed ingredient lists with quantities
 - Include prep time, cooking time, and total time
 - Suggest Indian breakfast, lunch, dinner options
 - Consider vegetarian/non-vegetarian preferences
 - Include nutritional benefits when relevant
-- Suggest seasonal and locally available ingredients
-
-User query: "{user_message}"
-
-Provide detailed meal planning assistance:"""
-            
-        elif task_type == 'todo_list':
-            return base_info + f"""
-
-TODO LIST EXPERT MODE:
+- Suggest seasonal and locally available ingredients""",
+        'User query', "Provide detailed meal planning assistance:"),
+    'todo_list': ("""TODO LIST EXPERT MODE:
 You MUST create an actual checklist-style todo list, not explanations or questions.
 
 ALWAYS format your response as a proper checklist using this exact format:
@@ -534,62 +781,73 @@ Rules:
 - Make tasks actionable and specific
 - Keep tasks realistic for a parent
 - Don't ask questions - just create the list
-- If request is vague, create a general daily routine checklist
-
-User request: "{user_message}"
-
-Create a checklist-format todo list NOW:"""
-            
-        elif task_type == 'parenting_tips':
-            return base_info + f"""
-
-PARENTING EXPERT MODE:
+- If request is vague, create a general daily routine checklist""",
+        'User request', "Create a checklist-format todo list NOW:"),
+    'parenting_tips': ("""PARENTING EXPERT MODE:
 Draw insights from renowned parenting books like:
 - "The 7 Habits of Highly Effective People" by Stephen Covey
 - "How to Win Friends and Influence People" by Dale Carnegie
 - "Parenting with Love and Logic" by Foster Cline
 - "The Power of Positive Parenting" by Glenn Latham
-- Indian parenting wisdom and cultural values
-
-User question: "{user_message}"
-
-Provide evidence-based parenting guidance:"""
-            
-        elif task_type == 'bedtime_stories':
-            return base_info + f"""
-
-STORYTELLER MODE:
+- Indian parenting wisdom and cultural values""",
+        'User question', "Provide evidence-based parenting guidance:"),
+    'bedtime_stories': ("""STORYTELLER MODE:
 - Create engaging, age-appropriate bedtime stories
 - Include moral lessons and positive values
 - Make stories interactive and imaginative
 - Consider Indian cultural elements when appropriate
-- Keep stories calming and suitable for bedtime
-
-Story request: "{user_message}"
-
-Create a wonderful bedtime story:"""
-            
-        elif task_type == 'money_management':
-            return base_info + f"""
-
-FINANCIAL ADVISOR MODE:
+- Keep stories calming and suitable for bedtime""",
+        'Story request', "Create a wonderful bedtime story:"),
+    'money_management': ("""FINANCIAL ADVISOR MODE:
 Draw insights from financial wisdom books like:
 - "The Psychology of Money" by Morgan Housel
 - "Rich Dad Poor Dad" by Robert Kiyosaki
 - "The Intelligent Investor" by Benjamin Graham
 - Indian financial planning and investment strategies
-- Family budgeting and expense management
-
-Financial query: "{user_message}"
-
-Provide practical financial guidance for families:"""
-        
-        else:
-            return base_info + f"""
+- Family budgeting and expense management""",
+        'Financial query', "Provide practical financial guidance for families:"),
+    'general': (None, 'Parent just said', "Provide helpful parenting assistance:"),
+}
 
-Parent just said: "{user_message}"
+class ParentAssistant:
+    def __init__(self):
+        self.conversation_history = []
+        self.parent_context = {
+            'current_task': None,
+            'todo_list': [],
+            'meal_preferences': [],
+            'kids_ages': [],
+            'session_start': datetime.now().isoformat()
+        }
+        self.task_categories = {
+            'meal_planner': 'meal planning and cooking assistance',
+            'todo_list': 'personalized todo list creation',
+            'parenting_tips': 'parenting guidance from expert books',
+            'bedtime_stories': 'creative bedtime stories for kids',
+            'money_management': 'financial planning and money psychology'
+        }
+    
+    def get_specialized_prompt(self, user_message, context):
+        """Generate specialized chat messages based on task type
 
-Provide helpful parenting assistance:"""
+        Each task type has its own fixed system prompt (base guidelines plus
+        mode instructions), so every parent in the same mode shares a prefix.
+        """
+        task_type = self.detect_task_type(user_message)
+        mode, label, closing = PARENTBOT_MODES[task_type]
+        system = PARENTBOT_SYSTEM_PROMPT + ("\n\n" + mode if mode else "")
+        
+        return prompt_messages.build_messages(
+            system,
+            user_message,
+            # No history: this assistant is one global object shared by every
+            # user, so its conversation_history mixes different people's chats
+            context=f"""Parent Context:
+- Current task focus: {context.get('current_task', 'general assistance')}
+- Todo items: {len(context.get('todo_list', []))} items""",
+            user_label=label,
+            closing=closing
+        )
     
     def detect_task_type(self, message):
         """Detect what type of assistance the parent needs"""
@@ -618,8 +876,10 @@ Provide helpful parenting assistance:"""
         
         try:
             self.update_context(user_message)
-            prompt = self.get_specialized_prompt(user_message, self.parent_context)
-            ai_message = generate_ai_response(prompt, temperature=0.7, max_tokens=400)
+            messages = self.get_specialized_prompt(user_message, self.parent_context)
+            # Generic prompts repeat across parents; specialised modes stay uncached
+            cacheable = self.parent_context['current_task'] == 'general'
+            ai_message = generate_ai_response(messages, temperature=0.7, max_tokens=400, cache=cacheable)
             
             if not ai_message:
                 return "I'm having trouble processing that right now. Could you please try asking again? I'm here to help with meal planning, todo lists, parenting tips, bedtime stories, or money management."
@@ -638,6 +898,37 @@ Provide helpful parenting assistance:"""
             logger.error(f"AI generation error: {e}")
             return "I'm having trouble processing that right now. Could you please try asking again? I'm here to help with meal planning, todo lists, parenting tips, bedtime stories, or money management."
     
+    def stream_ai_response(self, user_message):
+        """Yield ParentBot's response token by token, recording it once complete"""
+        if not model:
+            yield "I'm having some technical difficulties, but I'm here to help you with parenting tasks. What do you need assistance with?"
+            return
+        
+        parts = []
+        try:
+            self.update_context(user_message)
+            messages = self.get_specialized_prompt(user_message, self.parent_context)
+            for token in stream_ai_response(messages, temperature=0.7, max_tokens=400):
+                parts.append(token)
+                yield token
+            
+            ai_message = ''.join(parts).strip()
+            if not ai_message:
+                yield "I'm having trouble processing that right now. Could you please try asking again? I'm here to help with meal planning, todo lists, parenting tips, bedtime stories, or money management."
+                return
+            
+            self.conversation_history.append({
+                'user': user_message,
+                'assistant': ai_message,
+                'timestamp': datetime.now().isoformat(),
+                'task_type': self.detect_task_type(user_message)
+            })
+            
+        except Exception as e:
+            logger.error(f"AI streaming error: {e}")
+            if not parts:
+                yield "I'm having trouble processing that right now. Could you please try asking again? I'm here to help with meal planning, todo lists, parenting tips, bedtime stories, or money management."
+    
     def update_context(self, user_message):
         """Update parent context based on their message"""
         task_type = self.detect_task_type(user_message)
@@ -655,6 +946,25 @@ Provide helpful parenting assistance:"""
 # WORKING PROFESSIONAL ASSISTANT (LUNA) CLASS
 # =================================================================================
 
+LUNA_SYSTEM_PROMPT = """You are Luna 💼, an AI workplace wellness coach who provides PRACTICAL solutions.
+
+YOUR EXPERTISE:
+- Work-life balance strategies and time management
+- Stress reduction techniques (breathing, breaks, boundaries)
+- Communication scripts for difficult conversations
+- Productivity tips and focus techniques
+- Burnout prevention and recovery plans
+- Career growth and professional development
+
+CRITICAL RULES:
+1. Provide ACTIONABLE advice with specific steps
+2. For stress: Give immediate coping techniques + long-term strategies
+3. For conflicts: Suggest communication templates/scripts
+4. For burnout: Create recovery action plans with timelines
+5. For productivity: Share proven techniques (Pomodoro, time-blocking, etc.)
+6. Be professional yet empathetic - focus on solutions
+7. NO vague advice - always include concrete next steps"""
+
 class LunaProfessionalAssistant:
     def __init__(self):
         self.conversation_history = []
@@ -670,36 +980,20 @@ class LunaProfessionalAssistant:
         self.is_listening = False
         
     def get_professional_prompt(self, user_message, context):
-        """Generate a context-aware prompt for Luna"""
+        """Generate context-aware chat messages for Luna"""
         stress_level = context.get('stress_level', 'moderate')
         work_issues = context.get('work_issues', [])
         
-        base_prompt = f"""You are Luna 💼, an AI workplace wellness coach who provides PRACTICAL solutions.
-
-YOUR EXPERTISE:
-- Work-life balance strategies and time management
-- Stress reduction techniques (breathing, breaks, boundaries)
-- Communication scripts for difficult conversations
-- Productivity tips and focus techniques
-- Burnout prevention and recovery plans
-- Career growth and professional development
-
-CRITICAL RULES:
-1. Provide ACTIONABLE advice with specific steps
-2. For stress: Give immediate coping techniques + long-term strategies
-3. For conflicts: Suggest communication templates/scripts
-4. For burnout: Create recovery action plans with timelines
-5. For productivity: Share proven techniques (Pomodoro, time-blocking, etc.)
-6. Be professional yet empathetic - focus on solutions
-7. NO vague advice - always include concrete next steps
-
-Current stress level: {stress_level}
-Known issues: {', '.join(work_issues) if work_issues else 'General workplace wellness'}
-
-Professional's message: "{user_message}"
-
-Provide practical workplace wellness advice (2-3 sentences with actionable steps):"""
-        return base_prompt
+        return prompt_messages.build_messages(
+            LUNA_SYSTEM_PROMPT,
+            user_message,
+            # No history: this assistant is one global object shared by every
+            # user, so its conversation_history mixes different people's chats
+            context=f"""Current stress level: {stress_level}
+Known issues: {', '.join(work_issues) if work_issues else 'General workplace wellness'}""",
+            user_label="Professional's message",
+            closing="Provide practical workplace wellness advice (2-3 sentences with actionable steps):"
+        )
     
     def get_conversation_summary(self):
         """Get a summary of recent conversation"""
@@ -719,9 +1013,9 @@ Provide practical workplace wellness advice (2-3 sentences with actionable steps
         
         try:
             self.update_professional_context(user_message)
-            prompt = self.get_professional_prompt(user_message, self.professional_context)
+            messages = self.get_professional_prompt(user_message, self.professional_context)
             
-            ai_message = generate_ai_response(prompt, temperature=0.75, max_tokens=350)
+            ai_message = generate_ai_response(messages, temperature=0.75, max_tokens=350)
             
             if not ai_message:
                 return "I'm having some technical difficulties, but I want you to know I'm here to support your professional wellness journey. Could you tell me more about what's challenging you at work today?"
@@ -739,6 +1033,36 @@ Provide practical workplace wellness advice (2-3 sentences with actionable steps
             logger.error(f"AI generation error: {e}")
             return f"I'm having some technical difficulties, but I want you to know I'm here to support your professional wellness journey. Could you tell me more about what's challenging you at work today?"
     
+    def stream_ai_response(self, user_message):
+        """Yield Luna's response token by token, recording it once complete"""
+        if not model:
+            yield "I'm experiencing some technical difficulties with my AI processing, but I'm still here to support you. What specific workplace challenge are you facing today?"
+            return
+        
+        parts = []
+        try:
+            self.update_professional_context(user_message)
+            messages = self.get_professional_prompt(user_message, self.professional_context)
+            for token in stream_ai_response(messages, temperature=0.75, max_tokens=350):
+                parts.append(token)
+                yield token
+            
+            ai_message = ''.join(parts).strip()
+            if not ai_message:
+                yield "I'm having some technical difficulties, but I want you to know I'm here to support your professional wellness journey. Could you tell me more about what's challenging you at work today?"
+                return
+            
+            self.conversation_history.append({
+                'user': user_message,
+                'assistant': ai_message,
+                'timestamp': datetime.now().isoformat()
+            })
+            
+        except Exception as e:
+            logger.error(f"AI streaming error: {e}")
+            if not parts:
+                yield "I'm having some technical difficulties, but I want you to know I'm here to support your professional wellness journey. Could you tell me more about what's challenging you at work today?"
+    
     def update_professional_context(self, user_message):
         """Update professional context based on message analysis"""
         message_lower = user_message.lower()
@@ -892,6 +1216,74 @@ def serve_audio(filename):
     """Serve audio files from audio folder"""
     return send_from_directory('../audio', filename)
 
+# =================================================================================
+# SAVED BOT CONVERSATIONS (Maya / ParentBot / Luna)
+# =================================================================================
+
+def request_user_id():
+    """User id of the request's valid Bearer session, or None"""
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        session = Session.query.filter_by(session_token=auth_header.split(' ')[1]).first()
+        if session and session.is_valid():
+            return session.user_id
+    return None
+
+def answered_model():
+    """Model that served this request: the cascade's tier when it routed the call"""
+    route = model_cascade.request_route()
+    return route['model'] if route else llm_provider.model
+
+def save_bot_exchange(assistant_type, conversation_id, user_message, ai_response, usage):
+    """
+    Save one turn for a logged-in user, with the reply's real token count
+
+    Returns:
+        The conversation id, or None when nothing was saved (anonymous user,
+        empty reply or a database error)
+    """
+    user_id = request_user_id()
+    if not user_id or not ai_response:
+        return None
+    try:
+        conversation = None
+        if conversation_id:
+            conversation = Conversation.query.filter_by(
+                id=conversation_id,
+                user_id=user_id,
+                assistant_type=assistant_type
+            ).filter(Conversation.deleted_at.is_(None)).first()
+        
+        if not conversation:
+            conversation_title = user_message[:50] + "..." if len(user_message) > 50 else user_message
+            conversation = Conversation(
+                user_id=user_id,
+                assistant_type=assistant_type,
+                title=conversation_title
+            )
+            db.session.add(conversation)
+            db.session.flush()
+        
+        db.session.add(Message(
+            conversation_id=conversation.id,
+            sender='user',
+            content=user_message
+        ))
+        db.session.add(Message(
+            conversation_id=conversation.id,
+            sender='assistant',
+            content=ai_response,
+            model_used=usage.get('model'),
+            tokens=usage['total_tokens']
+        ))
+        conversation.updated_at = datetime.utcnow()
+        db.session.commit()
+        return conversation.id
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Failed to save {assistant_type} messages: {e}")
+        return None
+
 # =================================================================================
 # STUDENT API ROUTES
 # =================================================================================
@@ -933,7 +1325,7 @@ def listen_to_student():
 
 @app.route('/api/student/respond', methods=['POST'])
 def respond_to_student():
-    """Generate AI response to student message"""
+    """Generate AI response to student message (pass "stream": true for SSE)"""
     try:
         data = request.get_json()
         user_message = data.get('message', '')
@@ -945,19 +1337,29 @@ def respond_to_student():
                 'error': 'No message provided'
             })
         
-        ai_response = voice_assistant.generate_ai_response(user_message)
-        
         voice_response = "use_browser_tts" if enable_voice else None
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'voice_response': voice_response,
-            'has_voice': voice_response is not None,
-            'use_browser_tts': True,
-            'conversation_count': len(voice_assistant.conversation_history),
-            'student_context': voice_assistant.student_context
-        })
+        def build_payload(ai_response):
+            usage = token_accounting.request_usage(answered_model(), completion=ai_response)
+            return {
+                'success': True,
+                'response': ai_response,
+                'voice_response': voice_response,
+                'has_voice': voice_response is not None,
+                'use_browser_tts': True,
+                'conversation_count': len(voice_assistant.conversation_history),
+                'student_context': voice_assistant.student_context,
+                'usage': usage,
+                'conversation_id': save_bot_exchange('student', data.get('conversation_id'),
+                                                     user_message, ai_response, usage)
+            }
+        
+        if wants_stream(data):
+            return sse_response(voice_assistant.stream_ai_response(user_message), build_payload)
+        
+        ai_response = voice_assistant.generate_ai_response(user_message)
+        
+        return jsonify(build_payload(ai_response))
         
     except Exception as e:
         logger.error(f"Response generation error: {e}")
@@ -1005,7 +1407,7 @@ def listen_to_parent():
 
 @app.route('/api/parent/respond', methods=['POST'])
 def respond_to_parent():
-    """Generate AI response to parent message"""
+    """Generate AI response to parent message (pass "stream": true for SSE)"""
     try:
         data = request.get_json()
         user_message = data.get('message', '')
@@ -1017,20 +1419,30 @@ def respond_to_parent():
                 'error': 'No message provided'
             })
         
-        ai_response = parent_assistant.generate_ai_response(user_message)
-        
         voice_response = "use_browser_tts" if enable_voice else None
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'voice_response': voice_response,
-            'has_voice': voice_response is not None,
-            'use_browser_tts': True,
-            'task_type': parent_assistant.detect_task_type(user_message),
-            'conversation_count': len(parent_assistant.conversation_history),
-            'parent_context': parent_assistant.parent_context
-        })
+        def build_payload(ai_response):
+            usage = token_accounting.request_usage(answered_model(), completion=ai_response)
+            return {
+                'success': True,
+                'response': ai_response,
+                'voice_response': voice_response,
+                'has_voice': voice_response is not None,
+                'use_browser_tts': True,
+                'task_type': parent_assistant.detect_task_type(user_message),
+                'conversation_count': len(parent_assistant.conversation_history),
+                'parent_context': parent_assistant.parent_context,
+                'usage': usage,
+                'conversation_id': save_bot_exchange('parent', data.get('conversation_id'),
+                                                     user_message, ai_response, usage)
+            }
+        
+        if wants_stream(data):
+            return sse_response(parent_assistant.stream_ai_response(user_message), build_payload)
+        
+        ai_response = parent_assistant.generate_ai_response(user_message)
+        
+        return jsonify(build_payload(ai_response))
         
     except Exception as e:
         logger.error(f"Parent response generation error: {e}")
@@ -1074,7 +1486,7 @@ def start_workplace_session():
 
 @app.route('/api/professional/respond', methods=['POST'])
 def respond_to_professional():
-    """Generate response to professional's message"""
+    """Generate response to professional's message (pass "stream": true for SSE)"""
     try:
         data = request.get_json() or {}
         user_message = data.get('message', '').strip()
@@ -1085,13 +1497,23 @@ def respond_to_professional():
                 'error': 'No message provided'
             })
         
+        def build_payload(ai_response):
+            usage = token_accounting.request_usage(answered_model(), completion=ai_response)
+            return {
+                'success': True,
+                'response': ai_response,
+                'professional_context': luna_assistant.professional_context,
+                'usage': usage,
+                'conversation_id': save_bot_exchange('professional', data.get('conversation_id'),
+                                                     user_message, ai_response, usage)
+            }
+        
+        if wants_stream(data):
+            return sse_response(luna_assistant.stream_ai_response(user_message), build_payload)
+        
         ai_response = luna_assistant.generate_ai_response(user_message)
         
-        return jsonify({
-            'success': True,
-            'response': ai_response,
-            'professional_context': luna_assistant.professional_context
-        })
+        return jsonify(build_payload(ai_response))
         
     except Exception as e:
         logger.error(f"Professional response error: {e}")
@@ -1127,11 +1549,19 @@ def health_check():
         'service': 'CodeCalm AI Mental Wellness Platform',
         'status': 'healthy',
         'ai_backend': {
-            'ollama_local': ollama_available,
-            'ollama_model': OLLAMA_MODEL if ollama_available else 'not available',
-            'groq_cloud': groq_available,
-            'groq_model': GROQ_MODEL if groq_available else 'not available',
-            'active_mode': 'Ollama (Local)' if ollama_available else f'Groq {GROQ_MODEL} (Cloud)' if groq_available else 'None'
+            'ollama_local': ollama_ready(),
+            'ollama_model': OLLAMA_MODEL if ollama_ready() else 'not available',
+            'ollama': ollama_client.stats(),
+            'groq_cloud': groq_ready(),
+            'groq_model': GROQ_MODEL if groq_ready() else 'not available',
+            'provider_health': provider_health.snapshot(),
+            'llm_provider': llm_provider.name,
+            'groq_circuit': groq_breaker.snapshot(),
+            'groq_rate_limit': groq_scheduler.stats(),
+            'hedging': llm_racer.stats(),
+            'model_cascade': llm_cascade.stats(),
+            'prompt_prefixes': prompt_prefixes.stats(),
+            'active_mode': 'Ollama (Local)' if llm_provider.name == 'ollama' else f'Groq {GROQ_MODEL} (Cloud)' if groq_ready() else 'None'
         },
         'components': {
             'ai_model': model is not None,
@@ -1139,6 +1569,14 @@ def health_check():
             'text_to_speech': 'browser-based'
         },
         'services': ['student', 'parent', 'professional'],
+        'http_pool': http_pool.pool_stats(),
+        'llm_cache': completion_cache.stats(),
+        'single_flight': groq_single_flight.stats(),
+        'job_queue': job_queue.get_queue().stats(),
+        'workout_cache': workout_plans.stats(),
+        'deadlines': deadlines.stats(),
+        'agent_runtime': agent_runtime.stats(),
+        'boot': IMPORT_REPORT,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -1227,9 +1665,9 @@ def get_conversation_history(service):
 
 # Token tracking for analytics
 token_usage = {
-    'claude': {'total_tokens': 0, 'queries': 0, 'reasons': []},
-    'gpt': {'total_tokens': 0, 'queries': 0, 'reasons': []},
-    'gemini': {'total_tokens': 0, 'queries': 0, 'reasons': []}
+    name: {'total_tokens': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0,
+           'queries': 0, 'reasons': []}
+    for name in ('claude', 'gpt', 'gemini')
 }
 
 # Motivational facts
@@ -1276,19 +1714,7 @@ def classify_query(user_message):
         reason = "General conversation - Gemini offers efficient responses for casual queries"
         return 'gemini', reason
 
-def get_llm_response_openrouter(model_name, messages, conversation_state):
-    """
-    Route CodeGent through Groq.
-
-    The UI still keeps Claude/GPT/Gemini routing buckets for analytics, but
-    the actual generation uses the single GROQ_API_KEY backend.
-    Returns: tuple (response_text, tokens_used, reasoning)
-    """
-    
-    # Determine teaching mode based on conversation progress
-    teaching_mode = "guiding" if conversation_state.get('step', 0) < 3 else "solution-ready"
-    
-    system_prompt = f"""You are CodeGent, a Socratic coding tutor. Your mission is to help users LEARN, not just solve problems.
+CODEGENT_SYSTEM_PROMPT = """You are CodeGent, a Socratic coding tutor. Your mission is to help users LEARN, not just solve problems.
 
 TEACHING PHILOSOPHY:
 1. **Never give direct answers initially** - Guide with questions
@@ -1304,11 +1730,6 @@ Step 3: "That's right! Which programming construct lets us repeat actions multip
 Step 4: "Perfect! Let's build the code together. What should be our starting point?"
 Step 5: [Only after understanding] "Here's the complete solution with explanations..."
 
-CURRENT STATE:
-- Teaching mode: {teaching_mode}
-- Conversation step: {conversation_state.get('step', 0)}
-- User understanding level: {conversation_state.get('understanding', 'exploring')}
-
 RESPONSE RULES:
 - If step < 3: Ask guiding questions, give hints
 - If step >= 3 and user understands: Provide code with detailed explanations
@@ -1317,18 +1738,41 @@ RESPONSE RULES:
 - After providing solution, ask "Would you like to optimize this?" or "Want to understand the complexity?"
 """
 
+def get_llm_response_openrouter(model_name, messages, conversation_state):
+    """
+    Route CodeGent through Groq.
+
+    The UI still keeps Claude/GPT/Gemini routing buckets for analytics, but
+    the actual generation uses the single GROQ_API_KEY backend.
+    The static tutor prompt leads as the system message and the history is
+    sent as real turns; the per-step teaching state rides just before the
+    latest user turn so the shared prefix stays cacheable.
+    Returns: tuple (response_text, tokens_used, reasoning)
+    """
+    
+    # Determine teaching mode based on conversation progress
+    teaching_mode = "guiding" if conversation_state.get('step', 0) < 3 else "solution-ready"
+    
+    state_prompt = f"""CURRENT STATE:
+- Teaching mode: {teaching_mode}
+- Conversation step: {conversation_state.get('step', 0)}
+- User understanding level: {conversation_state.get('understanding', 'exploring')}"""
+
     try:
-        formatted_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages:
+        formatted_messages = [{"role": "system", "content": CODEGENT_SYSTEM_PROMPT}]
+        for msg in messages[:-1]:
             formatted_messages.append({
                 "role": msg['role'],
                 "content": msg['content']
             })
+        formatted_messages.append({"role": "system", "content": state_prompt})
+        formatted_messages.extend(messages[-1:])
 
-        prompt = "\n".join([f"{m['role']}: {m['content']}" for m in formatted_messages])
-        content = generate_with_groq(prompt, temperature=0.7, max_tokens=1500)
+        # Solution-ready turns hand out code: always the large model
+        prefer = model_cascade.TIER_LARGE if teaching_mode == "solution-ready" else None
+        content = generate_cascaded(formatted_messages, temperature=0.7, max_tokens=1500, prefer=prefer)
         if content:
-            tokens = int((len(prompt.split()) + len(content.split())) * 1.3)
+            tokens = token_accounting.request_usage(answered_model(), formatted_messages, content)['total_tokens']
             return content, tokens, f"Groq powered {model_name.upper()} route"
 
         return ("Groq is unavailable. Please check GROQ_API_KEY in backend/.env and try again."), 0, "Groq unavailable"
@@ -1340,13 +1784,11 @@ RESPONSE RULES:
 def fallback_to_gemini(messages):
     """Fallback to Groq if OpenRouter fails"""
     try:
-        if GROQ_API_KEY:
-            # Convert messages to a single prompt for Groq
-            prompt = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-            response_text = generate_with_groq(prompt, temperature=0.7, max_tokens=1500)
+        if llm_provider.available:
+            response_text = generate_with_groq(messages, temperature=0.7, max_tokens=1500)
             if response_text:
-                tokens = len(prompt.split()) * 1.3
-                return response_text, int(tokens), "Fallback to Groq due to API error"
+                tokens = token_accounting.request_usage(answered_model(), messages, response_text)['total_tokens']
+                return response_text, tokens, "Fallback to Groq due to API error"
         
         return ("I apologize, but I'm having trouble connecting to the AI services. "
                "Please check your API keys in the .env file."), 0, "API Error"
@@ -1367,13 +1809,7 @@ def codegent_chat():
             return jsonify({'error': 'No message provided'}), 400
         
         # Get user session (if authenticated)
-        user_id = None
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            session_token = auth_header.split(' ')[1]
-            session = Session.query.filter_by(session_token=session_token).first()
-            if session and session.is_valid():
-                user_id = session.user_id
+        user_id = request_user_id()
         
         # Create or get conversation if user is authenticated
         conversation = None
@@ -1410,9 +1846,15 @@ def codegent_chat():
         messages.append({'role': 'user', 'content': user_message})
         
         # Get response from selected LLM
+        started = time.monotonic()
         response_text, tokens_used, execution_info = get_llm_response_openrouter(
             selected_model, messages, conversation_state
         )
+        latency_ms = int((time.monotonic() - started) * 1000)
+        route = model_cascade.request_route() or {'tier': None, 'model': llm_provider.model, 'reason': None}
+        usage = token_accounting.request_usage(route['model'], messages, response_text)
+        if tokens_used:
+            tokens_used = usage['total_tokens']
         
         # Save messages to database if user is authenticated
         if user_id and conversation:
@@ -1441,7 +1883,13 @@ def codegent_chat():
                     message_id=None,  # Will be set after commit
                     selected_model=selected_model,
                     query_type=routing_reason,
-                    reasoning=routing_reason
+                    latency_ms=latency_ms,
+                    prompt_tokens=usage['prompt_tokens'],
+                    completion_tokens=usage['completion_tokens'],
+                    cost_estimate=usage['cost_usd'],
+                    model_tier=route['tier'],
+                    model_name=route['model'],
+                    reasoning=f"{routing_reason} | {route['reason']}" if route['reason'] else routing_reason
                 )
                 db.session.add(routing_log)
                 
@@ -1460,11 +1908,17 @@ def codegent_chat():
         
         # Update token tracking
         token_usage[selected_model]['total_tokens'] += tokens_used
+        token_usage[selected_model]['prompt_tokens'] += usage['prompt_tokens']
+        token_usage[selected_model]['completion_tokens'] += usage['completion_tokens']
+        token_usage[selected_model]['cost_usd'] += usage['cost_usd']
         token_usage[selected_model]['queries'] += 1
         token_usage[selected_model]['reasons'].append({
             'query': user_message[:50] + '...' if len(user_message) > 50 else user_message,
             'reason': routing_reason,
+            'tier': route['tier'],
             'tokens': tokens_used,
+            'cost_usd': usage['cost_usd'],
+            'latency_ms': latency_ms,
             'timestamp': datetime.now().isoformat()
         })
         
@@ -1484,7 +1938,10 @@ def codegent_chat():
             'response': response_text,
             'model_used': selected_model,
             'routing_reason': routing_reason,
+            'model_tier': route['tier'],
+            'llm_model': route['model'],
             'tokens_used': tokens_used,
+            'usage': usage,
             'motivational_fact': motivational_fact,
             'state': conversation_state,
             'conversation_id': conversation.id if conversation else None,
@@ -1505,6 +1962,7 @@ def codegent_stats():
         # Calculate total tokens across all models
         total_tokens = sum(model['total_tokens'] for model in token_usage.values())
         total_queries = sum(model['queries'] for model in token_usage.values())
+        total_cost = sum(model['cost_usd'] for model in token_usage.values())
         
         # Calculate model distribution percentages
         model_distribution = {}
@@ -1514,6 +1972,9 @@ def codegent_stats():
                 'percentage': round(percentage, 2),
                 'queries': data['queries'],
                 'tokens': data['total_tokens'],
+                'prompt_tokens': data['prompt_tokens'],
+                'completion_tokens': data['completion_tokens'],
+                'cost_usd': round(data['cost_usd'], 6),
                 'avg_tokens_per_query': round(data['total_tokens'] / data['queries'], 2) if data['queries'] > 0 else 0
             }
         
@@ -1523,6 +1984,7 @@ def codegent_stats():
             'summary': {
                 'total_tokens': total_tokens,
                 'total_queries': total_queries,
+                'total_cost_usd': round(total_cost, 6),
                 'model_distribution': model_distribution
             },
             'timestamp': datetime.now().isoformat()
@@ -1621,55 +2083,88 @@ class FitnessBot:
 
 fitness_bot = FitnessBot()
 
+RESEARCH_DOMAINS = ["pubmed.gov", "nih.gov", "strongerbyscience.com", "examine.com", "ncbi.nlm.nih.gov"]
+RESEARCH_SITE_FILTER = " site:pubmed.gov OR site:nih.gov OR site:strongerbyscience.com OR site:examine.com"
+
+def _format_research(results):
+    """Trim raw Tavily results to title/url/snippet"""
+    return [{
+        'title': r.get('title', ''),
+        'url': r.get('url', ''),
+        'snippet': r.get('content', '')[:200]
+    } for r in results[:3]]
+
 def search_fitness_research(query):
     """Search for fitness research using Tavily API"""
+    if llm_provider.name == 'stub':
+        return _format_research(llm_provider.research(query))
     if not tavily_available:
         return []
     
     try:
-        response = requests.post(
+        # Research is optional: never spend the budget the LLM call needs
+        timeout = deadlines.timeout(10, 'tavily', reserve=deadlines.LLM_RESERVE_SECONDS)
+        response = http_pool.post(
             "https://api.tavily.com/search",
             json={
                 "api_key": TAVILY_API_KEY,
-                "query": query + " site:pubmed.gov OR site:nih.gov OR site:strongerbyscience.com OR site:examine.com",
+                "query": query + RESEARCH_SITE_FILTER,
                 "search_depth": "advanced",
                 "max_results": 3,
-                "include_domains": ["pubmed.gov", "nih.gov", "strongerbyscience.com", "examine.com", "ncbi.nlm.nih.gov"]
+                "include_domains": RESEARCH_DOMAINS
             },
-            timeout=10
+            timeout=timeout
         )
         
         if response.status_code == 200:
             data = response.json()
-            results = data.get('results', [])
-            return [{
-                'title': r.get('title', ''),
-                'url': r.get('url', ''),
-                'snippet': r.get('content', '')[:200]
-            } for r in results[:3]]
+            return _format_research(data.get('results', []))
+        return []
+    except deadlines.DeadlineExceeded:
         return []
     except Exception as e:
         logger.error(f"Tavily search error: {e}")
         return []
 
-def generate_workout_plan(user_profile):
-    """Generate personalized workout plan using Groq"""
+async def search_fitness_research_async(query):
+    """Async search_fitness_research for llm_gateway.gather()"""
+    if llm_provider.name == 'stub':
+        return _format_research(llm_provider.research(query))
+    if not tavily_available:
+        return []
+    
     try:
-        fitness_level = user_profile.get('fitness_level', 'beginner').lower()
-        goal = user_profile.get('goal', 'general fitness')
-        equipment = user_profile.get('equipment', [])
-        limitations = user_profile.get('limitations', 'none')
-        
-        # Search for research
-        research_query = f"{goal} training protocol evidence-based 2025"
-        research_results = search_fitness_research(research_query)
-        
-        research_context = "\n".join([
-            f"- {r['title']}: {r['snippet']} [Source: {r['url']}]"
-            for r in research_results
-        ]) if research_results else "Use general evidence-based fitness principles."
-        
-        prompt = f"""You are FitnessBot, an expert AI fitness coach. Create a detailed workout plan.
+        results = await llm_gateway.tavily_search(
+            query + RESEARCH_SITE_FILTER,
+            TAVILY_API_KEY,
+            include_domains=RESEARCH_DOMAINS,
+            max_results=3,
+            timeout=deadlines.timeout(10, 'tavily', reserve=deadlines.LLM_RESERVE_SECONDS)
+        )
+        return _format_research(results)
+    except deadlines.DeadlineExceeded:
+        return []
+    except Exception as e:
+        logger.error(f"Tavily search error: {e}")
+        return []
+
+def build_workout_plan(user_profile):
+    """Generate a workout plan with Tavily research + Groq (uncached)"""
+    fitness_level = user_profile.get('fitness_level', 'beginner').lower()
+    goal = user_profile.get('goal', 'general fitness')
+    equipment = user_profile.get('equipment', [])
+    limitations = user_profile.get('limitations', 'none')
+    
+    # Search for research
+    research_query = f"{goal} training protocol evidence-based 2025"
+    research_results = search_fitness_research(research_query)
+    
+    research_context = "\n".join([
+        f"- {r['title']}: {r['snippet']} [Source: {r['url']}]"
+        for r in research_results
+    ]) if research_results else "Use general evidence-based fitness principles."
+    
+    prompt = f"""You are FitnessBot, an expert AI fitness coach. Create a detailed workout plan.
 
 User Profile:
 - Fitness Level: {fitness_level}
@@ -1689,12 +2184,21 @@ Create a complete workout plan with:
 
 Format as clear sections. Be specific with numbers."""
 
-        response = generate_with_groq(prompt, temperature=0.7, max_tokens=1200)
-        
-        return {
-            'workout_plan': response,
-            'research_sources': research_results
-        }
+    response = generate_with_groq(prompt, temperature=0.7, max_tokens=1200)
+    
+    return {
+        'workout_plan': response,
+        'research_sources': research_results
+    }
+
+# Plans for common (level, goal, equipment) buckets are prebuilt and refreshed in the background;
+# the warmer starts on the first lookup and one worker per host does the warming
+workout_plans = workout_cache.cache_from_env(build_workout_plan)
+
+def generate_workout_plan(user_profile):
+    """Generate personalized workout plan using Groq (served from workout_plans when warm)"""
+    try:
+        return workout_plans.get(user_profile)
         
     except Exception as e:
         logger.error(f"Workout generation error: {e}")
@@ -1843,7 +2347,7 @@ Provide:
 
 Be concise but thorough."""
 
-            bot_response = generate_with_groq(prompt, temperature=0.7, max_tokens=500)
+            bot_response = generate_with_groq(prompt, temperature=0.7, max_tokens=500, cache=True)
             
             # Detect exercise for animation
             exercises = ['squat', 'push-up', 'pushup', 'lunge', 'plank', 'deadlift', 'bicep curl', 'bench press']
@@ -1886,22 +2390,31 @@ Respond helpfully and encouragingly. If they ask about nutrition, workouts, or f
             'response': "I'm having trouble processing that. Could you rephrase?"
         }), 500
 
+def build_workout(data, profile):
+    """Body for /api/fitness/generate-workout (also run as a `workout` job)"""
+    workout_type = data.get('type', 'strength')
+    duration = data.get('duration', 45)
+    
+    workout_data = generate_workout_plan(profile)
+    
+    return {
+        'success': True,
+        'workout': workout_data['workout_plan'],
+        'sources': workout_data['research_sources'],
+        'duration': duration
+    }, 200
+
 @app.route('/api/fitness/generate-workout', methods=['POST'])
 def generate_workout():
-    """Generate specific workout plan"""
+    """Generate specific workout plan (`async: true` queues it as a job)"""
     try:
         data = request.get_json()
-        workout_type = data.get('type', 'strength')
-        duration = data.get('duration', 45)
+        if wants_job(data):
+            # Snapshot the profile: the bot's profile may change before the job runs
+            return job_queue.submit_response('workout', {**data, 'profile': dict(fitness_bot.user_profile)})
         
-        workout_data = generate_workout_plan(fitness_bot.user_profile)
-        
-        return jsonify({
-            'success': True,
-            'workout': workout_data['workout_plan'],
-            'sources': workout_data['research_sources'],
-            'duration': duration
-        })
+        body, status = build_workout(data, fitness_bot.user_profile)
+        return jsonify(body), status
         
     except Exception as e:
         logger.error(f"Workout generation error: {e}")
@@ -2085,33 +2598,67 @@ class WeatherFoodBot:
 
 weather_food_bot = WeatherFoodBot()
 
+def _format_weather(city, data):
+    """Reduce an OpenWeatherMap payload to the fields the bots use"""
+    return {
+        "city": city,
+        "temp": round(data["main"]["temp"], 1),
+        "feels_like": round(data["main"]["feels_like"], 1),
+        "humidity": data["main"]["humidity"],
+        "condition": data["weather"][0]["main"],
+        "description": data["weather"][0]["description"],
+        "icon": data["weather"][0]["icon"]
+    }
+
 def get_weather_data(city="Rayagada"):
     """Fetch current weather from OpenWeatherMap"""
+    if llm_provider.name == 'stub':
+        return _format_weather(city, llm_provider.weather(city))
     if not weather_available:
         return None
     
     try:
         url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric"
-        response = requests.get(url, timeout=10)
+        response = http_pool.get(url, timeout=deadlines.timeout(10, 'weather'))
         
         if response.status_code == 200:
-            data = response.json()
-            return {
-                "city": city,
-                "temp": round(data["main"]["temp"], 1),
-                "feels_like": round(data["main"]["feels_like"], 1),
-                "humidity": data["main"]["humidity"],
-                "condition": data["weather"][0]["main"],
-                "description": data["weather"][0]["description"],
-                "icon": data["weather"][0]["icon"]
-            }
+            return _format_weather(city, response.json())
+        return None
+    except deadlines.DeadlineExceeded:
         return None
     except Exception as e:
         logger.error(f"Weather API error: {e}")
         return None
 
-def generate_food_recommendations(user_prefs, weather_data):
-    """Generate intelligent food recommendations using Groq + research"""
+async def get_weather_data_async(city="Rayagada"):
+    """Async get_weather_data for llm_gateway.gather()"""
+    if llm_provider.name == 'stub':
+        return _format_weather(city, llm_provider.weather(city))
+    if not weather_available:
+        return None
+    
+    try:
+        data = await llm_gateway.openweather_current(
+            city, OPENWEATHER_API_KEY, timeout=deadlines.timeout(10, 'weather')
+        )
+        return _format_weather(city, data) if data else None
+    except deadlines.DeadlineExceeded:
+        return None
+    except Exception as e:
+        logger.error(f"Weather API error: {e}")
+        return None
+
+def food_research_query(diet_type, goal):
+    """Research query for food recommendations (independent of the weather lookup)"""
+    return f"best {diet_type} foods for seasonal weather {goal} nutrition 2025"
+
+def generate_food_recommendations(user_prefs, weather_data, research_results=None):
+    """
+    Generate intelligent food recommendations using Groq + research
+
+    Pass research_results when the caller already fetched them (concurrently
+    with the weather) to skip the sequential Tavily search.
+    """
     try:
         diet_type = user_prefs.get('diet_type', 'vegetarian')
         goal = user_prefs.get('goal', 'general health')
@@ -2128,8 +2675,8 @@ def generate_food_recommendations(user_prefs, weather_data):
         base_foods = weather_food_bot.get_weather_based_foods(weather_category, diet_type, goal)
         
         # Research for scientific backing
-        research_query = f"best {diet_type} foods for {weather_data['condition']} weather {goal} nutrition 2025"
-        research_results = search_fitness_research(research_query)
+        if research_results is None:
+            research_results = search_fitness_research(food_research_query(diet_type, goal))
         
         research_context = "\n".join([
             f"- {r['title']}: {r['snippet']}"
@@ -2165,6 +2712,9 @@ Provide 8-10 detailed food recommendations with:
 Format as clear sections. Be specific with nutritional values."""
 
         response = generate_with_groq(prompt, temperature=0.7, max_tokens=1500)
+        if not response and deadlines.expired():
+            # Out of time for the LLM: the weather-matched base list still answers the question
+            response = "Quick picks for today's weather: " + ", ".join(f['name'] for f in base_foods)
         
         return {
             'recommendations': response,
@@ -2208,47 +2758,58 @@ def get_weather():
             'error': str(e)
         }), 500
 
+def build_food_recommendations(data):
+    """Body for /api/weather-food/recommend (also run as a `food_recommendations` job)"""
+    diet_type = data.get('diet_type', 'vegetarian')
+    goal = data.get('goal', 'general health')
+    restrictions = data.get('restrictions', 'none')
+    city = data.get('city', 'Rayagada')
+    
+    # Store preferences
+    weather_food_bot.user_preferences = {
+        'diet_type': diet_type,
+        'goal': goal,
+        'restrictions': restrictions
+    }
+    
+    # Weather and research don't depend on each other: fetch them concurrently
+    weather_data, research_results = llm_gateway.gather(
+        get_weather_data_async(city),
+        search_fitness_research_async(food_research_query(diet_type, goal))
+    )
+    
+    if not weather_data:
+        return {
+            'success': False,
+            'error': 'Unable to fetch weather data'
+        }, 500
+    
+    # Generate recommendations
+    recommendations = generate_food_recommendations(
+        weather_food_bot.user_preferences,
+        weather_data,
+        research_results=research_results or []
+    )
+    
+    return {
+        'success': True,
+        'weather': weather_data,
+        'recommendations': recommendations['recommendations'],
+        'base_foods': recommendations['base_foods'],
+        'research_sources': recommendations['research_sources'],
+        'weather_category': recommendations['weather_category']
+    }, 200
+
 @app.route('/api/weather-food/recommend', methods=['POST'])
 def recommend_weather_foods():
-    """Recommend foods based on weather and user preferences"""
+    """Recommend foods based on weather and user preferences (`async: true` queues it as a job)"""
     try:
         data = request.get_json()
+        if wants_job(data):
+            return job_queue.submit_response('food_recommendations', data)
         
-        diet_type = data.get('diet_type', 'vegetarian')
-        goal = data.get('goal', 'general health')
-        restrictions = data.get('restrictions', 'none')
-        city = data.get('city', 'Rayagada')
-        
-        # Store preferences
-        weather_food_bot.user_preferences = {
-            'diet_type': diet_type,
-            'goal': goal,
-            'restrictions': restrictions
-        }
-        
-        # Get weather
-        weather_data = get_weather_data(city)
-        
-        if not weather_data:
-            return jsonify({
-                'success': False,
-                'error': 'Unable to fetch weather data'
-            }), 500
-        
-        # Generate recommendations
-        recommendations = generate_food_recommendations(
-            weather_food_bot.user_preferences,
-            weather_data
-        )
-        
-        return jsonify({
-            'success': True,
-            'weather': weather_data,
-            'recommendations': recommendations['recommendations'],
-            'base_foods': recommendations['base_foods'],
-            'research_sources': recommendations['research_sources'],
-            'weather_category': recommendations['weather_category']
-        })
+        body, status = build_food_recommendations(data)
+        return jsonify(body), status
         
     except Exception as e:
         logger.error(f"Food recommendation endpoint error: {e}")
@@ -2257,28 +2818,24 @@ def recommend_weather_foods():
             'error': str(e)
         }), 500
 
-@app.route('/api/weather-food/meal-plan', methods=['POST'])
-def generate_meal_plan():
-    """Generate complete day meal plan based on weather"""
-    try:
-        data = request.get_json()
-        
-        diet_type = data.get('diet_type', 'vegetarian')
-        goal = data.get('goal', 'general health')
-        city = data.get('city', 'Rayagada')
-        calorie_target = data.get('calorie_target', 2000)
-        
-        # Get weather
-        weather_data = get_weather_data(city)
-        
-        if not weather_data:
-            return jsonify({
-                'success': False,
-                'error': 'Unable to fetch weather data'
-            }), 500
-        
-        # Generate meal plan with Groq
-        prompt = f"""Create a complete day meal plan for:
+def build_meal_plan(data):
+    """Body for /api/weather-food/meal-plan (also run as a `meal_plan` job)"""
+    diet_type = data.get('diet_type', 'vegetarian')
+    goal = data.get('goal', 'general health')
+    city = data.get('city', 'Rayagada')
+    calorie_target = data.get('calorie_target', 2000)
+    
+    # Get weather
+    weather_data = get_weather_data(city)
+    
+    if not weather_data:
+        return {
+            'success': False,
+            'error': 'Unable to fetch weather data'
+        }, 500
+    
+    # Generate meal plan with Groq
+    prompt = f"""Create a complete day meal plan for:
 
 Diet: {diet_type}
 Goal: {goal}
@@ -2294,13 +2851,24 @@ Provide:
 
 Adjust meals for current weather conditions. Include total calories and macros."""
 
-        meal_plan = generate_with_groq(prompt, temperature=0.7, max_tokens=1500)
+    meal_plan = generate_with_groq(prompt, temperature=0.7, max_tokens=1500)
+    
+    return {
+        'success': True,
+        'weather': weather_data,
+        'meal_plan': meal_plan
+    }, 200
+
+@app.route('/api/weather-food/meal-plan', methods=['POST'])
+def generate_meal_plan():
+    """Generate complete day meal plan based on weather (`async: true` queues it as a job)"""
+    try:
+        data = request.get_json()
+        if wants_job(data):
+            return job_queue.submit_response('meal_plan', data)
         
-        return jsonify({
-            'success': True,
-            'weather': weather_data,
-            'meal_plan': meal_plan
-        })
+        body, status = build_meal_plan(data)
+        return jsonify(body), status
         
     except Exception as e:
         logger.error(f"Meal plan error: {e}")
@@ -2309,6 +2877,36 @@ Adjust meals for current weather conditions. Include total calories and macros."
             'error': str(e)
         }), 500
 
+def _job_handler(build, result_field):
+    """
+    Adapt a build_* route body into a job handler
+
+    Non-200 bodies fail the job, and so does a missing completion in
+    result_field (shed, breaker open, Groq error): a route serves that as a
+    degraded answer, but a job would otherwise be stored as an empty success.
+    """
+    def handler(payload):
+        running = _job_running.set(True)
+        try:
+            with deadlines.scope(deadlines.JOB_SECONDS):
+                body, status = build(payload)
+        finally:
+            _job_running.reset(running)
+        if status != 200:
+            raise RuntimeError(body.get('error', f'HTTP {status}'))
+        if not body.get(result_field):
+            raise RuntimeError('LLM completion unavailable (rate limited or Groq down); resubmit later')
+        return body
+    return handler
+
+# Long generations that can run off the request path (POST /api/jobs or `async: true`)
+job_queue.get_queue().register('meal_plan', _job_handler(build_meal_plan, 'meal_plan'))
+job_queue.get_queue().register('food_recommendations', _job_handler(build_food_recommendations, 'recommendations'))
+job_queue.get_queue().register('workout', _job_handler(
+    lambda payload: build_workout(payload, payload.get('profile') or fitness_bot.user_profile),
+    'workout'
+))
+
 # =================================================================================
 # LANGGRAPH UNIFIED AGENT ENDPOINT
 # =================================================================================
@@ -2337,17 +2935,14 @@ def langgraph_agent_chat():
             agent_type = 'student'
         
         # Get user session (if authenticated)
-        user_id = None
-        auth_header = request.headers.get('Authorization')
-        if auth_header and auth_header.startswith('Bearer '):
-            session_token = auth_header.split(' ')[1]
-            session = Session.query.filter_by(session_token=session_token).first()
-            if session and session.is_valid():
-                user_id = session.user_id
+        user_id = request_user_id()
+        
+        agents = agent_runtime.load()
         
         # Get or create conversation
         conversation = None
         conversation_history = []
+        checkpoint_version = None  # conversation.updated_at the context was loaded at
         
         if user_id:
             if conversation_id:
@@ -2355,11 +2950,17 @@ def langgraph_agent_chat():
                 conversation = Conversation.query.filter_by(
                     id=conversation_id,
                     user_id=user_id
-                ).first()
+                ).filter(Conversation.deleted_at.is_(None)).first()
                 
-                if conversation:
-                    # Get conversation history for context
-                    conversation_history = get_conversation_history(conversation_id, limit=10)
+                if conversation and agents:
+                    # Context comes from the local checkpoint; SQL is read to seed one, or to
+                    # reseed it when the conversation changed outside this route
+                    checkpoint_key = agents.checkpoint_key(conversation)
+                    checkpoint_version = agents.checkpoint_version(conversation)
+                    conversation_history = agents.checkpoints.load(checkpoint_key, checkpoint_version, limit=10)
+                    if conversation_history is None:
+                        conversation_history = agents.tools.get_conversation_history(conversation.id, limit=10)
+                        agents.checkpoints.seed(checkpoint_key, conversation_history, checkpoint_version)
             
             if not conversation:
                 # Create new conversation
@@ -2367,15 +2968,14 @@ def langgraph_agent_chat():
                 conversation = Conversation(
                     user_id=user_id,
                     assistant_type=agent_type,
-                    title=conversation_title,
-                    agent_type=agent_type
+                    title=conversation_title
                 )
                 db.session.add(conversation)
                 db.session.commit()
                 conversation_id = conversation.id
         
         # Detect mood for enhanced empathy
-        mood = detect_mood_from_text(user_message)
+        mood = agents.tools.detect_mood_from_text(user_message) if agents else 'neutral'
         
         # Build context
         context = {
@@ -2384,30 +2984,43 @@ def langgraph_agent_chat():
         }
         
         # Check if LangGraph is available
-        if USE_LANGGRAPH and GROQ_API_KEY:
+        if agents and llm_provider.available:
             logger.info(f"🚀 Using LangGraph for {agent_type} agent")
-            
-            # Run LangGraph agent
-            result = run_agent(
+            run_kwargs = dict(
                 user_input=user_message,
                 user_type=agent_type,
                 conversation_history=conversation_history,
                 context=context
             )
             
-            if result.get('success'):
+            def finish(result):
+                """Post-process a finished agent run into the response body and persist it"""
+                if not result.get('success'):
+                    logger.warning(f"⚠️  LangGraph failed: {result.get('error')}")
+                    return {
+                        'success': True,
+                        'response': result.get('response', "I'm here for you! Tell me more. 💙"),
+                        'agent_type': agent_type,
+                        'conversation_id': conversation_id,
+                        'framework': 'langgraph'
+                    }
                 bot_response = result['response']
                 
                 # Enhance response with empathy markers
-                bot_response = add_empathy_markers(bot_response, mood)
-                bot_response = format_response_with_emoji(bot_response, agent_type)
+                bot_response = agents.tools.add_empathy_markers(bot_response, mood)
+                bot_response = agents.tools.format_response_with_emoji(bot_response, agent_type)
+                
+                # Agent LLM calls go through the guarded path, which accumulates usage on g
+                usage = token_accounting.request_usage(
+                    result.get('metadata', {}).get('model'), prompt=user_message, completion=bot_response
+                )
                 
                 # Save message to database if user is authenticated
                 if conversation:
                     # Save user message
                     user_msg = Message(
                         conversation_id=conversation.id,
-                        role='user',
+                        sender='user',
                         content=user_message
                     )
                     db.session.add(user_msg)
@@ -2415,27 +3028,51 @@ def langgraph_agent_chat():
                     # Save assistant message
                     assistant_msg = Message(
                         conversation_id=conversation.id,
-                        role='assistant',
-                        content=bot_response
+                        sender='assistant',
+                        content=bot_response,
+                        model_used=usage.get('model') or result.get('metadata', {}).get('model'),
+                        tokens=usage['total_tokens']
                     )
                     db.session.add(assistant_msg)
                     
                     # Update conversation timestamp
-                    conversation.last_activity = datetime.utcnow()
+                    conversation.updated_at = datetime.utcnow()
                     
                     db.session.commit()
+                    
+                    # Append just this turn to the agent checkpoint
+                    agents.checkpoints.append_turn(
+                        agents.checkpoint_key(conversation), user_message, bot_response,
+                        agents.checkpoint_version(conversation), checkpoint_version
+                    )
                 
-                return jsonify({
+                return {
                     'success': True,
                     'response': bot_response,
                     'agent_type': agent_type,
                     'conversation_id': conversation_id,
-                    'metadata': result.get('metadata', {})
-                })
-            else:
-                # LangGraph failed, use fallback
-                logger.warning(f"⚠️  LangGraph failed: {result.get('error')}")
-                bot_response = result.get('response', "I'm here for you! Tell me more. 💙")
+                    'metadata': result.get('metadata', {}),
+                    'usage': usage
+                }
+            
+            if wants_stream(data):
+                # node/token events while the graph runs; `done` carries the
+                # post-processed (empathy + emoji) reply, which replaces the raw tokens
+                def events():
+                    for event, payload in agents.graph_module.stream_agent(**run_kwargs):
+                        if event == 'result':
+                            try:
+                                yield 'done', finish(payload)
+                            except Exception as e:
+                                logger.error(f"❌ Agent stream finalisation error: {e}")
+                                yield 'done', {'success': False, 'error': str(e),
+                                               'response': "I'm here for you! Let's try that again. 💙"}
+                        else:
+                            yield event, payload
+                return sse_events_response(events())
+            
+            # Run LangGraph agent
+            return jsonify(finish(agents.graph_module.run_agent(**run_kwargs)))
         else:
             # Fallback to direct Groq call
             logger.info(f"ℹ️  Using fallback Groq for {agent_type} agent")
@@ -2451,7 +3088,7 @@ def langgraph_agent_chat():
             }
             
             prompt = f"{system_prompts.get(agent_type, system_prompts['student'])}\n\nUser: {user_message}\n\nRespond warmly in 2-3 sentences."
-            bot_response = generate_with_groq(prompt, temperature=0.7, max_tokens=300)
+            bot_response = generate_with_groq(prompt, temperature=0.7, max_tokens=300, cache=True)
             
             if not bot_response:
                 bot_response = "I'm here for you! Could you tell me more? 💙"
@@ -2461,7 +3098,7 @@ def langgraph_agent_chat():
             'response': bot_response,
             'agent_type': agent_type,
             'conversation_id': conversation_id,
-            'framework': 'langgraph' if USE_LANGGRAPH else 'fallback'
+            'framework': 'langgraph' if agents else 'fallback'
         })
         
     except Exception as e:
@@ -2474,6 +3111,14 @@ def langgraph_agent_chat():
             'response': "I'm here for you! Let's try that again. 💙"
         }), 500
 
+def forget_agent_checkpoint(conversation):
+    """A deleted conversation's messages must not stay in (or be replayed from) the checkpoint file"""
+    agents = agent_runtime.load()
+    if agents:
+        agents.checkpoints.forget(agents.checkpoint_key(conversation))
+
+conversation_deleted_hooks.append(forget_agent_checkpoint)
+
 
 # =================================================================================
 # CORS AND SERVER ROUTES
@@ -2486,13 +3131,53 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+@app.after_request
+def apply_groq_backpressure(response):
+    """Answer 503 + Retry-After when the Groq rate limiter shed this request's call"""
+    retry_after = g.pop('groq_retry_after', None)
+    if retry_after and not response.is_streamed:
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(retry_after))
+    return response
+
+def init_worker():
+    """
+    Recreate per-process resources in a freshly forked worker
+
+    Called from gunicorn.conf.py's post_fork hook under preload. Pooled DB
+    connections and HTTP sockets opened by the master must not be shared, and
+    threads don't survive fork.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    http_pool.reset_sessions()
+    provider_health.ensure_started()
+    agent_runtime.ensure_warm()
+    token_accounting.load_encoding()  # no-op when the master loaded it; retries a failed load
+
+# Import-time report: what building the app cost this process
+_boot_phase('routes')
+IMPORT_REPORT = {
+    'import_ms': round((time.monotonic() - _IMPORT_STARTED) * 1000),
+    'phases_ms': {
+        name: round((at - (_boot_marks[i - 1][1] if i else _IMPORT_STARTED)) * 1000, 1)
+        for i, (name, at) in enumerate(_boot_marks)
+    },
+    'rss_mb': round(agent_loader.rss_mb() or 0, 1),
+    'langgraph_loaded': agent_runtime.loaded,
+    'heavy_modules': sorted(m for m in ('langgraph', 'langchain_groq', 'langchain_core') if m in sys.modules)
+}
+logger.info(
+    f"📦 main.py imported in {IMPORT_REPORT['import_ms']}ms "
+    f"(RSS {IMPORT_REPORT['rss_mb']}MB, LangGraph {'loaded' if agent_runtime.loaded else 'deferred'})"
+)
+
 # =================================================================================
 # MAIN STARTUP
 # =================================================================================
 
 if __name__ == '__main__':
     import webbrowser
-    import time
     
     port = 5000
     is_production = os.getenv('FLASK_ENV') == 'production'
@@ -2502,7 +3187,7 @@ if __name__ == '__main__':
     logger.info("🚀 CodeCalm AI Mental Wellness Platform Starting...")
     logger.info("=" * 60)
     
-    if groq_available:
+    if groq_ready():
         logger.info(f"☁️  Student/Parent/Professional Bots: Groq {GROQ_MODEL}")
         logger.info("🤖 CodeGent: Groq-powered routing")
     else:
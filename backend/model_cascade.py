@@ -0,0 +1,192 @@
+"""
+Complexity-Aware Model Cascade for CodeCalm
+
+Most chat and CodeGent turns are short and conversational, and a small Groq
+model answers them several times faster (and ~10x cheaper) than the 70B
+model. The cascade picks a tier per call:
+- large: code in the message (fences, stack traces, source lines), explicit
+  code tasks (implement/debug/fix/optimise...), long messages, long contexts,
+  or callers that ask for it (CodeGent once it is handing out solutions)
+- small: everything else
+
+Answers from the small tier that look low-confidence (empty, very short,
+"I'm not sure"-style hedges) are escalated to the large tier automatically.
+A small-tier call that failed (upstream error, open breaker, shed by the rate
+limiter, out of time) is not escalated: calling Groq again right when it is
+struggling would only double the load, and the callers' fallbacks already
+cover a missing answer. Streams can't be taken back once sent, so they are
+routed but never escalated.
+
+The decision for the current request (tier, model, reason, latency) is kept
+on flask.g so routes can return it and persist it to RoutingLog.
+
+Environment Variables:
+- LLM_CASCADE: Set to false to send everything to GROQ_MODEL (default: true)
+- GROQ_SMALL_MODEL: Fast tier (default: llama-3.1-8b-instant)
+- LLM_CASCADE_LONG_CONTEXT_TOKENS: Prompts larger than this go to the large
+  tier (default: 1800)
+- LLM_CASCADE_LONG_MESSAGE_CHARS: User messages longer than this go to the
+  large tier (default: 600)
+- LLM_CASCADE_MIN_ANSWER_CHARS: Shorter small-tier answers escalate (default: 20)
+- LLM_CASCADE_ESCALATE: Set to false to never escalate (default: true)
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+
+from flask import g, has_request_context
+
+import token_accounting
+
+logger = logging.getLogger(__name__)
+
+TIER_SMALL = 'small'
+TIER_LARGE = 'large'
+
+_CODE_MARKERS = re.compile(
+    r"```|Traceback \(most recent call last\)|^\s*(def|class|import|from|#include|public|private|"
+    r"function|const|let|var)\b.*[:{;(]\s*$|\w+Error:|;\s*$",
+    re.MULTILINE
+)
+_CODE_TASKS = re.compile(
+    r"\b(implement|debug|refactor|optimi[sz]e|fix (this|my)|write (a |the )?(code|program|function|script|class)|"
+    r"time complexity|space complexity|stack trace|segfault|compile error)\b",
+    re.IGNORECASE
+)
+_HEDGES = re.compile(
+    r"\b(i'?m not sure|i am not sure|i don'?t know|i cannot help|i can'?t help|i'?m unable to|"
+    r"as an ai( language model)?|i do not have enough information)\b",
+    re.IGNORECASE
+)
+
+
+class ModelCascade:
+    """Route each call to the small or large model, escalating weak answers"""
+
+    def __init__(self, small_model, large_model, enabled=True, long_context_tokens=1800,
+                 long_message_chars=600, min_answer_chars=20, escalate=True):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.enabled = enabled and small_model != large_model
+        self.long_context_tokens = long_context_tokens
+        self.long_message_chars = long_message_chars
+        self.min_answer_chars = min_answer_chars
+        self.escalate = escalate
+        self._lock = threading.Lock()
+        self._counters = {TIER_SMALL: 0, TIER_LARGE: 0, 'escalations': 0}
+
+    def model_for(self, tier):
+        return self.small_model if tier == TIER_SMALL else self.large_model
+
+    def choose(self, messages, prefer=None):
+        """
+        Pick a tier for messages
+
+        Returns:
+            tuple (tier, reason)
+        """
+        if not self.enabled:
+            return TIER_LARGE, "cascade disabled"
+        if prefer == TIER_LARGE:
+            return TIER_LARGE, "caller requested the large model"
+        user = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        if _CODE_MARKERS.search(user):
+            return TIER_LARGE, "message contains code"
+        if _CODE_TASKS.search(user):
+            return TIER_LARGE, "code-heavy task"
+        if len(user) > self.long_message_chars:
+            return TIER_LARGE, f"long message ({len(user)} chars)"
+        context_tokens = token_accounting.count_message_tokens(messages)
+        if context_tokens > self.long_context_tokens:
+            return TIER_LARGE, f"long context ({context_tokens} tokens)"
+        return TIER_SMALL, "short conversational turn"
+
+    def low_confidence(self, answer):
+        """Why a small-tier answer should be escalated, or None if it is fine"""
+        if not answer or not answer.strip():
+            return "no answer"
+        if len(answer.strip()) < self.min_answer_chars:
+            return "answer too short"
+        if _HEDGES.search(answer[:400]):
+            return "answer hedges"
+        return None
+
+    def complete(self, messages, call, prefer=None):
+        """
+        Run call(model) on the chosen tier, escalating weak small-tier answers
+
+        call returns None when the call failed; failures are not escalated.
+
+        Returns:
+            The answer text (None if the call failed)
+        """
+        tier, reason = self.choose(messages, prefer)
+        started = time.monotonic()
+        answer = call(self.model_for(tier))
+        escalated = False
+        if tier == TIER_SMALL and self.escalate and answer is not None:
+            why = self.low_confidence(answer)
+            if why:
+                logger.info(f"🪜 Escalating to {self.large_model}: {why}")
+                tier, escalated = TIER_LARGE, True
+                reason = f"{reason}; escalated ({why})"
+                answer = call(self.large_model)
+        self._note(tier, reason, escalated, time.monotonic() - started)
+        return answer
+
+    def stream_model(self, messages, prefer=None):
+        """Model for a streamed call (streams are routed but never escalated)"""
+        tier, reason = self.choose(messages, prefer)
+        self._note(tier, reason, False, None)
+        return self.model_for(tier)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        routed = counters[TIER_SMALL] + counters[TIER_LARGE]
+        return {
+            'enabled': self.enabled,
+            'small_model': self.small_model,
+            'large_model': self.large_model,
+            'small_share': round(counters[TIER_SMALL] / routed, 3) if routed else 0.0,
+            **counters
+        }
+
+    def _note(self, tier, reason, escalated, elapsed):
+        with self._lock:
+            self._counters[tier] += 1
+            if escalated:
+                self._counters['escalations'] += 1
+        if has_request_context():
+            g.llm_route = {
+                'tier': tier,
+                'model': self.model_for(tier),
+                'reason': reason,
+                'escalated': escalated,
+                'latency_ms': round(elapsed * 1000) if elapsed is not None else None
+            }
+
+
+def request_route():
+    """Cascade decision for the current request, or None if nothing was routed"""
+    if not has_request_context():
+        return None
+    return getattr(g, 'llm_route', None)
+
+
+def cascade_from_env(provider):
+    """Build the cascade for provider; only Groq has a second tier to route to"""
+    large = provider.model
+    small = os.getenv('GROQ_SMALL_MODEL', 'llama-3.1-8b-instant') if provider.name == 'groq' else large
+    return ModelCascade(
+        small_model=small,
+        large_model=large,
+        enabled=os.getenv('LLM_CASCADE', 'true').lower() != 'false',
+        long_context_tokens=int(os.getenv('LLM_CASCADE_LONG_CONTEXT_TOKENS', '1800')),
+        long_message_chars=int(os.getenv('LLM_CASCADE_LONG_MESSAGE_CHARS', '600')),
+        min_answer_chars=int(os.getenv('LLM_CASCADE_MIN_ANSWER_CHARS', '20')),
+        escalate=os.getenv('LLM_CASCADE_ESCALATE', 'true').lower() != 'false'
+    )
@@ -213,7 +213,11 @@ class RoutingLog(db.Model):
     selected_model = db.Column(db.String(100), nullable=False)  # claude-3, gpt-4, gemini-pro, groq-llama
     query_type = db.Column(db.String(50))  # coding, teaching, general, mental_health, fitness
     latency_ms = db.Column(db.Integer, default=0)
-    cost_estimate = db.Column(db.Float, default=0.0)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    completion_tokens = db.Column(db.Integer, default=0)
+    cost_estimate = db.Column(db.Float, default=0.0)  # USD
+    model_tier = db.Column(db.String(20))  # cascade tier: small, large
+    model_name = db.Column(db.String(100))  # model that actually answered
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     reasoning = db.Column(db.Text)  # Why this model was selected
     
@@ -229,7 +233,11 @@ class RoutingLog(db.Model):
             'selected_model': self.selected_model,
             'query_type': self.query_type,
             'latency_ms': self.latency_ms,
+            'prompt_tokens': self.prompt_tokens or 0,
+            'completion_tokens': self.completion_tokens or 0,
             'cost_estimate': self.cost_estimate,
+            'model_tier': self.model_tier,
+            'model_name': self.model_name,
             'created_at': self.created_at.isoformat(),
             'reasoning': self.reasoning
         }
@@ -239,6 +247,33 @@ class RoutingLog(db.Model):
 # DATABASE INITIALIZATION HELPER
 # =============================================================================
 
+# Columns added after first release: create_all() never alters existing
+# tables, so init_db adds any of these that an older database is missing.
+ADDED_COLUMNS = {
+    'routing_logs': {
+        'prompt_tokens': 'INTEGER DEFAULT 0',
+        'completion_tokens': 'INTEGER DEFAULT 0',
+        'model_tier': 'VARCHAR(20)',
+        'model_name': 'VARCHAR(100)',
+    },
+}
+
+
+def ensure_columns():
+    """Add ADDED_COLUMNS missing from existing tables (call inside an app context)"""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in existing_tables:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table)}
+        for name, ddl in columns.items():
+            if name not in present:
+                with db.engine.begin() as connection:
+                    connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+                print(f"✅ Added column {table}.{name}")
+
+
 def init_db(app):
     """
     Initialize database with Flask app
@@ -252,6 +287,7 @@ def init_db(app):
     with app.app_context():
         # Create all tables
         db.create_all()
+        ensure_columns()
         print("✅ Database tables created successfully")
         
         # Print table info
@@ -0,0 +1,145 @@
+"""
+Structured Chat Prompts for CodeCalm
+
+Builds OpenAI-style message lists in a cache-friendly order:
+
+    [system: static instructions]        <- identical every turn
+    [user/assistant: earlier turns]      <- grows by appending
+    [user: per-turn context + message]   <- the only part that always changes
+
+Providers that cache prompt prefixes (Groq, and OpenAI-compatible gateways in
+general) can only reuse work when the leading bytes are identical, so nothing
+dynamic (mood, task, timestamps, step counters) may appear in the system
+message. The prefix hash identifies the stable part and is tracked so /health
+shows how often a prefix is being reused.
+
+Environment Variables:
+- PROMPT_PREFIX_TRACKED: Distinct prefix hashes remembered per worker (default: 256)
+"""
+
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def build_messages(system, user_message, history=(), context=None,
+                   user_label=None, closing=None, history_turns=4):
+    """
+    Assemble a chat turn
+
+    Args:
+        system: Static system prompt (must not contain per-turn data)
+        user_message: What the user just said
+        history: conversation_history entries ({'user', 'assistant', ...})
+        context: Per-turn context text, sent with the user message
+        user_label: Quote the message as `label: "message"` instead of verbatim
+        closing: Instruction appended after the message (e.g. the reply format)
+        history_turns: Most recent exchanges replayed as real turns
+
+    Returns:
+        list of {'role', 'content'} dicts
+    """
+    messages = [{"role": "system", "content": system}]
+    recent = list(history)[-history_turns:] if history_turns else []
+    for turn in recent:
+        if turn.get('user'):
+            messages.append({"role": "user", "content": turn['user']})
+        if turn.get('assistant'):
+            messages.append({"role": "assistant", "content": turn['assistant']})
+
+    parts = []
+    if context:
+        parts.append(context.strip())
+    parts.append(f'{user_label}: "{user_message}"' if user_label else user_message)
+    if closing:
+        parts.append(closing)
+    messages.append({"role": "user", "content": "\n\n".join(parts)})
+    return messages
+
+
+def as_messages(prompt):
+    """Accept either a bare prompt string or a message list"""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return [{"role": m['role'], "content": m['content']} for m in prompt]
+
+
+def flatten(messages):
+    """`role: content` transcript for backends that only take one string"""
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def char_count(messages):
+    return sum(len(m['content']) for m in messages)
+
+
+def prefix_hash(messages):
+    """
+    Hash of the leading system message(s)
+
+    Two calls with the same prefix hash send byte-identical leading content,
+    which is what provider-side prefix caching keys on.
+    """
+    prefix = []
+    for message in messages:
+        if message['role'] != 'system':
+            break
+        prefix.append(message['content'])
+    if not prefix:
+        return None
+    digest = hashlib.sha256(json.dumps(prefix, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class PrefixTracker:
+    """Counts how often each system prefix is resent (per worker)"""
+
+    def __init__(self, max_tracked=256):
+        self.max_tracked = max_tracked
+        self._seen = OrderedDict()  # hash -> (uses, prefix chars)
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._reused = 0
+        self._reused_chars = 0
+
+    def observe(self, messages):
+        """Record one outbound call; returns its prefix hash"""
+        digest = prefix_hash(messages)
+        if digest is None:
+            return None
+        with self._lock:
+            self._calls += 1
+            entry = self._seen.get(digest)
+            if entry is None:
+                size = sum(len(m['content']) for m in messages if m['role'] == 'system')
+                self._seen[digest] = (1, size)
+                if len(self._seen) > self.max_tracked:
+                    self._seen.popitem(last=False)
+            else:
+                uses, size = entry
+                self._seen[digest] = (uses + 1, size)
+                self._seen.move_to_end(digest)
+                self._reused += 1
+                self._reused_chars += size
+        logger.debug(f"🧩 Prompt prefix {digest}")
+        return digest
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self._calls,
+                'distinct_prefixes': len(self._seen),
+                'reused': self._reused,
+                'reuse_rate': round(self._reused / self._calls, 3) if self._calls else 0.0,
+                'reused_prefix_chars': self._reused_chars
+            }
+
+
+def tracker_from_env():
+    """Build the prefix tracker from PROMPT_PREFIX_TRACKED"""
+    return PrefixTracker(max_tracked=int(os.getenv('PROMPT_PREFIX_TRACKED', '256')))
@@ -0,0 +1,240 @@
+"""
+Client-Side Rate Limiter for Outbound LLM Calls
+
+Schedules Groq calls so we stay inside the account's rate limits instead of
+burning requests on 429s:
+- token bucket for requests, paced locally; Groq's daily request quota
+  (x-ratelimit-remaining-requests) only pauses calls once it is exhausted
+- per-minute token budget tracked from x-ratelimit-remaining-tokens
+- bounded priority queue: interactive chat outranks batch generations, which
+  outrank background jobs (jobs have no client waiting, so they queue longest)
+- back-pressure: when a slot can't be had in time, RateLimitExceeded carries a
+  Retry-After hint so the route can answer 503 instead of calling upstream
+
+Environment Variables:
+- GROQ_RATE_PER_SECOND: Steady-state request refill rate (default: 0.5 = 30 RPM)
+- GROQ_RATE_BURST: Bucket capacity (default: 10)
+- GROQ_QUEUE_MAX: Waiters allowed in the queue (default: 32)
+- GROQ_QUEUE_WAIT_INTERACTIVE: Max seconds a chat call waits (default: 10)
+- GROQ_QUEUE_WAIT_BATCH: Max seconds a batch call waits (default: 5)
+- GROQ_QUEUE_WAIT_JOB: Max seconds a background job's call waits (default: 60)
+"""
+
+import os
+import re
+import math
+import time
+import heapq
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_JOB = 2
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call can't be scheduled without exceeding the rate limit"""
+
+    def __init__(self, retry_after):
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+        super().__init__(f"Rate limited; retry after {self.retry_after}s")
+
+
+def parse_duration(value):
+    """
+    Parse Groq's reset durations ("7.66s", "2m59.56s", "120ms") into seconds
+
+    Plain numbers (Retry-After) are treated as seconds. Returns None if unparseable.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class RateLimitScheduler:
+    """Token bucket + bounded priority queue for one upstream provider"""
+
+    def __init__(self, rate_per_second=0.5, burst=10, max_queue=32,
+                 max_wait=None):
+        self.rate = rate_per_second
+        self.capacity = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait or {PRIORITY_INTERACTIVE: 10, PRIORITY_BATCH: 5, PRIORITY_JOB: 60}
+
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._remaining_tokens = None  # LLM tokens left in the current minute
+        self._tokens_reset_at = 0.0
+
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._counters = {'granted': 0, 'rejected': 0, 'throttled_429': 0}
+
+    # -------------------------------------------------------------------------
+    # Scheduling
+    # -------------------------------------------------------------------------
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, token_cost=0, max_wait=None):
+        """
+        Block until this call may go upstream
+
+        Args:
+            priority: PRIORITY_INTERACTIVE, PRIORITY_BATCH or PRIORITY_JOB
+            token_cost: Estimated prompt + completion tokens for the call
+            max_wait: Caller's own wait limit (e.g. its remaining deadline);
+                the priority's max_wait still applies when it is shorter
+
+        Raises:
+            RateLimitExceeded: queue is full or the wait would exceed max_wait
+        """
+        with self._cond:
+            # Batch and job work may only use half the queue so chat always has room
+            limit = self.max_queue if priority == PRIORITY_INTERACTIVE else self.max_queue // 2
+            if len(self._queue) >= limit:
+                self._counters['rejected'] += 1
+                raise RateLimitExceeded(self._wait_estimate(token_cost) + len(self._queue) / max(self.rate, 0.01))
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._queue, entry)
+            wait_limit = self.max_wait.get(priority, 10)
+            if max_wait is not None:
+                wait_limit = min(wait_limit, max(max_wait, 0))
+            deadline = time.monotonic() + wait_limit
+
+            try:
+                while True:
+                    self._refill()
+                    wait = self._wait_estimate(token_cost)
+                    if self._queue[0] == entry and wait <= 0:
+                        heapq.heappop(self._queue)
+                        self._tokens -= 1
+                        if self._remaining_tokens is not None:
+                            self._remaining_tokens -= token_cost
+                        self._counters['granted'] += 1
+                        self._cond.notify_all()
+                        return
+
+                    now = time.monotonic()
+                    if now + max(wait, 0) > deadline:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self._counters['rejected'] += 1
+                        self._cond.notify_all()
+                        raise RateLimitExceeded(max(wait, deadline - now, 1))
+
+                    self._cond.wait(timeout=min(max(wait, 0.05), deadline - now))
+            except RateLimitExceeded:
+                raise
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    # -------------------------------------------------------------------------
+    # Feedback from responses
+    # -------------------------------------------------------------------------
+
+    def update_from_headers(self, headers, status_code=200):
+        """Apply Groq's x-ratelimit-* / retry-after headers (quota, token budget, 429 pauses)"""
+        now = time.monotonic()
+        with self._cond:
+            # remaining-requests is Groq's daily quota (thousands), not the local
+            # pacing bucket: it only matters once it runs out
+            remaining = headers.get('x-ratelimit-remaining-requests')
+            reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+            if remaining is not None:
+                try:
+                    if float(remaining) <= 0 and reset:
+                        self._blocked_until = max(self._blocked_until, now + reset)
+                except ValueError:
+                    pass
+
+            remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+            tokens_reset = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+            if remaining_tokens is not None:
+                try:
+                    self._remaining_tokens = float(remaining_tokens)
+                    self._tokens_reset_at = now + (tokens_reset or 60)
+                except ValueError:
+                    pass
+
+            if status_code == 429:
+                self._counters['throttled_429'] += 1
+                retry_after = parse_duration(headers.get('retry-after')) or reset or 1
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                logger.warning(f"🚦 Groq rate limited; pausing outbound calls for {retry_after:.1f}s")
+
+            self._cond.notify_all()
+
+    def retry_after(self):
+        """Seconds until the next call could be scheduled (for 503 responses)"""
+        with self._cond:
+            self._refill()
+            return max(self._wait_estimate(0), 1)
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            return {
+                'tokens_available': round(self._tokens, 2),
+                'capacity': self.capacity,
+                'rate_per_second': self.rate,
+                'queued': len(self._queue),
+                'blocked_for_seconds': round(max(self._blocked_until - time.monotonic(), 0), 1),
+                'remaining_llm_tokens': self._remaining_tokens,
+                **self._counters
+            }
+
+    # -------------------------------------------------------------------------
+    # Internals (condition lock held)
+    # -------------------------------------------------------------------------
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if self._remaining_tokens is not None and now >= self._tokens_reset_at:
+            self._remaining_tokens = None
+
+    def _wait_estimate(self, token_cost):
+        """Seconds until a request slot (and LLM token budget) is available"""
+        now = time.monotonic()
+        waits = [self._blocked_until - now]
+        if self._tokens < 1:
+            waits.append((1 - self._tokens) / max(self.rate, 0.01))
+        if self._remaining_tokens is not None and self._remaining_tokens < token_cost:
+            waits.append(self._tokens_reset_at - now)
+        return max(waits)
+
+
+def scheduler_from_env():
+    """Build the Groq scheduler from GROQ_RATE_* / GROQ_QUEUE_* variables"""
+    return RateLimitScheduler(
+        rate_per_second=float(os.getenv('GROQ_RATE_PER_SECOND', '0.5')),
+        burst=int(os.getenv('GROQ_RATE_BURST', '10')),
+        max_queue=int(os.getenv('GROQ_QUEUE_MAX', '32')),
+        max_wait={
+            PRIORITY_INTERACTIVE: float(os.getenv('GROQ_QUEUE_WAIT_INTERACTIVE', '10')),
+            PRIORITY_BATCH: float(os.getenv('GROQ_QUEUE_WAIT_BATCH', '5')),
+            PRIORITY_JOB: float(os.getenv('GROQ_QUEUE_WAIT_JOB', '60'))
+        }
+    )
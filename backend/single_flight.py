@@ -0,0 +1,259 @@
+"""
+Single-Flight Request Coalescing for CodeCalm
+
+Concurrent callers asking for the same key share one upstream call:
+- threads in one worker wait on the leader's in-memory result
+- workers on one host serialise on a file lock; the leader publishes its
+  result next to the lock so waiting workers reuse it instead of calling again
+
+Only callers that pass across_workers=True (completions that may be cached
+anyway) use the file tier: everything else, e.g. private chat turns, is
+coalesced between threads only and never written to disk. The directory is
+created owner-only (0700).
+
+The cross-worker tier needs fcntl (Linux/macOS); elsewhere only threads are
+coalesced.
+
+Environment Variables:
+- LLM_SINGLE_FLIGHT: Set to false to disable coalescing (default: true)
+- LLM_SINGLE_FLIGHT_DIR: Lock/result directory shared by workers
+  (default: <tmp>/codecalm-singleflight)
+- LLM_SINGLE_FLIGHT_TIMEOUT: Seconds a follower waits for the leader (default: 60)
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Published results older than this are never reused or are swept away
+RESULT_RETENTION_SECONDS = 120
+
+
+class _Call:
+    """One in-flight upstream call inside this worker"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls across threads and worker processes"""
+
+    def __init__(self, lock_dir=None, timeout=60, enabled=True):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'leaders': 0, 'thread_followers': 0, 'worker_followers': 0}
+
+        if self.lock_dir:
+            try:
+                os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+                os.chmod(self.lock_dir, 0o700)  # also tighten a directory left by older versions
+            except OSError as e:
+                logger.warning(f"⚠️  Single-flight cross-worker tier disabled: {e}")
+                self.lock_dir = None
+
+    def do(self, key, fn, timeout=None, across_workers=False):
+        """
+        Run fn() once for every concurrent caller sharing key
+
+        Args:
+            key: Identity of the request (e.g. the completion cache key)
+            fn: Zero-argument callable performing the upstream call
+            timeout: Longest a follower waits on the leader (default: self.timeout)
+            across_workers: Also coalesce with other workers through the lock
+                directory (the result is written to disk)
+
+        Returns:
+            fn()'s result, possibly produced by another thread or worker
+        """
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._stats['leaders'] += 1
+            else:
+                call.followers += 1
+                leader = False
+                self._stats['thread_followers'] += 1
+
+        if not leader:
+            wait = self.timeout if timeout is None else min(self.timeout, max(timeout, 0))
+            if not call.done.wait(wait):
+                logger.warning("⏱️  Single-flight leader timed out; calling upstream directly")
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_across_workers(key, fn) if across_workers else fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        """Counters for health reporting"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'cross_worker': bool(self.lock_dir),
+                'in_flight': len(self._calls),
+                **self._stats
+            }
+
+    # -------------------------------------------------------------------------
+    # Cross-worker tier
+    # -------------------------------------------------------------------------
+
+    def _run_across_workers(self, key, fn):
+        if not self.lock_dir:
+            return fn()
+
+        arrived_at = time.time()
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+
+        lock_file = self._lock_path(lock_path)
+        if lock_file is None:
+            return fn()
+
+        with lock_file:
+            try:
+                # Another worker held the lock: reuse what it just finished
+                published = self._read_result(result_path, arrived_at)
+                if published is not None:
+                    with self._lock:
+                        self._stats['worker_followers'] += 1
+                    return published
+
+                result = fn()
+                if result is not None:
+                    self._publish_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock_path(self, lock_path):
+        """
+        Open and exclusively lock lock_path, or None on timeout/error
+
+        A lock taken on a file the sweeper has just unlinked protects nothing
+        (the next caller creates a new one), so the locked file must still be
+        the one at lock_path; otherwise it is reopened.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                lock_file = open(lock_path, 'a+')
+            except OSError:
+                return None
+            if not self._acquire(lock_file, deadline):
+                lock_file.close()
+                return None
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except OSError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @staticmethod
+    def _acquire(lock_file, deadline):
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+    @staticmethod
+    def _read_result(result_path, arrived_at):
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Only results finished while this caller was waiting count as shared
+        if published.get('finished_at', 0) < arrived_at:
+            return None
+        return published.get('result')
+
+    def _publish_result(self, result_path, result):
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'finished_at': time.time(), 'result': result}, f)
+            os.replace(tmp_path, result_path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"⚠️  Single-flight publish failed: {e}")
+        self._sweep()
+
+    def _sweep(self):
+        """Remove stale lock/result files so the directory stays small"""
+        cutoff = time.time() - RESULT_RETENTION_SECONDS
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                if name.endswith('.json'):
+                    os.remove(path)
+                elif name.endswith('.lock'):
+                    self._remove_idle_lock(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _remove_idle_lock(path):
+        """Unlink a lock file only while holding it, so no leader is using it"""
+        with open(path, 'a+') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                os.remove(path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def single_flight_from_env():
+    """Build the process-wide coalescer from LLM_SINGLE_FLIGHT_* variables"""
+    return SingleFlight(
+        lock_dir=os.getenv('LLM_SINGLE_FLIGHT_DIR') or os.path.join(tempfile.gettempdir(), 'codecalm-singleflight'),
+        timeout=float(os.getenv('LLM_SINGLE_FLIGHT_TIMEOUT', '60')),
+        enabled=os.getenv('LLM_SINGLE_FLIGHT', 'true').lower() != 'false'
+    )
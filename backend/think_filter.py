@@ -0,0 +1,235 @@
+"""
+Streaming-Safe Cleaner for DeepSeek-R1 Reasoning Output
+
+Removes what the old three-regex chain removed, without needing the whole
+response first:
+- <think>...</think> reasoning blocks (an unclosed block is dropped to the end)
+- any other tag-like <...> markup
+- filler preambles at the start of a line ("Okay, ...", "Alright.", "Hmm...",
+  "So ...", "Let me think ...") up to the end of their first sentence,
+  plus the whitespace that follows
+- leading/trailing whitespace
+
+Filler words must be whole words ("Sorry" and "Sometimes" are kept, unlike
+the regex chain which dropped them).
+
+Streaming:
+    f = ThinkFilter()
+    for chunk in tokens:
+        text = f.feed(chunk)
+        if text:
+            send(text)
+    send(f.flush())
+
+Batch:
+    clean(text)
+"""
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+FILLER_WORDS = ('let me think', 'alright', 'okay', 'hmm', 'so')
+_FILLER_PREFIXES = frozenset(w[:2] for w in FILLER_WORDS)
+SENTENCE_END = '.!?'
+
+# A '<' with no '>' within MAX_TAG_LENGTH chars is literal text; a filler
+# sentence longer than MAX_FILLER_SENTENCE is kept
+MAX_TAG_LENGTH = 256
+MAX_FILLER_SENTENCE = 1000
+
+_WHITESPACE = ' \t\r\n\f\v'
+
+
+def _partial_suffix(text, token):
+    """Length of the longest suffix of text that is a proper prefix of token"""
+    for size in range(min(len(token) - 1, len(text)), 0, -1):
+        if token.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ThinkFilter:
+    """Incremental state machine; feed() chunks, then flush() once at the end"""
+
+    def __init__(self):
+        self._buffer = ''
+        self._in_think = False
+        self._line_start = True   # next output char begins a line (filler check)
+        self._started = False     # anything visible emitted yet (leading strip)
+        self._pending_ws = ''     # trailing whitespace held until more text follows
+        self._out = []
+
+    def feed(self, chunk):
+        """Add raw model output; returns the cleaned text that is now safe to emit"""
+        self._buffer += chunk
+        return self._drain(final=False)
+
+    def flush(self):
+        """Finish the stream; returns whatever cleaned text was still held back"""
+        text = self._drain(final=True)
+        self._pending_ws = ''
+        return text
+
+    # -------------------------------------------------------------------------
+    # State machine
+    # -------------------------------------------------------------------------
+
+    def _drain(self, final):
+        buf = self._buffer
+        while buf:
+            if self._in_think:
+                end = buf.find(THINK_CLOSE)
+                if end < 0:
+                    keep = 0 if final else _partial_suffix(buf, THINK_CLOSE)
+                    buf = buf[len(buf) - keep:] if keep else ''
+                    break
+                buf = buf[end + len(THINK_CLOSE):]
+                self._in_think = False
+                continue
+
+            if self._line_start and buf[0] != '<':
+                consumed = self._match_filler(buf, final)
+                if consumed is None:
+                    break  # need more input to decide
+                if consumed:
+                    self._line_start = buf[consumed - 1] == '\n'
+                    buf = buf[consumed:]
+                    continue
+                self._line_start = False
+
+            lt = buf.find('<')
+            nl = self._next_line_break(buf, lt if lt >= 0 else len(buf))
+            if nl >= 0:
+                self._emit(buf[:nl + 1])
+                buf = buf[nl + 1:]
+                self._line_start = True
+                continue
+            if lt < 0:
+                self._emit(buf)
+                self._line_start = False
+                buf = ''
+                break
+
+            if lt:
+                self._emit(buf[:lt])
+                self._line_start = False
+                buf = buf[lt:]
+            close = buf.find('>', 1, MAX_TAG_LENGTH + 1)
+            if close < 0:
+                if final or len(buf) > MAX_TAG_LENGTH:
+                    # Not a tag after all: a literal '<'
+                    self._emit('<')
+                    self._line_start = False
+                    buf = buf[1:]
+                    continue
+                break
+            if close == 1:
+                self._emit('<>')
+                self._line_start = False
+            elif buf[:close + 1] == THINK_OPEN:
+                self._in_think = True
+            buf = buf[close + 1:]
+
+        self._buffer = buf
+        out = ''.join(self._out)
+        self._out = []
+        return out
+
+    @staticmethod
+    def _next_line_break(buf, limit):
+        """
+        First newline before limit after which a filler or tag could start
+
+        Newlines followed by ordinary text are passed over, so plain
+        paragraphs are emitted in one piece instead of line by line.
+        """
+        nl = buf.find('\n', 0, limit)
+        while nl >= 0:
+            head = buf[nl + 1:nl + 3]
+            if len(head) < 2 or head[0] == '<' or head.lower() in _FILLER_PREFIXES:
+                return nl
+            nl = buf.find('\n', nl + 1, limit)
+        return -1
+
+    def _match_filler(self, buf, final):
+        """
+        At a line start: chars to drop for a filler sentence, 0 if none,
+        or None when more input is needed to decide
+        """
+        if len(buf) >= 2 and buf[:2].lower() not in _FILLER_PREFIXES:
+            return 0
+        lowered = buf[:len(FILLER_WORDS[0]) + 1].lower()
+        for word in FILLER_WORDS:
+            if len(lowered) <= len(word):
+                if word.startswith(lowered) and not final:
+                    return None
+                if lowered != word:
+                    continue
+                pos = len(word)
+            elif lowered.startswith(word):
+                pos = len(word)
+                if word == 'hmm':
+                    while pos < len(buf) and buf[pos] in 'mM':
+                        pos += 1
+                if pos < len(buf) and buf[pos].isalnum():
+                    continue
+            else:
+                continue
+            return self._filler_sentence_end(buf, pos, final)
+        return 0
+
+    @staticmethod
+    def _filler_sentence_end(buf, pos, final):
+        limit = min(len(buf), MAX_FILLER_SENTENCE)
+        i = pos
+        while i < limit:
+            ch = buf[i]
+            if ch == '\n':
+                return 0  # sentence didn't end on this line: not a filler
+            if ch in SENTENCE_END:
+                break
+            i += 1
+        else:
+            if final or len(buf) >= MAX_FILLER_SENTENCE:
+                return 0
+            return None
+        # Swallow the whitespace after the sentence (it may continue in the next chunk)
+        i += 1
+        while i < len(buf) and buf[i] in _WHITESPACE:
+            i += 1
+        if i == len(buf) and not final:
+            return None
+        return i
+
+    def _emit(self, text):
+        if not text:
+            return
+        if not self._started:
+            text = text.lstrip(_WHITESPACE)
+            if not text:
+                return
+            self._started = True
+        stripped = text.rstrip(_WHITESPACE)
+        if stripped:
+            self._out.append(self._pending_ws + stripped)
+            self._pending_ws = text[len(stripped):]
+        else:
+            self._pending_ws += text
+
+
+def clean(text):
+    """Batch mode: clean a complete response in one pass"""
+    f = ThinkFilter()
+    return f.feed(text) + f.flush()
+
+
+def filter_stream(tokens):
+    """Wrap a token iterator, yielding only cleaned, non-empty text"""
+    f = ThinkFilter()
+    for token in tokens:
+        text = f.feed(token)
+        if text:
+            yield text
+    tail = f.flush()
+    if tail:
+        yield tail
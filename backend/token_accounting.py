@@ -0,0 +1,240 @@
+"""
+Token Accounting and Cost Estimation for CodeCalm LLM Calls
+
+Counts come from the provider when it reports them (Groq's `usage` field,
+Ollama's prompt_eval_count/eval_count). Otherwise they come from a local
+tokenizer: tiktoken's cl100k_base when installed (close to Llama 3's
+tiktoken-derived vocabulary), else a word/punctuation approximation.
+Prompt tokens the provider served from its prefix cache
+(usage.prompt_tokens_details.cached_tokens) are reported as cached_tokens.
+
+tiktoken downloads its encoding file the first time it is used, so it is
+loaded at boot and in each forked worker (load_encoding), never on a request.
+Counts are approximated until it is available; a failed load is retried in
+the background every ENCODING_RETRY_SECONDS. Point TIKTOKEN_CACHE_DIR at a
+directory shipped with the app to avoid the download altogether.
+
+Usage for the current Flask request is accumulated on flask.g so routes can
+report it and persist it (Message.tokens, RoutingLog token/cost columns)
+without threading return values through every helper.
+
+Environment Variables:
+- LLM_PRICES: JSON overriding/adding per-model prices in USD per million tokens,
+  e.g. {"llama-3.3-70b-versatile": {"input": 0.59, "output": 0.79}}
+- TIKTOKEN_CACHE_DIR: Where tiktoken keeps (and looks for) its encoding file
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import logging
+from functools import lru_cache
+
+from flask import g, has_request_context
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens (Groq list prices); local and stub models are free
+DEFAULT_PRICES = {
+    'llama-3.3-70b-versatile': {'input': 0.59, 'output': 0.79},
+    'llama-3.1-8b-instant': {'input': 0.05, 'output': 0.08},
+}
+
+_WORD_PIECES = re.compile(r"\w+|[^\w\s]")
+
+# Seconds between background attempts after tiktoken failed to load
+ENCODING_RETRY_SECONDS = 300
+
+
+def _load_prices():
+    prices = dict(DEFAULT_PRICES)
+    override = os.getenv('LLM_PRICES')
+    if override:
+        try:
+            prices.update(json.loads(override))
+        except ValueError as e:
+            logger.warning(f"⚠️  Ignoring invalid LLM_PRICES: {e}")
+    return prices
+
+
+PRICES = _load_prices()
+
+
+# =============================================================================
+# COUNTING
+# =============================================================================
+
+_encoding_lock = threading.Lock()
+_encoding_state = {'encoding': None, 'attempted_at': None, 'retrying': False}
+
+
+def load_encoding():
+    """
+    Load tiktoken's cl100k_base (may download it); call at boot, not per request
+
+    Returns:
+        True when the encoding is available
+    """
+    if tiktoken is None:
+        return False
+    with _encoding_lock:
+        if _encoding_state['encoding'] is not None:
+            return True
+        _encoding_state['attempted_at'] = time.monotonic()
+        try:
+            _encoding_state['encoding'] = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            # Offline hosts without TIKTOKEN_CACHE_DIR approximate until a retry succeeds
+            logger.warning(f"⚠️  tiktoken unavailable, approximating token counts: {e}")
+            return False
+    # Counts cached before the encoding arrived were approximations
+    count_tokens.cache_clear()
+    logger.info("🔢 tiktoken cl100k_base loaded")
+    return True
+
+
+def _encoding():
+    """The loaded encoding, or None (a failed load is retried off the request path)"""
+    encoding = _encoding_state['encoding']
+    if encoding is None and tiktoken is not None:
+        _retry_in_background()
+    return encoding
+
+
+def _retry_in_background():
+    attempted_at = _encoding_state['attempted_at']
+    if attempted_at is not None and time.monotonic() - attempted_at < ENCODING_RETRY_SECONDS:
+        return
+    with _encoding_lock:
+        if _encoding_state['retrying']:
+            return
+        _encoding_state['retrying'] = True
+
+    def retry():
+        try:
+            load_encoding()
+        finally:
+            _encoding_state['retrying'] = False
+
+    threading.Thread(target=retry, name='tiktoken-load', daemon=True).start()
+
+
+def _reset_after_fork():
+    """A retry thread (and its lock) doesn't survive fork"""
+    global _encoding_lock
+    _encoding_lock = threading.Lock()
+    _encoding_state['retrying'] = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@lru_cache(maxsize=2048)
+def count_tokens(text):
+    """Local token count for text (cached: system prompts repeat every turn)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Common words are one BPE token; long/rare words split into several
+    return sum(1 + len(piece) // 9 for piece in _WORD_PIECES.findall(text))
+
+
+def count_message_tokens(messages):
+    """Prompt tokens for OpenAI-style messages (~4 tokens framing per message)"""
+    return sum(count_tokens(m.get('content') or '') + 4 for m in messages)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Cost in USD for one call (0 for unpriced/local models)"""
+    price = PRICES.get(model)
+    if not price:
+        return 0.0
+    return (prompt_tokens * price['input'] + completion_tokens * price['output']) / 1_000_000
+
+
+def build_usage(model, reported=None, prompt=None, completion=None):
+    """
+    Normalise one call's usage
+
+    Args:
+        model: Model that served the call (selects the price)
+        reported: Provider usage dict with prompt_tokens/completion_tokens, or None
+        prompt: Prompt text or message list, counted locally when not reported
+        completion: Completion text, counted locally when not reported
+
+    Returns:
+        dict with prompt_tokens, completion_tokens, total_tokens, cached_tokens,
+        cost_usd, source
+    """
+    cached_tokens = 0
+    if reported and reported.get('prompt_tokens') is not None:
+        prompt_tokens = int(reported['prompt_tokens'])
+        completion_tokens = int(reported.get('completion_tokens') or 0)
+        cached_tokens = int((reported.get('prompt_tokens_details') or {}).get('cached_tokens') or 0)
+        source = 'provider'
+    else:
+        if isinstance(prompt, list):
+            prompt_tokens = count_message_tokens(prompt)
+        else:
+            prompt_tokens = count_tokens(prompt or '')
+        completion_tokens = count_tokens(completion or '')
+        source = 'tokenizer' if _encoding() is not None else 'estimate'
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+        'cached_tokens': cached_tokens,
+        'cost_usd': round(estimate_cost(model, prompt_tokens, completion_tokens), 8),
+        'source': source,
+        'model': model
+    }
+
+
+# =============================================================================
+# PER-REQUEST ACCUMULATION
+# =============================================================================
+
+def record(usage):
+    """Add one upstream call's usage to the current request's running total"""
+    if not has_request_context() or not usage:
+        return
+    total = getattr(g, 'llm_usage', None)
+    if total is None:
+        total = g.llm_usage = {
+            'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0, 'cached_tokens': 0,
+            'cost_usd': 0.0, 'calls': 0, 'source': usage['source'], 'model': usage['model']
+        }
+    for field in ('prompt_tokens', 'completion_tokens', 'total_tokens', 'cached_tokens'):
+        total[field] += usage[field]
+    total['cost_usd'] = round(total['cost_usd'] + usage['cost_usd'], 8)
+    total['calls'] += 1
+    total['model'] = usage['model']  # last call wins (e.g. after a cascade escalation)
+    if usage['source'] != 'provider':
+        total['source'] = usage['source']
+
+
+def request_usage(model=None, prompt=None, completion=None):
+    """
+    Usage for the current request
+
+    When nothing went upstream (cache hit, coalesced call, fallback text) the
+    prompt/completion are counted locally so the turn still has token counts;
+    cost stays 0 because nothing was billed.
+    """
+    total = getattr(g, 'llm_usage', None) if has_request_context() else None
+    if total is not None:
+        return dict(total)
+    usage = build_usage(model, prompt=prompt, completion=completion)
+    usage['cost_usd'] = 0.0
+    usage['calls'] = 0
+    return usage
@@ -0,0 +1,378 @@
+"""
+Pre-Warmed Workout Plan Cache for FitnessBot
+
+A workout plan depends only on coarse profile fields: fitness level (3
+values), goal (6 values) and the equipment set. Plans are therefore cached
+per normalised bucket ("beginner|weight loss|dumbbells+pull-up bar") instead
+of per request, and a background thread keeps the popular buckets warm:
+- seed buckets (WORKOUT_CACHE_WARM) are built once FitnessBot is first used
+- the most requested buckets are added as traffic reveals them
+- entries past WORKOUT_CACHE_REFRESH_AT of their TTL are rebuilt before they
+  expire, so hot profiles never wait on Tavily + a 1200-token completion
+
+A stale entry that is still within its TTL is served immediately and queued
+for refresh. Profiles with injuries/limitations are personal and bypass the
+cache.
+
+Plans are shared by every gunicorn worker on the host through a SQLite file,
+and a warm pass only runs in the worker holding the file lock next to it, so
+each bucket costs one Tavily search + completion per host, not per worker.
+The warm thread starts on the first plan lookup, never at boot: a cold start
+(or scale from zero) spends no quota until FitnessBot is actually used.
+Without fcntl (Windows) every worker warms on its own.
+
+Environment Variables:
+- WORKOUT_CACHE_ENABLED: Set to false to build every plan on demand (default: true)
+- WORKOUT_CACHE_PATH: SQLite file shared by workers (default: <tmp>/codecalm-workout-plans.sqlite3)
+- WORKOUT_CACHE_TTL_SECONDS: Plan lifetime (default: 21600)
+- WORKOUT_CACHE_REFRESH_AT: Fraction of the TTL after which a plan is rebuilt
+  in the background (default: 0.8)
+- WORKOUT_CACHE_WARM: Seed buckets, `level|goal|equipment+equipment;...`
+  (default: a handful of common beginner/intermediate profiles)
+- WORKOUT_CACHE_WARM_TOP: Most-requested buckets kept warm (default: 6)
+- WORKOUT_CACHE_WARM_INTERVAL: Seconds between warm passes (default: 60)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+import logging
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FITNESS_LEVELS = ('beginner', 'intermediate', 'advanced')
+GOALS = ('weight loss', 'muscle gain', 'endurance', 'flexibility',
+         'general fitness', 'athletic performance')
+EQUIPMENT = {
+    'dumbbells': 'Dumbbells',
+    'resistance bands': 'Resistance Bands',
+    'pull-up bar': 'Pull-up Bar',
+    'gym access': 'Gym Access',
+    'home equipment': 'Home Equipment',
+}
+NO_LIMITATIONS = ('', 'none', 'no', 'n/a', 'na', 'nil')
+
+DEFAULT_WARM = (
+    'beginner|general fitness|',
+    'beginner|weight loss|',
+    'beginner|muscle gain|dumbbells',
+    'intermediate|weight loss|',
+    'intermediate|muscle gain|gym access',
+    'intermediate|general fitness|',
+)
+
+
+def bucket_key(profile):
+    """Normalised bucket for a profile, or None when it must not be shared"""
+    limitations = str(profile.get('limitations') or '').strip().lower()
+    if limitations not in NO_LIMITATIONS:
+        return None
+    level = str(profile.get('fitness_level') or 'beginner').strip().lower()
+    goal = str(profile.get('goal') or 'general fitness').strip().lower()
+    if level not in FITNESS_LEVELS or goal not in GOALS:
+        return None
+    equipment = sorted({
+        str(item).strip().lower() for item in profile.get('equipment') or []
+        if str(item).strip().lower() not in ('', 'none')
+    })
+    if any(item not in EQUIPMENT for item in equipment):
+        return None
+    return f"{level}|{goal}|{'+'.join(equipment)}"
+
+
+def bucket_profile(key):
+    """Canonical profile that a bucket's plan is generated from"""
+    level, goal, equipment = key.split('|')
+    return {
+        'fitness_level': level,
+        'goal': goal,
+        'equipment': [EQUIPMENT[item] for item in equipment.split('+') if item],
+        'limitations': 'none'
+    }
+
+
+def _is_bucket(key):
+    try:
+        return bucket_key(bucket_profile(key)) == key
+    except (KeyError, ValueError):
+        logger.warning(f"⚠️  Ignoring invalid workout warm bucket: {key!r}")
+        return False
+
+
+class WorkoutPlanCache:
+    """Bucketed, background-refreshed cache in front of a plan builder"""
+
+    def __init__(self, builder, path=None, ttl_seconds=21600, refresh_at=0.8, warm=DEFAULT_WARM,
+                 warm_top=6, warm_interval=60, enabled=True):
+        self.builder = builder
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.refresh_at = refresh_at
+        self.warm = tuple(k for k in warm if _is_bucket(k))
+        self.warm_top = warm_top
+        self.warm_interval = warm_interval
+        self.enabled = enabled
+
+        self._entries = {}  # bucket -> (built_at, plan)
+        self._popularity = Counter()
+        self._refresh = set()
+        self._building = {}  # bucket -> Lock, so one bucket is built once at a time
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._warmer = None
+        self._warmer_pid = None
+        self._local = threading.local()
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'bypassed': 0,
+                          'shared_hits': 0, 'builds': 0, 'background_builds': 0,
+                          'build_failures': 0, 'warm_passes': 0, 'warm_passes_skipped': 0}
+
+        if self.enabled and self.path:
+            self._init_sqlite()
+
+    def get(self, profile):
+        """Plan for profile: cached when its bucket is warm, otherwise built now"""
+        key = bucket_key(profile) if self.enabled else None
+        if key is None:
+            self._count('bypassed')
+            return self.builder(profile)
+
+        self.ensure_warmer()
+        now = time.time()
+        with self._lock:
+            self._popularity[key] += 1
+            entry = self._entries.get(key)
+        if entry is None or now - entry[0] >= self.ttl_seconds * self.refresh_at:
+            # Another worker may have built (or refreshed) this bucket
+            shared = self._load_shared(key)
+            if shared is not None and (entry is None or shared[0] > entry[0]):
+                entry = self._remember(key, shared)
+                self._count('shared_hits')
+        if entry is not None:
+            age = now - entry[0]
+            if age < self.ttl_seconds:
+                if age >= self.ttl_seconds * self.refresh_at:
+                    self._count('stale_hits')
+                    with self._lock:
+                        self._refresh.add(key)
+                    self._wake.set()
+                else:
+                    self._count('hits')
+                return entry[1]
+
+        self._count('misses')
+        return self._build(key, background=False)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            counters = dict(self._counters)
+            warm = sum(1 for built_at, _ in self._entries.values() if now - built_at < self.ttl_seconds)
+            popular = [key for key, _ in self._popularity.most_common(self.warm_top)]
+        lookups = counters['hits'] + counters['stale_hits'] + counters['misses']
+        return {
+            'enabled': self.enabled,
+            'warm_buckets': warm,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_ratio': round((counters['hits'] + counters['stale_hits']) / lookups, 3) if lookups else 0.0,
+            'popular': popular,
+            **counters
+        }
+
+    # -------------------------------------------------------------------------
+    # Building
+    # -------------------------------------------------------------------------
+
+    def _build(self, key, background):
+        """Build a bucket's plan, storing it only when generation succeeded"""
+        with self._lock:
+            lock = self._building.setdefault(key, threading.Lock())
+        with lock:
+            # Another thread (or worker) may have finished this bucket while we waited
+            entry = self._latest(key)
+            if entry is not None:
+                age = time.time() - entry[0]
+                if age < self.ttl_seconds and (not background or age < self.ttl_seconds * self.refresh_at):
+                    self._remember(key, entry)
+                    return entry[1]
+            started = time.monotonic()
+            try:
+                plan = self.builder(bucket_profile(key))
+            except Exception as e:
+                self._count('build_failures')
+                if not background:
+                    raise
+                logger.error(f"Workout plan build failed for {key}: {e}")
+                return None
+            if not plan or not plan.get('workout_plan'):
+                self._count('build_failures')
+                return plan
+            entry = (time.time(), plan)
+            self._remember(key, entry)
+            self._store_shared(key, entry)
+            with self._lock:
+                self._counters['background_builds' if background else 'builds'] += 1
+            logger.info(f"🏋️ Workout plan cached for {key} in {time.monotonic() - started:.1f}s")
+            return plan
+
+    # -------------------------------------------------------------------------
+    # Background warming
+    # -------------------------------------------------------------------------
+
+    def ensure_warmer(self):
+        """Start this process's warm thread (again after fork)"""
+        if not self.enabled:
+            return
+        pid = os.getpid()
+        if self._warmer_pid == pid and self._warmer.is_alive():
+            return
+        with self._lock:
+            if self._warmer_pid == pid and self._warmer.is_alive():
+                return
+            self._warmer = threading.Thread(target=self._warm_loop, name='workout-warmer', daemon=True)
+            self._warmer_pid = pid
+            self._warmer.start()
+
+    def _due(self):
+        """Buckets that are missing or past their refresh point, most wanted first"""
+        now = time.time()
+        with self._lock:
+            wanted = list(self._refresh)
+            wanted += [key for key, _ in self._popularity.most_common(self.warm_top)]
+            wanted += list(self.warm)
+        due = []
+        for key in wanted:
+            if key in due:
+                continue
+            entry = self._latest(key)
+            if entry is None or now - entry[0] >= self.ttl_seconds * self.refresh_at:
+                due.append(key)
+        return due
+
+    def _warm_pass(self):
+        """Build due buckets unless another worker on the host is already warming"""
+        lock_file = None
+        if self.path and fcntl is not None:
+            try:
+                lock_file = open(self.path + '.warm.lock', 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if lock_file is not None:
+                    lock_file.close()
+                self._count('warm_passes_skipped')
+                return
+        try:
+            self._count('warm_passes')
+            for key in self._due():
+                self._build(key, background=True)
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _warm_loop(self):
+        while True:
+            self._warm_pass()
+            # Drop plans nobody refreshed; they'd only be served past their TTL
+            now = time.time()
+            with self._lock:
+                for key in [k for k, (built_at, _) in self._entries.items()
+                            if now - built_at >= self.ttl_seconds]:
+                    del self._entries[key]
+            self._wake.wait(self.warm_interval)
+            self._wake.clear()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            current = self._entries.get(key)
+            if current is None or entry[0] >= current[0]:
+                self._entries[key] = entry
+                self._refresh.discard(key)
+        return entry
+
+    def _latest(self, key):
+        """Newest of this worker's entry and the shared one"""
+        with self._lock:
+            entry = self._entries.get(key)
+        shared = self._load_shared(key)
+        if shared is not None and (entry is None or shared[0] > entry[0]):
+            return shared
+        return entry
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    # -------------------------------------------------------------------------
+    # Shared SQLite tier
+    # -------------------------------------------------------------------------
+
+    def _load_shared(self, key):
+        if not self.path:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT built_at, plan FROM workout_plans WHERE bucket = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Shared workout cache read failed: {e}")
+            return None
+        if row is None or time.time() - row[0] >= self.ttl_seconds:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _store_shared(self, key, entry):
+        if not self.path:
+            return
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO workout_plans (bucket, built_at, plan) VALUES (?, ?, ?)",
+                (key, entry[0], json.dumps(entry[1]))
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"⚠️  Shared workout cache write failed: {e}")
+
+    def _connection(self):
+        """One autocommit SQLite connection per thread (and per process after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_sqlite(self):
+        try:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS workout_plans ("
+                " bucket TEXT PRIMARY KEY,"
+                " built_at REAL NOT NULL,"
+                " plan TEXT NOT NULL)"
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️  Shared workout cache disabled: {e}")
+            self.path = None
+
+
+def cache_from_env(builder):
+    """Build the plan cache from WORKOUT_CACHE_* environment variables"""
+    warm = os.getenv('WORKOUT_CACHE_WARM')
+    return WorkoutPlanCache(
+        builder,
+        path=os.getenv('WORKOUT_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'codecalm-workout-plans.sqlite3')),
+        ttl_seconds=int(os.getenv('WORKOUT_CACHE_TTL_SECONDS', '21600')),
+        refresh_at=float(os.getenv('WORKOUT_CACHE_REFRESH_AT', '0.8')),
+        warm=tuple(k.strip().lower() for k in warm.split(';') if k.strip()) if warm is not None else DEFAULT_WARM,
+        warm_top=int(os.getenv('WORKOUT_CACHE_WARM_TOP', '6')),
+        warm_interval=float(os.getenv('WORKOUT_CACHE_WARM_INTERVAL', '60')),
+        enabled=os.getenv('WORKOUT_CACHE_ENABLED', 'true').lower() != 'false'
+    )
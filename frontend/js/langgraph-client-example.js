@@ -76,6 +76,75 @@ class LangGraphAgentClient {
     }
   }
 
+  /**
+   * Send message and receive the reply as it is generated (Server-Sent Events)
+   * @param {string} message - User's message
+   * @param {function} onToken - Called with each text chunk of the raw reply
+   * @param {function} onNode - Called with {node, status, agent} as graph nodes finish
+   * @returns {Promise<object>} - Final response; its message (with empathy and
+   *   emoji formatting) should replace the streamed text
+   */
+  async chatStream(message, onToken = () => {}, onNode = () => {}) {
+    const headers = { "Content-Type": "application/json" };
+    if (this.sessionToken) {
+      headers["Authorization"] = `Bearer ${this.sessionToken}`;
+    }
+
+    try {
+      const response = await fetch(`${this.apiUrl}/api/agent/chat`, {
+        method: "POST",
+        headers: headers,
+        body: JSON.stringify({
+          message: message,
+          agent_type: this.agentType,
+          conversation_id: this.conversationId,
+          stream: true,
+        }),
+      });
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let final = null;
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          const event = (block.match(/^event: (.*)$/m) || [])[1];
+          const data = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || "{}");
+
+          if (event === "token") onToken(data.token);
+          else if (event === "node") onNode(data);
+          else if (event === "done") final = data;
+        }
+      }
+
+      if (!final || !final.success) {
+        throw new Error((final && final.error) || "Stream ended without a reply");
+      }
+      this.conversationId = final.conversation_id;
+      return {
+        success: true,
+        message: final.response,
+        metadata: final.metadata,
+        conversationId: final.conversation_id,
+      };
+    } catch (error) {
+      console.error("LangGraph Agent Stream Error:", error);
+      return {
+        success: false,
+        message: "I'm here for you! Let's try that again. 💙",
+        error: error.message,
+      };
+    }
+  }
+
   /**
    * Start a new conversation
    */
@@ -696,6 +696,19 @@ const API_BASE_URL =
     : window.location.origin;
 
 let conversationStarted = false;
+let conversationId = null; // Saved conversation (logged-in users only)
+
+// Logged-in users get their messages (with token counts) saved server-side
+function authHeaders() {
+  const headers = { "Content-Type": "application/json" };
+  const sessionToken =
+    localStorage.getItem("codecalm_session_token") ||
+    localStorage.getItem("session_token");
+  if (sessionToken) {
+    headers["Authorization"] = `Bearer ${sessionToken}`;
+  }
+  return headers;
+}
 
 // Initialize conversation with backend
 async function initConversation() {
@@ -735,14 +748,18 @@ async function getBotResponse(userMessage) {
     // Call backend API for AI response
     const response = await fetch(`${API_BASE_URL}/api/parent/respond`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: authHeaders(),
       body: JSON.stringify({
         message: userMessage,
         enable_voice: false,
+        conversation_id: conversationId,
       }),
     });
 
     const data = await response.json();
+    if (data.conversation_id) {
+      conversationId = data.conversation_id;
+    }
     hideTyping();
 
     if (data.success && data.response) {
@@ -392,22 +392,14 @@ class WeatherFoodBot {
         window.location.hostname === "localhost"
           ? "http://localhost:5000"
           : window.location.origin;
-      const response = await fetch(`${API_BASE}/api/weather-food/recommend`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          diet_type: this.userPreferences.dietType,
-          goal: this.userPreferences.fitnessGoal,
-          restrictions: this.userPreferences.restrictions.join(", ") || "none",
-          city: this.userPreferences.location,
-          weather_data: this.weatherData,
-        }),
+      const data = await this.runJob(API_BASE, "/api/weather-food/recommend", {
+        diet_type: this.userPreferences.dietType,
+        goal: this.userPreferences.fitnessGoal,
+        restrictions: this.userPreferences.restrictions.join(", ") || "none",
+        city: this.userPreferences.location,
+        weather_data: this.weatherData,
       });
 
-      const data = await response.json();
-
       if (data.error || !data.success) {
         throw new Error(data.error || "Failed to generate recommendations");
       }
@@ -540,6 +532,37 @@ class WeatherFoodBot {
     });
   }
 
+  // Long generations run as background jobs so they don't hold a server
+  // worker; poll the job until it finishes and return its result body.
+  async runJob(apiBase, path, body) {
+    const response = await fetch(`${apiBase}${path}`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({ ...body, async: true }),
+    });
+    const submitted = await response.json();
+    if (response.status !== 202) {
+      return submitted;
+    }
+
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 1500));
+      const poll = await fetch(`${apiBase}${submitted.status_url}`);
+      const { job } = await poll.json();
+      if (!job) {
+        throw new Error("Job not found");
+      }
+      if (job.status === "done") {
+        return job.result;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Job failed");
+      }
+    }
+  }
+
   async getMealPlan() {
     const modal = document.getElementById("meal-plan-modal");
     const loading = document.querySelector(".meal-plan-loading");
@@ -566,23 +589,15 @@ class WeatherFoodBot {
         window.location.hostname === "localhost"
           ? "http://localhost:5000"
           : window.location.origin;
-      const response = await fetch(`${API_BASE}/api/weather-food/meal-plan`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          diet_type: this.userPreferences.dietType,
-          goal: this.userPreferences.fitnessGoal,
-          city: this.userPreferences.location,
-          restrictions: this.userPreferences.restrictions.join(", ") || "none",
-          weather_data: this.weatherData,
-          current_recommendations: this.recommendations?.recommendations || "",
-        }),
+      const data = await this.runJob(API_BASE, "/api/weather-food/meal-plan", {
+        diet_type: this.userPreferences.dietType,
+        goal: this.userPreferences.fitnessGoal,
+        city: this.userPreferences.location,
+        restrictions: this.userPreferences.restrictions.join(", ") || "none",
+        weather_data: this.weatherData,
+        current_recommendations: this.recommendations?.recommendations || "",
       });
 
-      const data = await response.json();
-
       if (data.error) {
         throw new Error(data.error);
       }